@@ -0,0 +1,158 @@
+"""Measure /chat with and without outbound chunk coalescing.
+
+The mock backend runs in a subprocess and streams timestamped tokens fast;
+the chat server and a client that stands in for the webview run in this
+process. The client spends --render-cost seconds per event, like a webview
+re-rendering the message. Reported per mode:
+- socket send/recv calls of this process (each one syscall)
+- CPU seconds of this process (server plus client parsing)
+- events received, and token latency from upstream send to client render
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from aiohttp import web
+import python_server
+
+SOCKET_CALLS = {"send": 0, "recv": 0}
+
+def count_socket_calls():
+    """Count the send/recv syscalls asyncio transports make through socket.socket"""
+    for name, kind in (("send", "send"), ("sendmsg", "send"), ("recv", "recv"), ("recv_into", "recv")):
+        original = getattr(socket.socket, name)
+
+        def counted(self, *args, _original=original, _kind=kind):
+            SOCKET_CALLS[_kind] += 1
+            return _original(self, *args)
+
+        setattr(socket.socket, name, counted)
+
+def start_mock(tokens: int, token_delay: float):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'mock_openai_server.py'), '--port', '0',
+         '--tokens', str(tokens), '--token-delay', str(token_delay), '--stamp'],
+        stdout=subprocess.PIPE, text=True
+    )
+    base_url = re.search(r'(http://\S+)', process.stdout.readline()).group(1)
+    return process, base_url
+
+async def start_chat_server(base_url: str):
+    settings_json = json.dumps({
+        "pydanticAgent.llm.apiKey": "bench",
+        "pydanticAgent.llm.baseUrl": base_url,
+        "pydanticAgent.llm.model": "mock",
+        "pydanticAgent.cache.enabled": False
+    })
+    await python_server.initialize_llm_agent(settings_json)
+    runner = web.AppRunner(python_server.create_app(), handler_cancellation=True)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+async def chat(session: aiohttp.ClientSession, port: int, message: str, render_cost: float):
+    """Stream one answer; return (events, per-token latencies)"""
+    events = 0
+    latencies = []
+    async with session.post(f"http://127.0.0.1:{port}/chat", json={"message": message, "sessionId": message}) as resp:
+        async for line in resp.content:
+            if not line.startswith(b"data: "):
+                continue
+            data = json.loads(line[6:])
+            if data.get("type") != "chunk":
+                continue
+            events += 1
+            if render_cost:
+                await asyncio.sleep(render_cost)
+            rendered = time.time()
+            latencies.extend(rendered - float(stamp) for stamp in data["content"].split())
+    return events, latencies
+
+async def run_mode(port: int, window: float, runs: int, render_cost: float) -> dict:
+    python_server.stream_coalesce_window = window
+    before_calls, before_cpu = dict(SOCKET_CALLS), time.process_time()
+    events, latencies = 0, []
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        for run in range(runs):
+            run_events, run_latencies = await chat(session, port, f"{window}-{run}", render_cost)
+            events += run_events
+            latencies.extend(run_latencies)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - before_cpu
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "window_ms": window * 1000,
+        "tokens": len(latencies),
+        "events": events,
+        "send_syscalls": SOCKET_CALLS["send"] - before_calls["send"],
+        "recv_syscalls": SOCKET_CALLS["recv"] - before_calls["recv"],
+        "cpu_seconds": round(cpu, 3),
+        "wall_seconds": round(elapsed, 3),
+        "latency_ms": {
+            "p50": round(quantiles[49] * 1000, 2),
+            "p95": round(quantiles[94] * 1000, 2),
+            "p99": round(quantiles[98] * 1000, 2),
+            "max": round(max(latencies) * 1000, 2)
+        }
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=2000)
+    parser.add_argument('--token-delay', type=float, default=0.0005, help="Seconds between upstream tokens")
+    parser.add_argument('--window-ms', type=float, default=20.0)
+    parser.add_argument('--render-cost', type=float, default=0.002, help="Client seconds per event")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    count_socket_calls()
+
+    mock, base_url = start_mock(args.tokens, args.token_delay)
+    runner = None
+    try:
+        runner, port = await start_chat_server(base_url)
+        without = await run_mode(port, 0.0, args.runs, args.render_cost)
+        with_coalescing = await run_mode(port, args.window_ms / 1000, args.runs, args.render_cost)
+    finally:
+        if runner:
+            await runner.cleanup()
+        mock.terminate()
+        mock.wait()
+
+    results = {"without": without, "with": with_coalescing}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'':>24}{'without':>12}{'with':>12}")
+        for label, key in (("events", "events"), ("send syscalls", "send_syscalls"),
+                           ("recv syscalls", "recv_syscalls"), ("CPU seconds", "cpu_seconds"),
+                           ("wall seconds", "wall_seconds")):
+            print(f"{label:>24}{str(without[key]):>12}{str(with_coalescing[key]):>12}")
+        for quantile in ("p50", "p95", "p99", "max"):
+            print(f"{'latency ' + quantile + ' (ms)':>24}{without['latency_ms'][quantile]:>12}"
+                  f"{with_coalescing['latency_ms'][quantile]:>12}")
+
+    if with_coalescing["events"] >= without["events"]:
+        print("FAIL: coalescing did not reduce the number of events")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    asyncio.run(main())
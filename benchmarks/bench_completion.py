@@ -0,0 +1,317 @@
+"""Inline completion latency through the chat server's /complete endpoint.
+
+Starts the mock backend and src/python_server.py as subprocesses. The mock
+answers every request with a long multi-line answer, as a chat model would,
+but honours max_tokens and stop sequences. Measures:
+- chat-style: the same prompt sent as an ordinary request without
+  max_tokens or stop sequences, the time to the whole answer
+- http / websocket: one completion at a time, cursor inside a line and at
+  the end of one, p50/p95/p99 from request to answer
+- typing: --bursts bursts of --burst keystrokes, --keystroke-interval apart;
+  each keystroke syncs the change and asks for a completion. Latency runs
+  from the last keystroke of a burst to its completion
+- type-through: after one completion, the user types it character by
+  character; each keystroke is answered from the completion cache. Measured
+  over HTTP and as the in-process lookup alone
+Checks that every request a newer keystroke superseded was answered as such,
+that each burst cost at most one upstream request, that type-through
+requests cost none and returned the rest of the completion, and that an
+edit that does not match it goes to the model again, and that answers
+which close the brackets the code after the cursor closes are trimmed while
+complete ones such as `len(x)` in `print(|)` are kept.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import start_mock, start_server
+from bench_transport import CLIENT_HEADER, MuxClient
+from pydantic_agent.completion_agent import CompletionAgent, CompletionRequest, clean_completion
+from pydantic_agent.completion_cache import CompletionCache
+from pydantic_agent.connection_pool import get_pool
+from pydantic_agent.llm_integration import LLMClient, LLMConfig
+
+URI = "file:///bench_completion.py"
+SOURCE = "".join(f"def function_{number}(value):\n    return value + {number}\n\n" for number in range(200))
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def summarise(latencies: List[float], scale: float = 1000, unit: str = "ms") -> Dict[str, float]:
+    return {f"{name}_{unit}": round(percentile(latencies, q) * scale, 1)
+            for name, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+
+def cursor(number: int) -> List[int]:
+    """Alternately inside a `return` line and at the end of a `def` line"""
+    line = (number % 200) * 3
+    return [line + 1, 11] if number % 2 else [line, len(f"def function_{number % 200}(value):")]
+
+def complete_body(number: int, version: int) -> dict:
+    return {"context": {"uri": URI, "version": version, "fileName": "bench_completion.py", "language": "python",
+                        "cursorPosition": cursor(number)}, "requestId": f"completion-{number}"}
+
+async def upstream_requests(session: aiohttp.ClientSession, url: str) -> float:
+    async with session.get(f"{url}/metrics") as response:
+        text = await response.text()
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+               if line.startswith("pydantic_agent_upstream_requests_total"))
+
+async def measure_chat_style(base_url: str, count: int) -> Dict[str, float]:
+    """The completion prompt as an ordinary request: no max_tokens, no stop sequences"""
+    client = LLMClient(LLMConfig(base_url=base_url, api_key="bench", model="mock"), coalesce=False)
+    prompt = CompletionAgent(llm_client=client)
+    latencies = []
+    for number in range(count):
+        line, character = cursor(number)
+        messages, _, _ = prompt.build_messages(CompletionRequest(
+            file_path="bench_completion.py", content=SOURCE, language="python", cursor_position=(line, character)))
+        started = time.perf_counter()
+        await client.complete(messages)
+        latencies.append(time.perf_counter() - started)
+    await client.cleanup()
+    return summarise(latencies)
+
+async def measure_http(session: aiohttp.ClientSession, url: str, count: int, failures: List[str]) -> Dict[str, float]:
+    latencies = []
+    for number in range(count):
+        started = time.perf_counter()
+        async with session.post(f"{url}/complete", json=complete_body(number, 1)) as response:
+            result = await response.json()
+        latencies.append(time.perf_counter() - started)
+        if response.status != 200 or not result.get("completion"):
+            failures.append(f"http completion {number}: {response.status} {result}")
+            break
+    return summarise(latencies)
+
+async def measure_mux(session: aiohttp.ClientSession, ws_url: str, count: int, failures: List[str]) -> Dict[str, float]:
+    client = MuxClient(await session.ws_connect(ws_url, headers={CLIENT_HEADER: "bench-completion-ws"}))
+    latencies = []
+    try:
+        for number in range(count):
+            started = time.perf_counter()
+            end = await client.request("complete", complete_body(number, 1))
+            latencies.append(time.perf_counter() - started)
+            if end["status"] != 200 or not end.get("data", {}).get("completion"):
+                failures.append(f"websocket completion {number}: {end}")
+                break
+    finally:
+        await client.close()
+    return summarise(latencies)
+
+async def measure_typing(session: aiohttp.ClientSession, url: str, args, failures: List[str]) -> Dict[str, Any]:
+    """Keystrokes faster than the debounce: only the last of each burst should reach the model"""
+    version = 1
+    latencies = []
+    superseded = 0
+    upstream_before = await upstream_requests(session, url)
+
+    async def keystroke(number: int, version: int) -> dict:
+        async with session.post(f"{url}/complete", json=complete_body(number, version)) as response:
+            return await response.json()
+
+    for burst in range(args.bursts):
+        requests = []
+        line = (burst % 200) * 3 + 1
+        for key in range(args.burst):
+            version += 1
+            change = {"textDocument": {"uri": URI, "version": version},
+                      "contentChanges": [{"range": {"start": {"line": line, "character": 4},
+                                                    "end": {"line": line, "character": 4}}, "text": "x"}]}
+            async with session.post(f"{url}/document/didChange", json=change) as response:
+                await response.read()
+            last_keystroke = time.perf_counter()
+            requests.append(asyncio.create_task(keystroke(burst * 2 + 1, version)))
+            if key < args.burst - 1:
+                await asyncio.sleep(args.keystroke_interval)
+        results = await asyncio.gather(*requests)
+        latencies.append(time.perf_counter() - last_keystroke)
+        superseded += sum(1 for result in results[:-1] if result.get("superseded"))
+        if not results[-1].get("completion"):
+            failures.append(f"typing burst {burst}: the last keystroke got no completion: {results[-1]}")
+    upstream = await upstream_requests(session, url) - upstream_before
+    if superseded != args.bursts * (args.burst - 1):
+        failures.append(f"typing: {superseded} of {args.bursts * (args.burst - 1)} stale requests were superseded")
+    if upstream > args.bursts:
+        failures.append(f"typing: {upstream:.0f} upstream requests for {args.bursts} bursts")
+    return {**summarise(latencies), "keystrokes": args.bursts * args.burst, "superseded": superseded,
+            "upstream_requests": int(upstream)}
+
+def typed_position(line: int, character: int, text: str) -> List[int]:
+    """The cursor after typing text at (line, character)"""
+    if '\n' not in text:
+        return [line, character + len(text)]
+    return [line + text.count('\n'), len(text) - text.rfind('\n') - 1]
+
+async def measure_type_through(session: aiohttp.ClientSession, url: str, failures: List[str]) -> Dict[str, Any]:
+    """Type a completion character by character; the cache answers each keystroke"""
+    number = 7  # At the end of a def line, so the completion spans lines
+    version = 1000
+    document = {"uri": URI, "languageId": "python", "version": version, "text": SOURCE}
+    async with session.post(f"{url}/document/didOpen", json={"textDocument": document}) as response:
+        await response.read()
+    async with session.post(f"{url}/complete", json=complete_body(number, version)) as response:
+        completion = (await response.json()).get("completion") or ""
+    upstream_before = await upstream_requests(session, url)
+    line, character = cursor(number)
+    latencies = []
+    for typed in range(len(completion) - 1):
+        version += 1
+        position = typed_position(line, character, completion[:typed])
+        change = {"textDocument": {"uri": URI, "version": version},
+                  "contentChanges": [{"range": {"start": {"line": position[0], "character": position[1]},
+                                                "end": {"line": position[0], "character": position[1]}},
+                                      "text": completion[typed]}]}
+        async with session.post(f"{url}/document/didChange", json=change) as response:
+            await response.read()
+        body = complete_body(number, version)
+        body["context"]["cursorPosition"] = typed_position(line, character, completion[:typed + 1])
+        started = time.perf_counter()
+        async with session.post(f"{url}/complete", json=body) as response:
+            result = await response.json()
+        latencies.append(time.perf_counter() - started)
+        if result.get("completion") != completion[typed + 1:]:
+            failures.append(f"type-through: after {typed + 1} characters got {result}")
+            break
+    if await upstream_requests(session, url) != upstream_before:
+        failures.append("type-through: typing through a completion asked the model again")
+
+    # Something else typed over the rest: back to the model
+    version += 1
+    position = typed_position(line, character, completion[:-1])
+    change = {"textDocument": {"uri": URI, "version": version},
+              "contentChanges": [{"range": {"start": {"line": position[0], "character": position[1]},
+                                            "end": {"line": position[0], "character": position[1]}}, "text": "#"}]}
+    async with session.post(f"{url}/document/didChange", json=change) as response:
+        await response.read()
+    body = complete_body(number, version)
+    body["context"]["cursorPosition"] = [position[0], position[1] + 1]
+    async with session.post(f"{url}/complete", json=body) as response:
+        await response.read()
+    if await upstream_requests(session, url) != upstream_before + 1:
+        failures.append("type-through: a non-matching edit was answered from the cache")
+    return {**summarise(latencies), "keystrokes": len(latencies)}
+
+def measure_cache_lookup(count: int) -> Dict[str, float]:
+    """CompletionCache.lookup alone while typing through a completion, in microseconds"""
+    cache = CompletionCache()
+    completion = "tok tok tok tok\n    tok tok tok tok\n    tok tok tok"
+    line, character = cursor(7)
+    offset = len("".join(SOURCE.split('\n', line)[:line])) + line + character
+    cache.store(URI, SOURCE, offset, line, character, completion)
+    texts = [(SOURCE[:offset] + completion[:typed] + SOURCE[offset:], typed_position(line, character, completion[:typed]))
+             for typed in range(len(completion))]
+    latencies = []
+    for repeat in range(count):
+        text, position = texts[repeat % len(texts)]
+        started = time.perf_counter()
+        cache.lookup(URI, text, *position)
+        latencies.append(time.perf_counter() - started)
+    return summarise(latencies, 1e6, "us")
+
+# (model answer, code after the cursor, expected insertion)
+CLEANING_CASES = [
+    ("len(x)", ")", "len(x)"),  # print(|): complete, the suffix closes print(
+    ("len(x))", ")", "len(x)"),  # print(|): closes print( a second time
+    ("a, b)", ")", "a, b"),  # f(|): closes f( as the suffix does
+    ("[1, 2]", "]", "[1, 2]"),  # data[|]: complete
+    ("value + 1", " + 1", "value + 1"),  # Nothing shows a repeat
+]
+
+def check_cleaning(failures: List[str]) -> None:
+    for answer, suffix, expected in CLEANING_CASES:
+        cleaned = clean_completion(answer, suffix, ["\n"])
+        if cleaned != expected:
+            failures.append(f"cleaning {answer!r} before {suffix!r} gave {cleaned!r}, not {expected!r}")
+
+async def run(args) -> dict:
+    mock, base_url = start_mock(argparse.Namespace(
+        tokens=args.tokens, token_delay=args.token_delay, first_token_delay=args.first_token_delay,
+        first_token_jitter=0.0, backend_concurrency=None, fail_status=None, fail_rate=0.0,
+        line_tokens=args.line_tokens))
+    server = None
+    failures: List[str] = []
+    check_cleaning(failures)
+    try:
+        results = {"chat-style": await measure_chat_style(base_url, args.requests)}
+        with tempfile.TemporaryDirectory() as port_dir:
+            server, port = start_server(base_url, port_dir, settings={
+                "pydanticAgent.completion.debounceMs": args.debounce_ms})
+            url = f"http://localhost:{port}"
+            async with aiohttp.ClientSession(headers={CLIENT_HEADER: "bench-completion"}) as session:
+                # Wait for the agent so the first measurement does not include start-up
+                for _ in range(300):
+                    async with session.get(f"{url}/ready") as response:
+                        if (await response.json()).get("agent"):
+                            break
+                    await asyncio.sleep(0.05)
+                for client in ("bench-completion", "bench-completion-ws"):
+                    await session.post(f"{url}/document/didOpen", headers={CLIENT_HEADER: client}, json={
+                        "textDocument": {"uri": URI, "languageId": "python", "version": 1, "text": SOURCE}})
+                results["http"] = await measure_http(session, url, args.requests, failures)
+                results["websocket"] = await measure_mux(session, f"ws://localhost:{port}/ws", args.requests, failures)
+                results["typing"] = await measure_typing(session, url, args, failures)
+                results["type-through"] = await measure_type_through(session, url, failures)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        mock.terminate()
+        mock.wait()
+        await get_pool().close()
+    if results.get("http", {}).get("p95_ms", math.inf) >= results["chat-style"]["p95_ms"]:
+        failures.append("completions were not faster than chat-style requests")
+    results["cache lookup"] = measure_cache_lookup(args.lookups)
+    return {"results": results, "failures": failures}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help="Completions per measurement")
+    parser.add_argument('--bursts', type=int, default=20, help="Typing bursts")
+    parser.add_argument('--burst', type=int, default=5, help="Keystrokes per burst")
+    parser.add_argument('--keystroke-interval', type=float, default=0.02, help="Seconds between keystrokes")
+    parser.add_argument('--debounce-ms', type=float, default=50)
+    parser.add_argument('--lookups', type=int, default=100000, help="Completion cache lookups timed")
+    parser.add_argument('--tokens', type=int, default=200, help="Tokens of the mock's full answer")
+    parser.add_argument('--line-tokens', type=int, default=8, help="Tokens per line of the mock's answer")
+    parser.add_argument('--token-delay', type=float, default=0.005, help="Seconds between upstream tokens")
+    parser.add_argument('--first-token-delay', type=float, default=0.05)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    outcome = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(outcome, indent=2))
+    else:
+        for name, result in outcome["results"].items():
+            unit = "us" if "p50_us" in result else "ms"
+            line = (f"{name:<14} p50 {result[f'p50_{unit}']:>8} {unit}  p95 {result[f'p95_{unit}']:>8} {unit}  "
+                    f"p99 {result[f'p99_{unit}']:>8} {unit}")
+            if "superseded" in result:
+                line += (f"  {result['keystrokes']} keystrokes, {result['superseded']} superseded, "
+                         f"{result['upstream_requests']} upstream requests")
+            elif "keystrokes" in result:
+                line += f"  {result['keystrokes']} keystrokes"
+            print(line)
+    if outcome["failures"]:
+        print("FAIL: " + "; ".join(outcome["failures"]))
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
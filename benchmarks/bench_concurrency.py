@@ -0,0 +1,77 @@
+"""Check that parallel /chat streams interleave on one event loop.
+
+Runs the python_server app in-process against the local mock backend and
+compares the wall time of N parallel chats with the time of a single one.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from mock_openai_server import MockOpenAIServer
+import python_server
+
+async def start_chat_server(mock: MockOpenAIServer):
+    """Start the chat server on a free port, pointed at the mock backend"""
+    settings_json = f'{{"pydanticAgent.llm.apiKey": "bench", "pydanticAgent.llm.baseUrl": "{mock.base_url}", "pydanticAgent.llm.model": "mock"}}'
+    await python_server.initialize_llm_agent(settings_json)
+    runner = web.AppRunner(python_server.create_app(), handler_cancellation=True)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+async def chat(session: aiohttp.ClientSession, port: int, message: str, session_id: str) -> int:
+    """Send one chat and return the number of SSE events received"""
+    events = 0
+    payload = {"message": message, "sessionId": session_id}
+    async with session.post(f"http://127.0.0.1:{port}/chat", json=payload) as resp:
+        async for line in resp.content:
+            if line.startswith(b"data: "):
+                events += 1
+    return events
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--streams', type=int, default=20)
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    mock = await MockOpenAIServer(tokens=args.tokens, token_delay=args.token_delay).start()
+    runner, port = await start_chat_server(mock)
+    try:
+        async with aiohttp.ClientSession() as session:
+            single = await timed(chat(session, port, "hello", "single"))
+            parallel = await timed(asyncio.gather(*[
+                chat(session, port, f"hello {i}", f"bench-{i}") for i in range(args.streams)
+            ]))
+        ratio = parallel / single
+        print(f"single stream:        {single:.3f}s")
+        print(f"{args.streams} parallel streams: {parallel:.3f}s ({ratio:.2f}x single)")
+        if ratio > 2.0:
+            print("FAIL: parallel streams did not interleave")
+            sys.exit(1)
+        print("OK: parallel streams interleave on one event loop")
+    finally:
+        await python_server.cleanup()
+        await runner.cleanup()
+        await mock.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
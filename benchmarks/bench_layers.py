@@ -0,0 +1,202 @@
+"""Microbenchmarks of the pydantic_agent library layers.
+
+Each case reports time per operation (best of --repeat runs, with the
+number of operations per run calibrated to about --min-time seconds) and
+the peak memory allocated by one operation (tracemalloc). Stream cases also
+report the cost per token. Cases:
+- process_stream: LLMClient._process_stream over a recorded SSE payload
+  (synthetic, or --sse-file with a capture of a real stream)
+- stream_generate: LLMAgent.stream_generate on top of an in-memory stream,
+  as overhead per token over consuming that stream directly
+- process_action: BaseAgent.process_action dispatch to a no-op handler
+- code_context/message/chat_response: model construction and validation at
+  small, typical and large file sizes
+--save writes the results as a baseline; --baseline prints the ratio to one.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_sse import FakeResponse, make_stream, split
+from pydantic_agent.base import AgentAction, AgentCapability, BaseAgent, CodeContext
+from pydantic_agent.llm_agent import LLMAgent
+from pydantic_agent.llm_integration import ChatResponse, LLMClient, LLMConfig, Message, StreamChunk
+
+FILE_SIZES = {"1KB": 1024, "50KB": 50 * 1024, "500KB": 500 * 1024}
+
+def source_text(size: int) -> str:
+    line = "    result = compute_value(item, options=options)  # typical line\n"
+    return (line * (size // len(line) + 1))[:size]
+
+class Case:
+    """One benchmark: `run` performs one operation; `units` per operation (e.g. tokens)"""
+
+    def __init__(self, name: str, run: Callable[[], None], units: int = 1, unit: str = "op"):
+        self.name = name
+        self.run = run
+        self.units = units
+        self.unit = unit
+
+def measure(case: Case, repeat: int, min_time: float) -> Dict[str, float]:
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            case.run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or number >= 1 << 20:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            case.run()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    case.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_op = best / number
+    result = {"us_per_op": per_op * 1e6, "peak_alloc_bytes": peak - before}
+    if case.units > 1:
+        result[f"us_per_{case.unit}"] = per_op * 1e6 / case.units
+    return result
+
+def in_loop(make_coroutine) -> Callable[[], None]:
+    """Run a coroutine per operation on one long-lived event loop"""
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(make_coroutine())
+
+def stream_cases(payload: bytes, tokens: int) -> List[Case]:
+    client = LLMClient(LLMConfig(base_url="http://127.0.0.1:1/v1", api_key="bench"))
+    pieces = split(payload, 200, 4000)
+
+    async def process_stream():
+        async for _ in client._process_stream(FakeResponse(pieces)):
+            pass
+
+    agent = LLMAgent(name="bench", llm_config=client.config, capabilities=[AgentCapability.CODE_COMPLETION])
+    agent.update_context(CodeContext(file_path="bench.py", content=source_text(1024), language="python"))
+    chunks = [StreamChunk("tok ") for _ in range(tokens)]
+
+    async def replay(messages, config=None, cache_context=None):
+        for chunk in chunks:
+            yield chunk
+
+    agent.llm_client.stream_complete = replay
+
+    async def raw_stream():
+        async for _ in replay([]):
+            pass
+
+    async def stream_generate():
+        async for _ in agent.stream_generate({"prompt": "bench"}):
+            pass
+
+    return [
+        Case("process_stream", in_loop(process_stream), tokens, "token"),
+        Case("stream_generate.raw", in_loop(raw_stream), tokens, "token"),
+        Case("stream_generate", in_loop(stream_generate), tokens, "token")
+    ]
+
+def dispatch_cases() -> List[Case]:
+    agent = BaseAgent(name="bench", capabilities=[AgentCapability.CODE_COMPLETION])
+
+    async def noop(parameters):
+        return {}
+
+    agent.register_handler("noop", noop)
+    action = AgentAction(action_type="noop", parameters={"prompt": "bench"})
+
+    async def process_action():
+        await agent.process_action(action)
+
+    async def process_new_action():
+        await agent.process_action(AgentAction(action_type="noop", parameters={"prompt": "bench"}))
+
+    return [
+        Case("process_action", in_loop(process_action)),
+        Case("process_action+AgentAction", in_loop(process_new_action))
+    ]
+
+def model_cases() -> List[Case]:
+    cases = []
+    for label, size in FILE_SIZES.items():
+        content = source_text(size)
+        cases.append(Case(f"code_context.{label}", lambda content=content: CodeContext(
+            file_path="src/module.py", content=content, language="python",
+            cursor_position=(120, 4), selected_text=content[:200]
+        )))
+        cases.append(Case(f"message.{label}", lambda content=content: Message(role="user", content=content)))
+    cases.append(Case("chat_response.token", lambda: ChatResponse(response="tok ", type="text")))
+    cases.append(Case("stream_chunk.token", lambda: StreamChunk("tok ")))
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=2000, help="Tokens in the stream cases")
+    parser.add_argument('--sse-file', help="Recorded SSE response body to parse instead of a synthetic one")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.5, help="Seconds spent per case, roughly")
+    parser.add_argument('--filter', help="Only run cases whose name contains this")
+    parser.add_argument('--save', help="Write the results to this baseline file")
+    parser.add_argument('--baseline', help="Compare against a baseline file written with --save")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    if args.sse_file:
+        with open(args.sse_file, 'rb') as f:
+            payload = f.read()
+        tokens = payload.count(b"\ndata: ") + payload.startswith(b"data: ") - payload.count(b"data: [DONE]")
+    else:
+        payload, tokens = make_stream(args.tokens), args.tokens
+
+    cases = stream_cases(payload, tokens) + dispatch_cases() + model_cases()
+    results: Dict[str, Dict[str, float]] = {}
+    for case in cases:
+        if args.filter and args.filter not in case.name:
+            continue
+        results[case.name] = measure(case, args.repeat, args.min_time)
+    if "stream_generate" in results and "stream_generate.raw" in results:
+        results["stream_generate"]["overhead_us_per_token"] = (
+            results["stream_generate"]["us_per_token"] - results["stream_generate.raw"]["us_per_token"]
+        )
+
+    baseline: Optional[dict] = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'case':<30}{'us/op':>12}{'us/token':>10}{'peak alloc':>12}{'vs baseline':>13}")
+    for name, result in results.items():
+        per_token = result.get("us_per_token")
+        ratio = ""
+        if baseline and name in baseline:
+            ratio = f"{result['us_per_op'] / baseline[name]['us_per_op']:.2f}x"
+        print(f"{name:<30}{result['us_per_op']:>12.2f}{(f'{per_token:.3f}' if per_token else ''):>10}"
+              f"{result['peak_alloc_bytes']:>12,}{ratio:>13}")
+    if "stream_generate" in results and "overhead_us_per_token" in results["stream_generate"]:
+        print(f"stream_generate overhead: {results['stream_generate']['overhead_us_per_token']:.3f} us/token")
+
+if __name__ == "__main__":
+    main()
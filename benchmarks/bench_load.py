@@ -0,0 +1,260 @@
+"""End-to-end load test of the chat server against the local mock backend.
+
+Starts benchmarks/mock_openai_server.py and src/python_server.py as
+subprocesses, then drives /chat at each concurrency level in turn. Every
+worker holds one conversation and sends its next message as soon as the
+previous answer is done. Reported per level:
+- completed requests per second and streamed tokens per second
+- time to first token and total latency percentiles, as the client sees them
+- peak and final RSS of the server process
+Use --output to save the results as JSON and --compare to check them against
+an earlier run, e.g. from the parent commit.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in 0..100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def summary_ms(values: List[float]) -> Dict[str, Optional[float]]:
+    return {f"p{q}": round(percentile(values, q) * 1000, 2) if values else None for q in (50, 95, 99)}
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def start_mock(args) -> Tuple[subprocess.Popen, str]:
+    command = [sys.executable, os.path.join(BENCH_DIR, 'mock_openai_server.py'), '--port', '0',
+               '--tokens', str(args.tokens), '--token-delay', str(args.token_delay),
+               '--first-token-delay', str(args.first_token_delay),
+               '--first-token-jitter', str(args.first_token_jitter)]
+    if args.backend_concurrency:
+        command += ['--max-concurrency', str(args.backend_concurrency)]
+    if args.fail_status:
+        command += ['--fail-status', str(args.fail_status), '--fail-rate', str(args.fail_rate)]
+    if getattr(args, 'line_tokens', None):
+        command += ['--line-tokens', str(args.line_tokens)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, re.search(r'(http://\S+)', process.stdout.readline()).group(1)
+
+def start_server(base_url: str, port_dir: str, timeout: float = 30.0, settings: Optional[dict] = None,
+                 arguments: List[str] = ()) -> Tuple[subprocess.Popen, int]:
+    """Start python_server.py with its port file in port_dir and wait for the port
+
+    `settings` are added to the VS Code settings, `arguments` to the command line.
+    """
+    env = dict(os.environ)
+    env.update({
+        "VSCODE_SETTINGS": json.dumps({
+            "pydanticAgent.llm.apiKey": "bench",
+            "pydanticAgent.llm.baseUrl": base_url,
+            "pydanticAgent.llm.model": "mock",
+            "pydanticAgent.cache.enabled": False,
+            "pydanticAgent.logging.level": "WARNING",
+            **(settings or {})
+        }),
+        # tempfile.gettempdir() honours TMPDIR, which keeps the port file apart from a real server's
+        "TMPDIR": port_dir,
+        "PYTHONPATH": os.pathsep.join([ROOT, os.path.join(ROOT, 'src')])
+    })
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'src', 'python_server.py'), *arguments], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    port_file = os.path.join(port_dir, 'pydantic_agent_port.txt')
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Chat server exited with status {process.returncode}")
+        try:
+            with open(port_file) as f:
+                return process, int(f.read().strip())
+        except (OSError, ValueError):
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Chat server did not write {port_file} within {timeout}s")
+
+async def chat(session: aiohttp.ClientSession, url: str, message: str, session_id: str) -> dict:
+    """One /chat request; time to first token, total time and tokens as the client sees them"""
+    started = time.perf_counter()
+    ttft = None
+    tokens = 0
+    error = None
+    try:
+        async with session.post(url, json={"message": message, "sessionId": session_id}) as resp:
+            if resp.status != 200:
+                return {"error": f"HTTP {resp.status}"}
+            async for line in resp.content:
+                if not line.startswith(b"data: "):
+                    continue
+                data = json.loads(line[6:])
+                if data.get("type") == "chunk":
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    tokens += len(data["content"].split())
+                elif "error" in data:
+                    error = data["error"]
+    except aiohttp.ClientError as e:
+        error = f"{type(e).__name__}: {e}"
+    return {"ttft": ttft, "total": time.perf_counter() - started, "tokens": tokens, "error": error}
+
+async def run_level(url: str, server_pid: int, concurrency: int, requests: int) -> dict:
+    """Run `requests` chats with `concurrency` workers and summarise them"""
+    results = []
+    rss_samples = []
+    pending = iter(range(requests))
+
+    async def worker(number: int):
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+            for request in pending:
+                results.append(await chat(session, url, f"load {concurrency}/{request}", f"load-{concurrency}-{number}"))
+
+    async def sample_rss():
+        while True:
+            rss = rss_bytes(server_pid)
+            if rss is not None:
+                rss_samples.append(rss)
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    final_rss = rss_bytes(server_pid)
+
+    succeeded = [result for result in results if not result.get("error") and result.get("ttft") is not None]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(succeeded) / elapsed, 2),
+        "tokens_per_sec": round(sum(result["tokens"] for result in succeeded) / elapsed, 1),
+        "ttft_ms": summary_ms([result["ttft"] for result in succeeded]),
+        "total_ms": summary_ms([result["total"] for result in succeeded]),
+        "rss_mb": {
+            "peak": round(max(rss_samples) / 2**20, 1) if rss_samples else None,
+            "end": round(final_rss / 2**20, 1) if final_rss else None
+        }
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of p95 latency and throughput beyond tolerance, per matching level"""
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in results["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        for metric in ("ttft_ms", "total_ms"):
+            old, new = before[metric]["p95"], level[metric]["p95"]
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"c={level['concurrency']} {metric} p95 {old} -> {new}")
+        old, new = before["requests_per_sec"], level["requests_per_sec"]
+        if old and new < old * (1 - tolerance):
+            regressions.append(f"c={level['concurrency']} requests/s {old} -> {new}")
+    return regressions
+
+async def run(args) -> dict:
+    mock, base_url = start_mock(args)
+    server = None
+    try:
+        with tempfile.TemporaryDirectory() as port_dir:
+            server, port = start_server(base_url, port_dir)
+            url = f"http://localhost:{port}/chat"
+            levels = []
+            for concurrency in args.concurrency:
+                level = await run_level(url, server.pid, concurrency, max(args.requests, concurrency))
+                levels.append(level)
+                if not args.json:
+                    print(f"c={concurrency:>4}  {level['requests_per_sec']:>8} req/s  "
+                          f"{level['tokens_per_sec']:>9} tok/s  "
+                          f"TTFT p50/p95/p99 {level['ttft_ms']['p50']}/{level['ttft_ms']['p95']}/{level['ttft_ms']['p99']} ms  "
+                          f"total p95 {level['total_ms']['p95']} ms  "
+                          f"RSS peak {level['rss_mb']['peak']} MB  errors {level['errors']}", flush=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        mock.terminate()
+        mock.wait()
+    return {
+        "commit": git_commit(),
+        "config": {key: getattr(args, key) for key in (
+            "tokens", "token_delay", "first_token_delay", "first_token_jitter",
+            "backend_concurrency", "fail_status", "fail_rate", "requests")},
+        "levels": levels
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=lambda value: [int(part) for part in value.split(',')],
+                        default=[1, 4, 16, 64], help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=64, help="Chats per level (at least one per worker)")
+    parser.add_argument('--tokens', type=int, default=100, help="Tokens per answer")
+    parser.add_argument('--token-delay', type=float, default=0.005, help="Seconds between upstream tokens")
+    parser.add_argument('--first-token-delay', type=float, default=0.1)
+    parser.add_argument('--first-token-jitter', type=float, default=0.05)
+    parser.add_argument('--backend-concurrency', type=int, default=None, help="Streams the mock serves at once")
+    parser.add_argument('--fail-status', type=int, default=None, help="e.g. 503 to exercise retries")
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="Results JSON of an earlier run to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if any(level["errors"] == level["requests"] for level in results["levels"]):
+        print("FAIL: a concurrency level had no successful requests")
+        sys.exit(1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("FAIL: regressions against " + args.compare)
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""BM25 retrieval benchmark: index build throughput and query latency.
+
+By default indexes a synthetic repository of --files generated source files
+(kept in memory, so disk speed does not skew the numbers). Pass --root to
+index a real directory instead. With --churn, the synthetic files are then
+rewritten that many times over, as in a long-running server, and the chunk
+table must not grow beyond what compaction allows.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic_agent.retrieval import BM25Index
+
+QUERIES = [
+    "where do we handle retries?",
+    "how is the connection pool configured",
+    "parse server sent events",
+    "cache eviction ttl",
+    "which function validates user input",
+    "timeout for the first token",
+    "load settings from environment",
+    "cancel request when the client disconnects",
+]
+
+def synthetic_file(rng: random.Random, vocab: list, functions: int = 8) -> str:
+    """Python-looking module built from a shared vocabulary"""
+    lines = [f"import {rng.choice(vocab)}", f"from {rng.choice(vocab)} import {rng.choice(vocab)}", ""]
+    for _ in range(functions):
+        name = "_".join(rng.sample(vocab, 2))
+        args = ", ".join(rng.sample(vocab, 3))
+        lines.append(f"def {name}({args}):")
+        lines.append(f'    """{" ".join(rng.sample(vocab, 6))}"""')
+        for _ in range(rng.randint(3, 8)):
+            lines.append(f"    {rng.choice(vocab)} = {rng.choice(vocab)}.{rng.choice(vocab)}({rng.choice(vocab)})")
+        lines.append(f"    return {rng.choice(vocab)}")
+        lines.append("")
+    return "\n".join(lines)
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=100_000)
+    parser.add_argument('--root', help="Index this directory instead of a synthetic repository")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--churn', type=int, default=0, help="Times every synthetic file is rewritten after the build")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.root:
+        start = time.perf_counter()
+        index = BM25Index(args.root)
+        index.update()
+        build_seconds = time.perf_counter() - start
+        total_bytes = sum(entry[1] for entry in index._files.values())
+    else:
+        rng = random.Random(42)
+        base = ["retry", "request", "response", "connection", "pool", "cache", "event", "stream", "token",
+                "timeout", "client", "server", "session", "parse", "config", "settings", "handler", "cancel",
+                "user", "input", "validate", "error", "status", "buffer", "chunk", "query", "index", "load"]
+        vocab = base + [f"name{i}" for i in range(5000)]
+        index = BM25Index()
+        total_bytes = 0
+        build_seconds = 0.0
+        for number in range(args.files):
+            text = synthetic_file(rng, vocab)
+            total_bytes += len(text)
+            # Only time the indexing, not the generation of the file
+            start = time.perf_counter()
+            index.add_text(f"/repo/pkg{number % 500}/module{number}.py", text)
+            build_seconds += time.perf_counter() - start
+        for _ in range(args.churn):
+            for number in range(args.files):
+                index.add_text(f"/repo/pkg{number % 500}/module{number}.py", synthetic_file(rng, vocab))
+
+    latencies = []
+    for number in range(args.queries):
+        query = QUERIES[number % len(QUERIES)]
+        started = time.perf_counter()
+        index.search(query, top_k=5, with_text=False)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    results = {
+        "files": index.files,
+        "chunks": index.chunks,
+        "megabytes": round(total_bytes / 1e6, 1),
+        "build_seconds": round(build_seconds, 2),
+        "files_per_second": round(index.files / build_seconds),
+        "megabytes_per_second": round(total_bytes / 1e6 / build_seconds, 2),
+        "query_ms_p50": round(statistics.median(latencies), 2),
+        "query_ms_p95": round(percentile(latencies, 95), 2),
+        "query_ms_p99": round(percentile(latencies, 99), 2),
+    }
+    # Dead chunks may make up a quarter of the table (or 1000) before compaction drops them
+    results["chunk_slots"] = len(index._chunks)
+    bounded = len(index._chunks) <= max(index.chunks * 4 // 3, index.chunks + 1000) + 1
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for key, value in results.items():
+            print(f"{key:22} {value}")
+    if not bounded:
+        print(f"FAIL: {len(index._chunks)} chunk slots for {index.chunks} live chunks")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
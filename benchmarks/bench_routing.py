@@ -0,0 +1,84 @@
+"""Check that throughput scales across backends and survives a dead one.
+
+Each mock backend serves a fixed number of streams at once. The same burst
+of requests is sent through an LLMClient configured with one backend, then
+with several, then with an extra backend that fails every request.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai_server import MockOpenAIServer
+from pydantic_agent.llm_integration import LLMClient, LLMConfig, Message
+from pydantic_agent.router import Endpoint
+from pydantic_agent.connection_pool import get_pool
+
+async def burst(mocks, requests: int, capacity: int) -> dict:
+    """Send `requests` distinct completions at once, return timing and routing stats"""
+    endpoints = [Endpoint(base_url=mock.base_url, max_concurrency=capacity) for mock in mocks]
+    client = LLMClient(LLMConfig(base_url=mocks[0].base_url, api_key="bench", model="mock", endpoints=endpoints),
+                       coalesce=False)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(client.complete([Message(role="user", content=f"request {i}")]) for i in range(requests)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    failures = sum(isinstance(result, Exception) for result in results)
+    stats = client.router.stats()
+    await client.cleanup()
+    return {"seconds": round(elapsed, 3), "failures": failures, "endpoints": stats}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backends', type=int, default=3)
+    parser.add_argument('--capacity', type=int, default=4, help="Concurrent streams per backend")
+    parser.add_argument('--requests', type=int, default=48)
+    parser.add_argument('--tokens', type=int, default=20)
+    parser.add_argument('--token-delay', type=float, default=0.01)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    mocks = [
+        await MockOpenAIServer(tokens=args.tokens, token_delay=args.token_delay, max_concurrency=args.capacity).start()
+        for _ in range(args.backends)
+    ]
+    dead = await MockOpenAIServer().start()
+    dead.fail_status = 500
+    try:
+        single = await burst(mocks[:1], args.requests, args.capacity)
+        multi = await burst(mocks, args.requests, args.capacity)
+        degraded = await burst(mocks + [dead], args.requests, args.capacity)
+    finally:
+        await get_pool().close()
+        for mock in mocks + [dead]:
+            await mock.stop()
+
+    speedup = single["seconds"] / multi["seconds"]
+    results = {"single": single, "multi": multi, "with_dead_backend": degraded, "speedup": round(speedup, 2)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"1 backend:            {single['seconds']:.3f}s")
+        print(f"{args.backends} backends:           {multi['seconds']:.3f}s ({speedup:.2f}x)")
+        print(f"{args.backends} + 1 dead backend:   {degraded['seconds']:.3f}s, {degraded['failures']} failed requests")
+        for stats in degraded["endpoints"]:
+            print(f"  {stats['base_url']}: {stats['requests']} requests, {stats['errors']} errors, ejected={stats['ejected']}")
+
+    ok = speedup >= args.backends * 0.6 and not multi["failures"] and not degraded["failures"]
+    if not ok:
+        print("FAIL: throughput did not scale with backends or requests failed")
+        sys.exit(1)
+    print("OK: load spread across backends")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+"""Interactive latency under background load, with and without the admission scheduler.
+
+The mock backend serves --capacity streams at once and queues the rest, like
+a saturated provider. --background workers keep sending background
+completions while an interactive probe is sent every --probe-interval
+seconds and its time to first token measured. Without a scheduler the probes
+queue behind the background work at the provider. With one (limit =
+capacity), they are admitted ahead of it.
+
+Also checks the scheduler on its own: sessions of one priority take turns,
+requests beyond the queue limit are rejected at once, and a queued request
+promoted to a more urgent class passes the ones it was queued behind.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai_server import MockOpenAIServer
+from pydantic_agent.connection_pool import get_pool
+from pydantic_agent.llm_integration import LLMClient, LLMConfig, Message
+from pydantic_agent.scheduler import AdmissionRejected, AdmissionScheduler, Priority, Ticket
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+async def run_load(mock: MockOpenAIServer, scheduler: Optional[AdmissionScheduler], args) -> Dict[str, float]:
+    client = LLMClient(LLMConfig(base_url=mock.base_url, api_key="bench", model="mock"),
+                       coalesce=False, scheduler=scheduler)
+    stop = asyncio.Event()
+    background_done = 0
+
+    async def background(worker: int):
+        nonlocal background_done
+        number = 0
+        while not stop.is_set():
+            number += 1
+            messages = [Message(role="user", content=f"analyze {worker}/{number}")]
+            await client.complete(messages, priority=Priority.BACKGROUND, session=f"background-{worker}")
+            background_done += 1
+
+    async def probe(number: int) -> float:
+        started = time.perf_counter()
+        stream = client.stream_complete([Message(role="user", content=f"chat {number}")], session="chat")
+        try:
+            async for _ in stream:
+                return time.perf_counter() - started
+        finally:
+            await stream.aclose()
+
+    workers = [asyncio.create_task(background(worker)) for worker in range(args.background)]
+    await asyncio.sleep(args.warmup)
+    started = time.perf_counter()
+    ttfts = []
+    for number in range(args.probes):
+        ttfts.append(await probe(number))
+        await asyncio.sleep(args.probe_interval)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    return {
+        "interactive_ttft_p50_ms": round(percentile(ttfts, 50) * 1000, 1),
+        "interactive_ttft_p95_ms": round(percentile(ttfts, 95) * 1000, 1),
+        "background_per_sec": round(background_done / elapsed, 1)
+    }
+
+async def check_scheduler() -> List[str]:
+    """Turn taking between sessions and fast rejection, without any backend"""
+    failures = []
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queued=8)
+    order = []
+
+    async def request(session: str, number: int):
+        async with scheduler.admit(Priority.INTERACTIVE, session):
+            order.append(session)
+            await asyncio.sleep(0.001)
+
+    # One session queues a burst, then another asks once: it gets the second turn, not the last
+    tasks = [asyncio.create_task(request("burst", number)) for number in range(6)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(request("other", 0)))
+    await asyncio.gather(*tasks)
+    if order.index("other") > 2:
+        failures.append(f"session fairness: the single request ran at position {order.index('other')} of {order}")
+
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queued=2)
+    holder = asyncio.create_task(request("a", 0))
+    await asyncio.sleep(0)
+    waiting = [asyncio.create_task(request("a", number)) for number in (1, 2)]
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    try:
+        async with scheduler.admit(Priority.INTERACTIVE, "a"):
+            failures.append("queue limit: a request beyond max_queued was admitted")
+    except AdmissionRejected:
+        if time.perf_counter() - started > 0.001:
+            failures.append("queue limit: rejection was not immediate")
+    await asyncio.gather(holder, *waiting)
+
+    # A background request waiting for a slot is passed by an interactive one
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queued=8)
+    order = []
+
+    async def classed(priority: Priority, name: str):
+        async with scheduler.admit(priority, name):
+            order.append(name)
+            await asyncio.sleep(0.001)
+
+    tasks = [asyncio.create_task(classed(Priority.BACKGROUND, "background-0"))]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(classed(Priority.BACKGROUND, "background-1")))
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(classed(Priority.INTERACTIVE, "interactive")))
+    await asyncio.gather(*tasks)
+    if order != ["background-0", "interactive", "background-1"]:
+        failures.append(f"priority: admitted in order {order}")
+
+    # A queued background request promoted to interactive (an interactive request joined it) goes next
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queued=8)
+    order = []
+    ticket = Ticket(Priority.BACKGROUND, "background-2")
+
+    async def ticketed():
+        async with scheduler.admit(ticket=ticket):
+            order.append("promoted")
+            await asyncio.sleep(0.001)
+
+    tasks = [asyncio.create_task(classed(Priority.BACKGROUND, "background-0"))]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(classed(Priority.COMPLETION, "completion")),
+              asyncio.create_task(classed(Priority.BACKGROUND, "background-1")),
+              asyncio.create_task(ticketed())]
+    await asyncio.sleep(0)
+    scheduler.promote(ticket, Priority.INTERACTIVE)
+    await asyncio.gather(*tasks)
+    if order != ["background-0", "promoted", "completion", "background-1"]:
+        failures.append(f"promotion: admitted in order {order}")
+    if any(scheduler.stats()[name]["active"] or scheduler.stats()[name]["queued"] for name in scheduler.stats()):
+        failures.append(f"promotion: slots left over {scheduler.stats()}")
+    return failures
+
+async def run(args) -> dict:
+    failures = await check_scheduler()
+    mock = MockOpenAIServer(tokens=args.tokens, token_delay=args.token_delay, max_concurrency=args.capacity)
+    await mock.start()
+    try:
+        results = {
+            "no scheduler": await run_load(mock, None, args),
+            "scheduler": await run_load(mock, AdmissionScheduler(max_concurrency=args.capacity), args)
+        }
+    finally:
+        await mock.stop()
+        await get_pool().close()
+    return {"results": results, "failures": failures}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--capacity', type=int, default=4, help="Streams the mock serves at once")
+    parser.add_argument('--background', type=int, default=16, help="Background workers")
+    parser.add_argument('--probes', type=int, default=30, help="Interactive requests measured")
+    parser.add_argument('--probe-interval', type=float, default=0.1)
+    parser.add_argument('--warmup', type=float, default=1.0, help="Seconds of background load before probing")
+    parser.add_argument('--tokens', type=int, default=20)
+    parser.add_argument('--token-delay', type=float, default=0.01)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    outcome = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(outcome, indent=2))
+    else:
+        for mode, result in outcome["results"].items():
+            print(f"{mode:<14} interactive TTFT p50 {result['interactive_ttft_p50_ms']:>7} ms  "
+                  f"p95 {result['interactive_ttft_p95_ms']:>7} ms  background {result['background_per_sec']:>6}/s")
+    results = outcome["results"]
+    if results["scheduler"]["interactive_ttft_p95_ms"] >= results["no scheduler"]["interactive_ttft_p95_ms"]:
+        outcome["failures"].append("the scheduler did not lower interactive p95 TTFT")
+    if outcome["failures"]:
+        print("FAIL: " + "; ".join(outcome["failures"]))
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Compare the SSE stream parser against the previous line-based one.
+
+Both parsers turn a synthetic OpenAI-style completion stream into token
+chunks. The stream is cut into network-sized pieces at arbitrary offsets.
+Reports tokens parsed per second and the memory allocated while parsing
+(tracemalloc peak, with every chunk kept as the response cache keeps them).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pydantic_agent.llm_integration import ChatResponse, LLMClient, LLMConfig
+from pydantic_agent.sse import loads
+
+logger = logging.getLogger("bench_sse")
+
+def make_stream(tokens: int) -> bytes:
+    words = ["def", " handle", "_request", "(", "self", ",", " data", ")", ":", "\n    ", "return", " None"]
+    parts = []
+    for number in range(tokens):
+        payload = {
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 1700000000, "model": "bench",
+            "choices": [{"index": 0, "delta": {"content": words[number % len(words)]}, "finish_reason": None}]
+        }
+        parts.append(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+def split(stream: bytes, low: int, high: int):
+    rng = random.Random(0)
+    pieces, offset = [], 0
+    while offset < len(stream):
+        size = rng.randint(low, high)
+        pieces.append(stream[offset:offset + size])
+        offset += size
+    return pieces
+
+class FakeContent:
+    """Stands in for aiohttp's StreamReader: line iteration and iter_any()"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    async def iter_any(self):
+        for piece in self.pieces:
+            yield piece
+
+    async def __aiter__(self):
+        # Line splitting like StreamReader.readline, for the legacy parser
+        buffer = b""
+        for piece in self.pieces:
+            buffer += piece
+            while True:
+                end = buffer.find(b"\n")
+                if end < 0:
+                    break
+                yield buffer[:end + 1]
+                buffer = buffer[end + 1:]
+        if buffer:
+            yield buffer
+
+class FakeResponse:
+    def __init__(self, pieces):
+        self.content = FakeContent(pieces)
+
+async def legacy_process_stream(response):
+    """The line-based parser LLMClient used before the SSE parser"""
+    async for line in response.content:
+        if not line:
+            continue
+        try:
+            line = line.decode('utf-8').strip()
+            if not line.startswith('data: '):
+                continue
+            data = line[6:]
+            if data == '[DONE]':
+                logger.debug("Received [DONE] token")
+                continue
+            json_data = json.loads(data)
+            if not isinstance(json_data, dict):
+                continue
+            content = None
+            if 'choices' in json_data:
+                delta = json_data['choices'][0].get('delta', {})
+                content = delta.get('content', '')
+            elif 'output' in json_data:
+                content = json_data.get('output', {}).get('text', '')
+            if content:
+                logger.debug("Extracted content: %s", content)
+                yield ChatResponse(response=content, type="text")
+        except json.JSONDecodeError:
+            continue
+
+async def consume(stream):
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+    return chunks
+
+def measure(name: str, make_stream_iter, pieces, repeat: int) -> dict:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = asyncio.run(consume(make_stream_iter(FakeResponse(pieces))))
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    chunks = asyncio.run(consume(make_stream_iter(FakeResponse(pieces))))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    text = "".join(chunk.response for chunk in chunks)
+    return {"name": name, "tokens": len(chunks), "seconds": best, "tokens_per_sec": len(chunks) / best,
+            "peak_bytes": peak, "text_hash": hash(text)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=50000)
+    parser.add_argument('--min-piece', type=int, default=200, help="Smallest network read in bytes")
+    parser.add_argument('--max-piece', type=int, default=4000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    pieces = split(make_stream(args.tokens), args.min_piece, args.max_piece)
+    client = LLMClient(LLMConfig(base_url="http://127.0.0.1:1/v1", api_key="bench"))
+    legacy = measure("line-based", legacy_process_stream, pieces, args.repeat)
+    current = measure("incremental", client._process_stream, pieces, args.repeat)
+    results = {"json_decoder": loads.__module__, "legacy": legacy, "current": current,
+               "speedup": current["tokens_per_sec"] / legacy["tokens_per_sec"],
+               "memory_ratio": current["peak_bytes"] / legacy["peak_bytes"]}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"JSON decoder: {results['json_decoder']}")
+        for result in (legacy, current):
+            print(f"{result['name']:>12}: {result['tokens_per_sec']:>12,.0f} tokens/s  "
+                  f"peak {result['peak_bytes'] / 1024:,.0f} KiB")
+        print(f"speedup {results['speedup']:.2f}x, memory {results['memory_ratio']:.2f}x")
+
+    if legacy["text_hash"] != current["text_hash"] or legacy["tokens"] != current["tokens"]:
+        print("FAIL: parsers disagree on the streamed text")
+        sys.exit(1)
+    if results["speedup"] <= 1.0 or results["memory_ratio"] >= 1.0:
+        print("FAIL: the incremental parser is not faster and leaner")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
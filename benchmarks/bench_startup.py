@@ -0,0 +1,137 @@
+"""Measure import time and cold start of the chat server.
+
+Import time: each module is imported in a fresh interpreter, --runs times,
+and the median is reported.
+
+Cold start: src/python_server.py is started as a subprocess against the
+mock backend, whose /models answer is delayed by --models-delay seconds
+like a slow or distant LLM service. Reported (median of --runs) from
+process spawn to:
+- port: the port file is written (the extension can connect)
+- health: /health answers
+- ready: /ready answers 200 (agent created, LLM service checked)
+The port and health times should not include the models delay.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = ["pydantic_agent", "pydantic_agent.base", "pydantic_agent.llm_integration",
+           "pydantic_agent.llm_agent", "python_server"]
+
+def server_env(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, os.path.join(ROOT, 'src')])
+    env["LLM_LOG_LEVEL"] = "WARNING"
+    env.update(extra or {})
+    return env
+
+def import_time(module: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], env=server_env(), capture_output=True, text=True,
+                            check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def get_status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+def cold_start(base_url: str, timeout: float) -> Dict[str, float]:
+    """Spawn the server once and time the milestones"""
+    with tempfile.TemporaryDirectory() as port_dir:
+        env = server_env({
+            "VSCODE_SETTINGS": json.dumps({
+                "pydanticAgent.llm.apiKey": "bench",
+                "pydanticAgent.llm.baseUrl": base_url,
+                "pydanticAgent.llm.model": "mock",
+                "pydanticAgent.cache.enabled": False,
+                "pydanticAgent.logging.level": "WARNING"
+            }),
+            "TMPDIR": port_dir  # Keeps the port file apart from a real server's
+        })
+        port_file = os.path.join(port_dir, 'pydantic_agent_port.txt')
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'src', 'python_server.py')], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times: Dict[str, float] = {}
+        port = None
+        try:
+            deadline = started + timeout
+            while time.perf_counter() < deadline and "ready" not in times:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Chat server exited with status {process.returncode}")
+                if port is None:
+                    try:
+                        with open(port_file) as f:
+                            port = int(f.read().strip())
+                        times["port"] = time.perf_counter() - started
+                    except (OSError, ValueError):
+                        time.sleep(0.002)
+                        continue
+                if "health" not in times and get_status(f"http://localhost:{port}/health") == 200:
+                    times["health"] = time.perf_counter() - started
+                if "health" in times and get_status(f"http://localhost:{port}/ready") == 200:
+                    times["ready"] = time.perf_counter() - started
+                else:
+                    time.sleep(0.005)
+        finally:
+            process.terminate()
+            process.wait()
+        if "ready" not in times:
+            raise RuntimeError(f"Chat server was not ready within {timeout}s (reached {sorted(times)})")
+        return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--models-delay', type=float, default=1.0, help="Seconds the mock takes to answer /models")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    imports = {module: statistics.median(import_time(module) for _ in range(args.runs)) for module in MODULES}
+
+    mock = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, 'mock_openai_server.py'), '--port', '0',
+                             '--models-delay', str(args.models_delay)], stdout=subprocess.PIPE, text=True)
+    try:
+        base_url = re.search(r'(http://\S+)', mock.stdout.readline()).group(1)
+        runs = [cold_start(base_url, args.timeout) for _ in range(args.runs)]
+    finally:
+        mock.terminate()
+        mock.wait()
+    startup = {milestone: statistics.median(run[milestone] for run in runs) for milestone in ("port", "health", "ready")}
+
+    results = {"import_seconds": imports, "startup_seconds": startup, "models_delay": args.models_delay}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for module, seconds in imports.items():
+            print(f"import {module:<34}{seconds * 1000:>9.1f} ms")
+        for milestone, seconds in startup.items():
+            print(f"spawn -> {milestone:<32}{seconds * 1000:>9.1f} ms")
+
+    if startup["port"] >= args.models_delay:
+        print("FAIL: the port file waited for the LLM service")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
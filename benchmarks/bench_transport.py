@@ -0,0 +1,252 @@
+"""Compare the chat server's transports: one POST per message vs. a multiplexed WebSocket.
+
+Starts the mock backend and src/python_server.py (with --unix-socket) as
+subprocesses and measures, over each transport:
+- chat: sequential short chats, per-message latency and messages/sec
+- chat xN: --concurrency chats at once, over N connections (HTTP) or one
+  (WebSocket)
+- didChange: sequential document sync requests per second
+HTTP is measured with a new connection per request, as a client without
+keep-alive makes them, and with keep-alive. The WebSocket runs on TCP and
+on the Unix socket. Also checks that per-stream flow control holds back a
+stream without credit and that a cancel frame stops a stream.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import start_mock, start_server
+
+CLIENT_HEADER = 'X-Pydantic-Agent-Client'
+
+class MuxClient:
+    """Minimal client of the server's multiplexed WebSocket protocol"""
+
+    def __init__(self, ws: aiohttp.ClientWebSocketResponse):
+        self.ws = ws
+        self.ids = itertools.count(1)
+        self.queues: Dict[Any, asyncio.Queue] = {}
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for msg in self.ws:
+            frame = json.loads(msg.data)
+            queue = self.queues.get(frame["id"])
+            if queue is not None:
+                queue.put_nowait(frame)
+
+    async def send(self, frame: dict):
+        await self.ws.send_str(json.dumps(frame))
+
+    async def request(self, kind: str, body: dict, on_event: Optional[Callable[[dict], None]] = None,
+                      credit: int = 0) -> dict:
+        """Send a request frame and return its end frame; events go to on_event
+
+        With credit, a credit frame is sent back for every `credit` events.
+        """
+        stream_id = next(self.ids)
+        queue = self.queues[stream_id] = asyncio.Queue()
+        await self.send({"type": kind, "id": stream_id, **body})
+        received = 0
+        try:
+            while True:
+                frame = await queue.get()
+                if frame["type"] == "end":
+                    return frame
+                received += 1
+                if on_event:
+                    on_event(frame["data"])
+                if credit and received % credit == 0:
+                    await self.send({"type": "credit", "id": stream_id, "events": credit})
+        finally:
+            del self.queues[stream_id]
+
+    async def close(self):
+        await self.ws.close()
+        self.reader.cancel()
+
+def chat_body(number: int) -> dict:
+    return {"message": f"transport {number}", "sessionId": f"transport-{number}"}
+
+async def http_chat(session: aiohttp.ClientSession, url: str, number: int) -> int:
+    tokens = 0
+    async with session.post(f"{url}/chat", json=chat_body(number)) as response:
+        async for line in response.content:
+            if line.startswith(b"data: ") and b'"chunk"' in line:
+                tokens += 1
+    return tokens
+
+async def mux_chat(client: MuxClient, number: int) -> int:
+    chunks = []
+    end = await client.request("chat", chat_body(number), lambda data: chunks.append(data), credit=32)
+    if end["status"] != 200:
+        raise RuntimeError(f"Chat failed: {end}")
+    return sum(1 for data in chunks if data.get("type") == "chunk")
+
+def summarise(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    return {
+        "per_sec": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3)
+    }
+
+async def timed(run: Callable[[int], Any], count: int) -> Dict[str, float]:
+    latencies = []
+    started = time.perf_counter()
+    for number in range(count):
+        request_started = time.perf_counter()
+        await run(number)
+        latencies.append(time.perf_counter() - request_started)
+    return summarise(latencies, time.perf_counter() - started)
+
+async def timed_concurrent(run: Callable[[int], Any], count: int, concurrency: int) -> Dict[str, float]:
+    latencies = []
+    numbers = iter(range(count))
+
+    async def worker(index: int):
+        for number in numbers:
+            request_started = time.perf_counter()
+            await run(number, index)
+            latencies.append(time.perf_counter() - request_started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return summarise(latencies, time.perf_counter() - started)
+
+def document_change(version: int) -> dict:
+    return {
+        "textDocument": {"uri": "file:///bench.py", "version": version},
+        "contentChanges": [{"range": {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 0}},
+                            "text": "x"}]
+    }
+
+async def measure_http(url: str, args, keep_alive: bool) -> Dict[str, Dict[str, float]]:
+    headers = {CLIENT_HEADER: "bench-http"}
+    connector = aiohttp.TCPConnector(force_close=not keep_alive, limit=0)
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        results = {"chat": await timed(lambda number: http_chat(session, url, number), args.messages)}
+        results[f"chat x{args.concurrency}"] = await timed_concurrent(
+            lambda number, index: http_chat(session, url, number), args.messages, args.concurrency)
+        await session.post(f"{url}/document/didOpen", json={
+            "textDocument": {"uri": "file:///bench.py", "languageId": "python", "version": 1, "text": ""}})
+
+        async def change(number: int):
+            async with session.post(f"{url}/document/didChange", json=document_change(number + 2)) as response:
+                await response.read()
+
+        results["didChange"] = await timed(change, args.changes)
+    return results
+
+async def measure_mux(session: aiohttp.ClientSession, ws_url: str, args) -> Dict[str, Dict[str, float]]:
+    client = MuxClient(await session.ws_connect(ws_url, headers={CLIENT_HEADER: "bench-ws"}))
+    try:
+        results = {"chat": await timed(lambda number: mux_chat(client, number), args.messages)}
+        results[f"chat x{args.concurrency}"] = await timed_concurrent(
+            lambda number, index: mux_chat(client, number), args.messages, args.concurrency)
+        await client.request("didOpen", {
+            "textDocument": {"uri": "file:///bench.py", "languageId": "python", "version": 1, "text": ""}})
+        results["didChange"] = await timed(
+            lambda number: client.request("didChange", document_change(number + 2)), args.changes)
+    finally:
+        await client.close()
+    return results
+
+async def check_flow_control(session: aiohttp.ClientSession, ws_url: str) -> List[str]:
+    """A stream stops at its window until credit arrives; a cancel frame ends it"""
+    failures = []
+    client = MuxClient(await session.ws_connect(f"{ws_url}?window=2"))
+    try:
+        events: List[dict] = []
+        request = asyncio.create_task(client.request("chat", chat_body(0), events.append))
+        await asyncio.sleep(0.5)
+        if len(events) != 2:
+            failures.append(f"expected 2 events without credit, got {len(events)}")
+        await client.send({"type": "credit", "id": 1, "events": 10000})
+        end = await asyncio.wait_for(request, 30)
+        if end["status"] != 200 or not any(data.get("done") for data in events):
+            failures.append(f"stream did not finish after credit: {end}")
+
+        events = []
+        request = asyncio.create_task(client.request("chat", chat_body(1), events.append))
+        await asyncio.sleep(0.2)
+        await client.send({"type": "cancel", "id": 2})
+        end = await asyncio.wait_for(request, 30)
+        if not any(data.get("cancelled") for data in events):
+            failures.append(f"cancel frame did not stop the stream: {end}")
+    finally:
+        await client.close()
+    return failures
+
+async def run(args) -> dict:
+    mock, base_url = start_mock(argparse.Namespace(
+        tokens=args.tokens, token_delay=args.token_delay, first_token_delay=0.0, first_token_jitter=0.0,
+        backend_concurrency=None, fail_status=None, fail_rate=0.0))
+    server = None
+    try:
+        with tempfile.TemporaryDirectory() as port_dir:
+            socket_path = os.path.join(port_dir, 'pydantic_agent.sock')
+            server, port = start_server(base_url, port_dir, settings={"pydanticAgent.stream.coalesceMs": 0},
+                                        arguments=['--unix-socket', socket_path])
+            url = f"http://localhost:{port}"
+            async with aiohttp.ClientSession() as session:
+                # Wait for the agent so the first measurement does not include start-up
+                for _ in range(300):
+                    async with session.get(f"{url}/ready") as response:
+                        if (await response.json()).get("agent"):
+                            break
+                    await asyncio.sleep(0.05)
+            results = {
+                "http (new connection)": await measure_http(url, args, keep_alive=False),
+                "http (keep-alive)": await measure_http(url, args, keep_alive=True)
+            }
+            async with aiohttp.ClientSession() as session:
+                results["websocket"] = await measure_mux(session, f"ws://localhost:{port}/ws", args)
+                failures = await check_flow_control(session, f"ws://localhost:{port}/ws")
+            if os.path.exists(socket_path):
+                async with aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=socket_path)) as session:
+                    results["websocket (unix)"] = await measure_mux(session, "ws://localhost/ws", args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        mock.terminate()
+        mock.wait()
+    return {"results": results, "failures": failures}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200, help="Chats per measurement")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--changes', type=int, default=1000, help="didChange requests per measurement")
+    parser.add_argument('--tokens', type=int, default=5, help="Tokens per answer")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Seconds between upstream tokens")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    outcome = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(outcome, indent=2))
+    else:
+        for transport, results in outcome["results"].items():
+            for name, result in results.items():
+                print(f"{transport:<24}{name:<12}{result['per_sec']:>10} /s  mean {result['mean_ms']:>8} ms  "
+                      f"p50 {result['p50_ms']:>8} ms")
+    if outcome["failures"]:
+        print("FAIL: " + "; ".join(outcome["failures"]))
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Local stand-in for an OpenAI-compatible API, used by the benchmarks"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Optional
+from aiohttp import web
+
+class MockOpenAIServer:
+    """Streams canned SSE completions at a configurable rate"""
+
+    def __init__(self, tokens: int = 50, token_delay: float = 0.01, first_token_delay: float = 0.0,
+                 token_text: str = "tok ", max_concurrency: Optional[int] = None, stamp_tokens: bool = False):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.token_text = token_text
+        self.stamp_tokens = stamp_tokens  # Send each token's wall-clock send time as its text
+        # Streams served at once, like a backend with fixed capacity; the rest queue
+        self.max_concurrency = max_concurrency
+        self._slots = None
+        self.fail_status: Optional[int] = None  # Answer completions with this status...
+        self.fail_remaining: Optional[int] = None  # ...this many times, or always when None
+        self.fail_rate = 1.0  # Fraction of requests that fail while failures remain
+        self.first_token_jitter = 0.0  # Up to this many extra seconds before the first token, at random
+        self.models_delay = 0.0  # Seconds before answering /models, like a slow or distant service
+        self.retry_after: Optional[float] = None  # Retry-After sent with failures
+        self.stall_after: Optional[int] = None  # Stop sending (without closing) after this many chunks
+        self.line_tokens: Optional[int] = None  # End every this many tokens with a newline
+        self.requests = 0
+        self.aborted = 0  # Streams the client closed before the end
+        self.runner = None
+        self.port = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def _chunk(self, content: str) -> bytes:
+        payload = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "mock",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+        }
+        return f"data: {json.dumps(payload)}\n\n".encode('utf-8')
+
+    async def handle_completions(self, request: web.Request) -> web.StreamResponse:
+        """Stream `tokens` chunks followed by [DONE]"""
+        self.requests += 1
+        body = await request.json()
+        if self.fail_status and self.fail_remaining != 0 and random.random() < self.fail_rate:
+            if self.fail_remaining is not None:
+                self.fail_remaining -= 1
+            headers = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else None
+            return web.json_response({"error": {"message": "mock failure"}}, status=self.fail_status, headers=headers)
+        if self.max_concurrency:
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(self.max_concurrency)
+            async with self._slots:
+                return await self._stream(request, body)
+        return await self._stream(request, body)
+
+    async def _stream(self, request: web.Request, body: dict) -> web.StreamResponse:
+        """Send the tokens, stopping early at max_tokens or a stop sequence like a real service"""
+        tokens = min(self.tokens, body.get('max_tokens') or self.tokens)
+        stop = body.get('stop') or []
+        text = ""
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        try:
+            delay = self.first_token_delay + random.uniform(0, self.first_token_jitter)
+            if delay:
+                await asyncio.sleep(delay)
+            for number in range(tokens):
+                if number == self.stall_after:
+                    await asyncio.sleep(3600)
+                token = f"{time.time():.6f} " if self.stamp_tokens else self.token_text
+                if self.line_tokens and (number + 1) % self.line_tokens == 0:
+                    token += "\n"
+                text += token
+                cut = [text.find(sequence) for sequence in stop if sequence and sequence in text]
+                if cut:
+                    token = token[:max(0, min(cut) - (len(text) - len(token)))]
+                    if token:
+                        await response.write(self._chunk(token))
+                    break
+                await response.write(self._chunk(token))
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            self.aborted += 1
+        return response
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        if self.models_delay:
+            await asyncio.sleep(self.models_delay)
+        return web.json_response({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handle_completions)
+        app.router.add_get('/v1/models', self.handle_models)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self.runner = web.AppRunner(self.create_app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--token-delay', type=float, default=0.01)
+    parser.add_argument('--first-token-delay', type=float, default=0.0)
+    parser.add_argument('--first-token-jitter', type=float, default=0.0, help="Random extra first token delay, up to")
+    parser.add_argument('--max-concurrency', type=int, default=None, help="Streams served at once, the rest queue")
+    parser.add_argument('--fail-status', type=int, default=None, help="Answer failing requests with this status")
+    parser.add_argument('--fail-rate', type=float, default=1.0, help="Fraction of requests that fail")
+    parser.add_argument('--retry-after', type=float, default=None, help="Retry-After seconds sent with failures")
+    parser.add_argument('--models-delay', type=float, default=0.0, help="Seconds before answering /models")
+    parser.add_argument('--stamp', action='store_true', help="Send timestamps as token text")
+    parser.add_argument('--line-tokens', type=int, default=None, help="End every this many tokens with a newline")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.tokens, args.token_delay, args.first_token_delay,
+                              max_concurrency=args.max_concurrency, stamp_tokens=args.stamp)
+    server.first_token_jitter = args.first_token_jitter
+    server.fail_status = args.fail_status
+    server.fail_rate = args.fail_rate
+    server.retry_after = args.retry_after
+    server.models_delay = args.models_delay
+    server.line_tokens = args.line_tokens
+    await server.start(port=args.port)
+    print(f"Mock OpenAI server listening on {server.base_url}", flush=True)
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
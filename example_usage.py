@@ -1,10 +1,13 @@
 import asyncio
 from pydantic_agent.base import CodeContext, AgentAction
 from pydantic_agent.completion_agent import CompletionAgent
+from pydantic_agent.config import get_settings
+from pydantic_agent.llm_integration import LLMConfig
 
 async def main():
-    # Create a completion agent
-    agent = CompletionAgent()
+    # Create a completion agent, using the LLM configured in .env
+    settings = get_settings()
+    agent = CompletionAgent(llm_config=LLMConfig(base_url=settings.llm_base_url, api_key=settings.llm_api_key))
 
     # Set up the context
     context = CodeContext(
@@ -15,10 +18,10 @@ async def main():
     )
     agent.update_context(context)
 
-    # Create an action
+    # Create an action; the completion is generated at the cursor
     action = AgentAction(
         action_type="generate_completion",
-        parameters={"prefix": "def hello"}
+        parameters={"max_tokens": 32}
     )
 
     # Process the action
@@ -31,5 +34,7 @@ async def main():
     if response.suggestions:
         print("Suggestions:", response.suggestions)
 
+    await agent.llm_client.cleanup()
+
 if __name__ == "__main__":
     asyncio.run(main())
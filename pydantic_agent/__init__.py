@@ -1,8 +1,42 @@
 """Pydantic Agent package for VS Code extension"""
 
-from .base import BaseAgent, AgentCapability, AgentAction, AgentResponse, CodeContext
-from .llm_agent import LLMAgent
-from .llm_integration import LLMConfig, LLMClient, Message, ChatResponse
-from .config import settings
+import importlib
+
+# Exports are imported on first access, so importing one submodule does not load them all
+_EXPORTS = {
+    "BaseAgent": "base", "AgentCapability": "base", "AgentAction": "base", "AgentResponse": "base",
+    "CodeContext": "base",
+    "LLMAgent": "llm_agent",
+    "CompletionAgent": "completion_agent", "CompletionRequest": "completion_agent",
+    "CompletionCache": "completion_cache",
+    "LLMConfig": "llm_integration", "LLMClient": "llm_integration", "Message": "llm_integration",
+    "ChatResponse": "llm_integration", "StreamChunk": "llm_integration",
+    "ResponseCache": "cache",
+    "DocumentStore": "documents", "TextDocument": "documents",
+    "ContextBuilder": "context_builder", "ContextWindow": "context_builder",
+    "SymbolIndex": "symbol_index", "Symbol": "symbol_index",
+    "BM25Index": "retrieval", "Snippet": "retrieval",
+    "ConnectionPool": "connection_pool", "get_pool": "connection_pool",
+    "Endpoint": "router", "EndpointRouter": "router",
+    "SSEParser": "sse", "SSEEvent": "sse", "SSECoalescer": "sse",
+    "configure_logging": "logging_setup", "TokenTrace": "logging_setup",
+    "Workspace": "workspaces", "WorkspaceRegistry": "workspaces",
+    "MuxConnection": "multiplex", "MuxStream": "multiplex", "CreditWindow": "multiplex",
+    "AdmissionScheduler": "scheduler", "AdmissionRejected": "scheduler", "Priority": "scheduler",
+    "settings": "config",
+}
+
+__all__ = list(_EXPORTS)
 
 __version__ = "0.1.0"
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+class ResponseCache:
+    """Exact-match cache of streamed LLM responses
+
+    Entries are the list of streamed chunks, so a hit can be replayed with the
+    same chunking as the original answer. Entries live in an in-memory LRU and,
+    when `directory` is set, in an on-disk tier that survives restarts. Both
+    tiers expire entries after `ttl` seconds and evict by size.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 24 * 60 * 60,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = Path(directory) if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, List[str], int]]" = OrderedDict()
+        self._bytes = 0
+        self.logger = logging.getLogger(__name__)
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List[Dict[str, Any]], context: Optional[str] = None,
+                 max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> str:
+        """Hash everything the response depends on into a cache key"""
+        data = {"model": model, "temperature": temperature, "messages": messages, "context": context or ""}
+        if max_tokens:
+            data["max_tokens"] = max_tokens
+        if stop:
+            data["stop"] = stop
+        payload = json.dumps(data, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """Return the cached chunks for key, or None"""
+        chunks = self._get_memory(key)
+        if chunks is None and self.directory:
+            loop = asyncio.get_running_loop()
+            chunks = await loop.run_in_executor(None, self._read_disk, key)
+            if chunks is not None:
+                self._set_memory(key, chunks)
+        if chunks is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return chunks
+
+    async def set(self, key: str, chunks: List[str]):
+        """Store the complete chunk list of a finished response"""
+        self._set_memory(key, chunks)
+        if self.directory:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write_disk, key, chunks)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _get_memory(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, chunks, size = entry
+        if time.time() - created > self.ttl:
+            del self._entries[key]
+            self._bytes -= size
+            return None
+        self._entries.move_to_end(key)
+        return chunks
+
+    def _set_memory(self, key: str, chunks: List[str]):
+        size = sum(len(chunk) for chunk in chunks)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._entries[key] = (time.time(), chunks, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[List[str]]:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink()
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)["chunks"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning("Dropping unreadable cache entry %s: %s", path, e)
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+
+    def _write_disk(self, key: str, chunks: List[str]):
+        path = self._path(key)
+        tmp_path = path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"chunks": chunks}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except Exception as e:
+            self.logger.warning("Failed to write cache entry %s: %s", path, e)
+
+    def _evict_disk(self):
+        """Remove expired files, then the oldest ones until under max_disk_bytes"""
+        now = time.time()
+        files = []
+        total = 0
+        for path in self.directory.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -1,37 +1,252 @@
-from typing import Dict, Any
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import Field, PrivateAttr
 from .base import BaseAgent, AgentCapability, CodeContext
+from .completion_cache import CompletionCache
+from .context_builder import estimate_tokens
+from .llm_integration import LLMClient, LLMConfig, Message
+from .scheduler import Priority
+from . import metrics
+from .timing import span
+
+CURSOR_MARKER = "<|cursor|>"
+FIM_SYSTEM_PROMPT = (
+    "You are a code completion engine. The user sends a {language} file with the cursor marked "
+    f"{CURSOR_MARKER}. Reply with only the text to insert at the cursor: no explanation, no code fences, "
+    "and none of the code already before or after the cursor."
+)
+SINGLE_LINE_STOP = ["\n"]  # The cursor is inside a line: finish just that line
+MULTI_LINE_STOP = ["\n\n"]  # At the end of a line: up to the end of the block
 
 class CompletionRequest(CodeContext):
-    prefix: str
-    max_tokens: int = 50
-    temperature: float = 0.7
+    # Text before and after the cursor; split from content at cursor_position when prefix is None
+    prefix: Optional[str] = None
+    suffix: Optional[str] = None
+    max_tokens: int = 48
+    temperature: float = 0.2
+
+def cursor_offset(content: str, position: Optional[Tuple[int, int]]) -> int:
+    """Offset of a (line, character) position in content, clamped to the text; the end for None"""
+    if position is None:
+        return len(content)
+    line, character = position
+    # Split off only the lines before the cursor
+    lines = content.split('\n', max(line, 0) + 1)
+    line = min(max(line, 0), len(lines) - 1)
+    return sum(map(len, lines[:line])) + line + min(max(character, 0), len(lines[line]))
+
+def locate_cursor(request: CompletionRequest) -> Tuple[str, int]:
+    """The text of a request and the offset of its cursor in it"""
+    if request.prefix is not None:
+        return request.prefix + (request.suffix or ""), len(request.prefix)
+    return request.content, cursor_offset(request.content, request.cursor_position)
+
+def cursor_location(request: CompletionRequest) -> Tuple[int, int]:
+    """(line, character) of a request's cursor"""
+    if request.prefix is None and request.cursor_position is not None:
+        return request.cursor_position
+    before = request.prefix if request.prefix is not None else request.content
+    return before.count('\n'), len(before) - before.rfind('\n') - 1
+
+def split_at_cursor(request: CompletionRequest) -> Tuple[str, str]:
+    """Prefix and suffix of a request, at cursor_position (line, character) or the end"""
+    if request.prefix is not None:
+        return request.prefix, request.suffix or ""
+    text, cursor = locate_cursor(request)
+    return text[:cursor], text[cursor:]
+
+def _fit_lines(lines: List[str], budget: int) -> int:
+    """How many of lines, taken in order, fit into budget tokens (at least one)"""
+    used = 0
+    for count, line in enumerate(lines):
+        used += estimate_tokens(line) + 1
+        if used > budget and count:
+            return count
+    return len(lines)
+
+def stop_sequences(suffix: str) -> List[str]:
+    rest_of_line = suffix.split('\n', 1)[0]
+    return SINGLE_LINE_STOP if rest_of_line.strip() else MULTI_LINE_STOP
+
+def _bracket_balance(text: str) -> int:
+    """Opening minus closing brackets in text"""
+    return sum(text.count(bracket) for bracket in "([{") - sum(text.count(bracket) for bracket in ")]}")
+
+def clean_completion(text: str, suffix: str, stop: List[str]) -> str:
+    """The part of a model answer to insert at the cursor"""
+    text = text.replace(CURSOR_MARKER, "")
+    if text.lstrip().startswith("```"):
+        # Fenced despite the instructions: keep the code inside
+        text = text.lstrip().partition('\n')[2]
+        text = text.split("```", 1)[0]
+    for sequence in stop:
+        index = text.find(sequence)
+        if index >= 0:
+            text = text[:index]
+    # Drop what only repeats the code after the cursor. An ending equal to the rest of the
+    # line is a repeat only if it closes brackets the completion never opened: for
+    # `print(|)`, `len(x)` is whole, while `len(x))` closes print( a second time
+    suffix_lines = suffix.split('\n')
+    rest_of_line = suffix_lines[0].strip()
+    if rest_of_line and text.rstrip().endswith(rest_of_line):
+        trimmed = text.rstrip()[:-len(rest_of_line)]
+        if _bracket_balance(text) < 0 and _bracket_balance(trimmed) >= 0:
+            text = trimmed
+    next_line = next((line.strip() for line in suffix_lines[1:] if line.strip()), None)
+    if next_line is not None and '\n' in text:
+        lines = text.split('\n')
+        for number, line in enumerate(lines[1:], 1):
+            if line.strip() == next_line:
+                text = '\n'.join(lines[:number])
+                break
+        text = text.rstrip()
+    return text
 
 class CompletionAgent(BaseAgent):
-    def __init__(self, name: str = "CompletionAgent"):
+    """Inline code completions: a fill-in-the-middle prompt around the cursor, answered by the LLM
+
+    Keystrokes arrive faster than completions can be generated, so requests
+    are debounced per document: complete() waits `debounce` seconds before it
+    asks the model, and a newer request for the same document supersedes the
+    one in flight, which then returns None and closes its upstream stream.
+    Completions run at Priority.COMPLETION with a short max_tokens and stop
+    sequences chosen by cursor position, and end as soon as a stop sequence
+    arrives even if the service ignores them. While the user types through a
+    completion (or accepts part of it), the rest comes from
+    `completion_cache` at once, without debounce or model.
+    """
+    llm_client: Optional[LLMClient] = None
+    llm_config: Optional[LLMConfig] = None  # Defaults to the client's
+    model: Optional[str] = None  # A faster model for completions; defaults to the config's
+    debounce: float = 0.05  # Seconds
+    prefix_tokens: int = 1024  # Prompt budget for the code before the cursor...
+    suffix_tokens: int = 256  # ...and after it
+    timeout: float = 10.0  # Seconds; a later completion is worth nothing
+    completion_cache: Optional[CompletionCache] = Field(default_factory=CompletionCache)  # None disables reuse
+    logger: logging.Logger = Field(default_factory=lambda: logging.getLogger(__name__))
+    _pending: Dict[str, asyncio.Task] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, name: str = "CompletionAgent", llm_config: Optional[LLMConfig] = None,
+                 llm_client: Optional[LLMClient] = None, **options: Any):
         super().__init__(
             name=name,
-            capabilities=[AgentCapability.CODE_COMPLETION]
+            capabilities=[AgentCapability.CODE_COMPLETION],
+            llm_config=llm_config,
+            llm_client=llm_client,
+            **options
         )
+        if self.llm_client is None and llm_config is not None:
+            self.llm_client = LLMClient(llm_config)
         self.register_handler("generate_completion", self.generate_completion)
 
+    def build_messages(self, request: CompletionRequest) -> Tuple[List[Message], str, List[str]]:
+        """The prompt for request, the suffix it was built with and the stop sequences that fit it"""
+        prefix, suffix = split_at_cursor(request)
+        prefix_lines = prefix.split('\n')
+        prefix_lines = prefix_lines[len(prefix_lines) - _fit_lines(prefix_lines[::-1], self.prefix_tokens):]
+        suffix_lines = suffix.split('\n')
+        suffix_lines = suffix_lines[:_fit_lines(suffix_lines, self.suffix_tokens)]
+        prefix, suffix = '\n'.join(prefix_lines), '\n'.join(suffix_lines)
+        messages = [
+            Message(role="system", content=FIM_SYSTEM_PROMPT.format(language=request.language or "source")),
+            Message(role="user", content=f"{prefix}{CURSOR_MARKER}{suffix}")
+        ]
+        return messages, suffix, stop_sequences(suffix)
+
+    def _config(self, request: CompletionRequest, stop: List[str]) -> LLMConfig:
+        config = self.llm_config or self.llm_client.config
+        return config.model_copy(update={
+            'model': self.model or config.model,
+            'max_tokens': request.max_tokens,
+            'temperature': request.temperature,
+            'stop': stop,
+            'first_token_timeout': min(config.first_token_timeout, self.timeout),
+            'total_timeout': self.timeout,
+            # Backing off and retrying takes longer than the user waits
+            'max_retries': 1
+        })
+
+    async def complete(self, request: CompletionRequest, key: Optional[str] = None) -> Optional[str]:
+        """The completion at request's cursor, or None if a newer request for key superseded it
+
+        `key` identifies the document (by default request.file_path); one
+        completion per key is in flight at a time.
+        """
+        if self.llm_client is None:
+            raise ValueError("No LLM client configured")
+        key = key if key is not None else request.file_path
+        started = time.perf_counter()
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        line, character = cursor_location(request)
+        if self.completion_cache is not None:
+            text = request.content if request.prefix is None else request.prefix + (request.suffix or "")
+            reused = self.completion_cache.lookup(key, text, line, character)
+            if reused is not None:
+                metrics.COMPLETION_REQUESTS.inc(outcome="reused")
+                metrics.COMPLETION_DURATION.observe(time.perf_counter() - started)
+                return reused
+        task = asyncio.ensure_future(self._debounced(request, key, (line, character)))
+        self._pending[key] = task
+        outcome = "error"
+        try:
+            completion = await task
+            outcome = "completed" if completion else "empty"
+            return completion
+        except asyncio.CancelledError:
+            if self._pending.get(key) is not task:
+                outcome = "superseded"
+                return None
+            outcome = "cancelled"
+            raise
+        finally:
+            if self._pending.get(key) is task:
+                del self._pending[key]
+            metrics.COMPLETION_REQUESTS.inc(outcome=outcome)
+            metrics.COMPLETION_DURATION.observe(time.perf_counter() - started)
+
+    async def _debounced(self, request: CompletionRequest, key: str, position: Tuple[int, int]) -> str:
+        if self.debounce > 0:
+            with span("completion.debounce"):
+                await asyncio.sleep(self.debounce)
+        messages, suffix, stop = self.build_messages(request)
+        parts: List[str] = []
+        # Services that ignore stop sequences would generate up to max_tokens; look for them here too
+        overlap = max(len(sequence) for sequence in stop) - 1
+        recent = ""
+        stream = self.llm_client.stream_complete(messages, config=self._config(request, stop),
+                                                 priority=Priority.COMPLETION, session=key)
+        try:
+            with span("completion.generate"):
+                async for chunk in stream:
+                    parts.append(chunk.response)
+                    recent = (recent[-overlap:] if overlap else "") + chunk.response
+                    if any(sequence in recent for sequence in stop):
+                        break
+        finally:
+            await stream.aclose()
+        completion = clean_completion("".join(parts), suffix, stop)
+        if self.completion_cache is not None and completion:
+            text, offset = locate_cursor(request)
+            self.completion_cache.store(key, text, offset, *position, completion)
+        return completion
+
     async def generate_completion(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Generate code completion based on the current context"""
         if not self.context:
             raise ValueError("No context provided")
 
-        # Here you would implement your actual completion logic
-        # This is just a simple example
-        completion = f"# Generated completion for {parameters.get('prefix', '')}\n"
-        completion += "def example_function():\n    pass"
-
+        options = {name: parameters[name] for name in ("prefix", "suffix", "max_tokens", "temperature")
+                   if name in parameters}
+        request = CompletionRequest(**self.context.model_dump(), **options)
+        completion = await self.complete(request)
         return {
             "changes": [{
                 "type": "insertion",
                 "position": self.context.cursor_position,
-                "content": completion
-            }],
-            "suggestions": [
-                "Consider adding docstring",
-                "Add type hints for better code clarity"
-            ]
+                "content": completion or ""
+            }]
         }
@@ -0,0 +1,117 @@
+import collections
+from typing import Dict, NamedTuple, Optional
+
+DEFAULT_ANCHOR_CHARS = 256  # Text before a completion that must be unchanged to reuse it
+DEFAULT_FOLLOWING_CHARS = 64  # ...and text after the cursor
+
+class _Entry(NamedTuple):
+    line: int  # Cursor position the completion was generated at
+    character: int
+    anchor: str  # Text just before the cursor
+    completion: str
+    following: str  # Text just after the cursor
+
+class CompletionCache:
+    """Recent inline completions per document, so typing through one does not ask the model again
+
+    An entry remembers the cursor a completion was generated at, by offset
+    and by (line, character). A later request for the same document reuses
+    it while the text before that offset still ends with the entry's
+    anchor, the cursor moved forward within the completion, the characters
+    typed since are the completion's start and the text after the cursor is
+    unchanged; the answer is the rest of the completion. The new cursor's
+    offset follows from the entry and the typed text, so a lookup compares a
+    few hundred characters however large the document is. An edit that does
+    not match (the text before the anchor changed, or the typed text
+    diverged) drops the entry. At most `max_documents` documents of
+    `max_entries` entries are kept, least recently used first out.
+    """
+
+    def __init__(self, max_documents: int = 64, max_entries: int = 16, anchor_chars: int = DEFAULT_ANCHOR_CHARS,
+                 following_chars: int = DEFAULT_FOLLOWING_CHARS):
+        self.max_documents = max_documents
+        self.max_entries = max_entries
+        self.anchor_chars = anchor_chars
+        self.following_chars = following_chars
+        # Document -> offset -> entry, both least recently used first
+        self.documents: "collections.OrderedDict[str, collections.OrderedDict[int, _Entry]]" = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _typed(entry: _Entry, line: int, character: int) -> int:
+        """Characters of the completion before (line, character), -1 if that is before the entry"""
+        if line == entry.line:
+            return character - entry.character if character >= entry.character else -1
+        if line < entry.line:
+            return -1
+        newline = -1
+        for _ in range(line - entry.line):
+            newline = entry.completion.find('\n', newline + 1)
+            if newline < 0:
+                return len(entry.completion)  # Below the completion
+        return newline + 1 + character
+
+    def lookup(self, document: str, text: str, line: int, character: int) -> Optional[str]:
+        """The rest of a cached completion the text typed up to (line, character) runs into, or None"""
+        entries = self.documents.get(document)
+        if entries:
+            for offset, entry in reversed(list(entries.items())):
+                if not text.startswith(entry.anchor, offset - len(entry.anchor)):
+                    # The text the completion was made for changed
+                    del entries[offset]
+                    continue
+                typed = self._typed(entry, line, character)
+                if typed < 0:
+                    continue  # The cursor is before it; the entry may still be typed through later
+                if (typed >= len(entry.completion)
+                        or not text.startswith(entry.completion[:typed], offset)
+                        or not text.startswith(entry.following, offset + typed)):
+                    # Typed through completely, or edited into something else
+                    del entries[offset]
+                    continue
+                entries.move_to_end(offset)
+                self.documents.move_to_end(document)
+                self.hits += 1
+                return entry.completion[typed:]
+            if not entries:
+                del self.documents[document]
+        self.misses += 1
+        return None
+
+    def store(self, document: str, text: str, offset: int, line: int, character: int, completion: str):
+        """Remember the completion generated for text at offset, which is (line, character)"""
+        if not completion:
+            return
+        entries = self.documents.get(document)
+        if entries is None:
+            entries = self.documents[document] = collections.OrderedDict()
+        else:
+            self.documents.move_to_end(document)
+        entries[offset] = _Entry(
+            line,
+            character,
+            text[max(0, offset - self.anchor_chars):offset],
+            completion,
+            text[offset:offset + self.following_chars]
+        )
+        entries.move_to_end(offset)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        while len(self.documents) > self.max_documents:
+            self.documents.popitem(last=False)
+
+    def invalidate(self, document: Optional[str] = None):
+        """Forget one document's completions, or all of them"""
+        if document is None:
+            self.documents.clear()
+        else:
+            self.documents.pop(document, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "documents": len(self.documents),
+            "entries": sum(len(entries) for entries in self.documents.values()),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -5,6 +5,7 @@ from pathlib import Path
 from typing import Optional
 import json
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
@@ -31,15 +32,15 @@ class Settings(BaseSettings):
         """Load settings from VS Code configuration passed via environment variables"""
         # First try environment variables
         env_settings = cls()
-        logger.debug(f"Loaded settings from environment: api_key_length={len(env_settings.llm_api_key)}")
-        logger.debug(f"Environment variables: {dict(os.environ)}")
+        logger.debug("Loaded settings from environment: api_key_length=%d", len(env_settings.llm_api_key))
+        logger.debug("Environment variables: %s", dict(os.environ))
         
         # Then try VS Code settings
         settings_json = os.environ.get("VSCODE_SETTINGS", "{}")
-        logger.debug(f"Loading VS Code settings from environment: {settings_json}")
+        logger.debug("Loading VS Code settings from environment: %s", settings_json)
         try:
             vscode_settings = json.loads(settings_json)
-            logger.debug(f"Parsed VS Code settings: {vscode_settings}")
+            logger.debug("Parsed VS Code settings: %s", vscode_settings)
             
             # Create settings from VS Code if available, otherwise use env settings
             settings = cls(
@@ -49,12 +50,21 @@ class Settings(BaseSettings):
                 llm_temperature=float(vscode_settings.get("pydanticAgent.llm.temperature", env_settings.llm_temperature))
             )
             
-            logger.debug(f"Final settings: api_key_length={len(settings.llm_api_key)}, base_url={settings.llm_base_url}")
+            logger.debug("Final settings: api_key_length=%d, base_url=%s",
+                         len(settings.llm_api_key), settings.llm_base_url)
             return settings
         except Exception as e:
-            logger.error(f"Error loading VS Code settings: {e}")
+            logger.error("Error loading VS Code settings: %s", e)
             # Fall back to environment variables
             return env_settings
 
-# Create settings instance
-settings = Settings.from_vscode_settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """The settings, read on first use rather than at import"""
+    return Settings.from_vscode_settings()
+
+def __getattr__(name: str):
+    # `settings` used to be created at import; keep it importable, built lazily
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+import aiohttp
+from .timing import current_timer
+
+DEFAULT_LIMIT = 100  # Connections across all hosts
+DEFAULT_LIMIT_PER_HOST = 20
+DEFAULT_KEEPALIVE_TIMEOUT = 75.0  # Seconds an idle connection is kept for reuse
+DEFAULT_DNS_CACHE_TTL = 300  # Seconds
+
+class ConnectionPool:
+    """Process-wide HTTP connection pool shared by all LLM clients
+
+    Wraps one aiohttp.ClientSession with a tuned TCPConnector (connection
+    limits, keep-alive, DNS cache) and counts connection reuse so the
+    savings are visible.
+    """
+
+    def __init__(
+        self,
+        limit: int = DEFAULT_LIMIT,
+        limit_per_host: int = DEFAULT_LIMIT_PER_HOST,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+        dns_cache_ttl: int = DEFAULT_DNS_CACHE_TTL
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.logger = logging.getLogger(__name__)
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.requests += 1
+
+        async def on_dns_resolvehost_start(session, context, params):
+            context.dns_started = time.perf_counter()
+
+        async def on_dns_resolvehost_end(session, context, params):
+            timer = current_timer.get()
+            if timer is not None:
+                timer.add("upstream.dns", context.dns_started, time.perf_counter())
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            self.connections_created += 1
+            timer = current_timer.get()
+            if timer is not None:
+                timer.add("upstream.connect", context.connect_started, time.perf_counter())
+
+        async def on_connection_reuseconn(session, context, params):
+            self.connections_reused += 1
+
+        async def on_dns_cache_hit(session, context, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, context, params):
+            self.dns_cache_misses += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace.on_connection_create_start.append(on_connection_create_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        if self.session is not None and not self.session.closed and self._loop is loop:
+            return self.session
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        async with self._lock:
+            if self.session is None or self.session.closed or self._loop is not loop:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    use_dns_cache=True,
+                    ttl_dns_cache=self.dns_cache_ttl
+                )
+                self.session = aiohttp.ClientSession(connector=connector, trace_configs=[self._trace_config()])
+                self.logger.debug("Created shared HTTP session (limit=%s, per host=%s)",
+                                  self.limit, self.limit_per_host)
+        return self.session
+
+    async def warm_up(self, url: str, headers: Optional[Dict[str, str]] = None) -> bool:
+        """Open a connection to url's host ahead of the first real request"""
+        session = await self.get_session()
+        try:
+            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                await response.read()
+                self.logger.debug("Warmed up connection to %s (%d)", url, response.status)
+                return True
+        except Exception as e:
+            self.logger.warning("Connection warm-up to %s failed: %s", url, e)
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        connector = self.session.connector if self.session is not None and not self.session.closed else None
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            # aiohttp has no public counter for connections in use
+            "in_use": len(getattr(connector, '_acquired', ())) if connector else 0,
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses
+        }
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+_pool: Optional[ConnectionPool] = None
+
+def get_pool() -> ConnectionPool:
+    """The process-wide pool, created with defaults unless configured first"""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool()
+    return _pool
+
+def configure_pool(**kwargs) -> ConnectionPool:
+    """Replace the process-wide pool settings; call before the first request"""
+    global _pool
+    if _pool is not None and _pool.session is not None:
+        raise RuntimeError("Connection pool already in use, configure it at startup")
+    _pool = ConnectionPool(**kwargs)
+    return _pool
@@ -0,0 +1,208 @@
+import re
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+from pydantic import BaseModel
+from .base import CodeContext
+from .documents import split_lines
+from .symbol_index import SymbolIndex
+
+# Roughly one token per identifier/number run or punctuation character, which
+# tracks BPE tokenizers closely enough on source code for budgeting
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+_IMPORT_RE = re.compile(
+    r'^\s*(import\s|from\s+\S+\s+import\s|#include\b|#import\b|using\s|package\s|use\s'
+    r'|(const|let|var)\s+\S+\s*=\s*require\()'
+)
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the token count of text"""
+    return len(_TOKEN_RE.findall(text))
+
+class ContextWindow(BaseModel):
+    """Code context selected for a prompt"""
+    text: str
+    tokens: int
+    line_ranges: List[Tuple[int, int]]  # Inclusive, 0-based
+    truncated: bool = False
+
+class _DocumentIndex:
+    """Per-content line data, computed once and reused across requests"""
+
+    def __init__(self, content: str, tokenizer: Callable[[str], int]):
+        self.content = content
+        self.lines = split_lines(content)
+        self.tokens = [tokenizer(line) for line in self.lines]
+        self.indents: List[Optional[int]] = []
+        self.imports: List[int] = []
+        for number, line in enumerate(self.lines):
+            stripped = line.lstrip()
+            self.indents.append(len(line) - len(stripped) if stripped.strip() else None)
+            if _IMPORT_RE.match(line):
+                self.imports.append(number)
+
+class ContextBuilder:
+    """Builds a prompt-sized view of a CodeContext under a token budget
+
+    Lines are taken in priority order: the selection, a window around the
+    cursor, the headers of the scopes enclosing the cursor, then imports.
+    With a symbol index, signatures of workspace definitions used in the
+    cursor window come next. Any budget left over widens the cursor window.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4000,
+        window_share: float = 0.6,
+        tokenizer: Callable[[str], int] = estimate_tokens,
+        cache_size: int = 32,
+        symbol_index: Optional[SymbolIndex] = None
+    ):
+        self.max_tokens = max_tokens
+        self.window_share = window_share
+        self.tokenizer = tokenizer
+        self.cache_size = cache_size
+        self.symbol_index = symbol_index
+        self._indexes: "OrderedDict[Tuple[int, int], _DocumentIndex]" = OrderedDict()
+
+    def _index(self, context: CodeContext) -> _DocumentIndex:
+        # Keyed on the content itself: editor versions restart when a document is
+        # reopened and repeat across windows. The hash is cached on the str object
+        content = context.content
+        key = (len(content), hash(content))
+        index = self._indexes.get(key)
+        if index is None or index.content != content:
+            index = _DocumentIndex(content, self.tokenizer)
+            self._indexes[key] = index
+            if len(self._indexes) > self.cache_size:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(key)
+        return index
+
+    def build(self, context: CodeContext, max_tokens: Optional[int] = None) -> ContextWindow:
+        """Select the lines of context.content that fit the budget"""
+        budget = max_tokens or self.max_tokens
+        index = self._index(context)
+        lines = index.lines
+        if not lines:
+            return ContextWindow(text="", tokens=0, line_ranges=[])
+
+        selected_tokens = 0
+        selection = context.selected_text or ""
+        if selection:
+            selected_tokens = self.tokenizer(selection)
+            if selected_tokens > budget:
+                # Keep the start of an oversized selection
+                keep = max(1, len(selection) * budget // selected_tokens)
+                selection = selection[:keep]
+                selected_tokens = self.tokenizer(selection)
+        used = selected_tokens
+
+        cursor_line = 0
+        if context.cursor_position:
+            cursor_line = min(max(context.cursor_position[0], 0), len(lines) - 1)
+
+        included = set()
+
+        def take(number: int, limit: int) -> bool:
+            nonlocal used
+            if number in included:
+                return True
+            if used + index.tokens[number] > limit:
+                return False
+            included.add(number)
+            used += index.tokens[number]
+            return True
+
+        # 1. Cursor window, growing outwards with preference for the code above
+        above, below = cursor_line, cursor_line + 1
+        window_limit = used + int((budget - used) * self.window_share)
+        take(cursor_line, budget)
+        while above > 0 or below < len(lines):
+            grew = False
+            if above > 0 and take(above - 1, window_limit):
+                above -= 1
+                grew = True
+            if below < len(lines) and take(below, window_limit):
+                below += 1
+                grew = True
+            if not grew:
+                break
+
+        # 2. Headers of enclosing scopes (lines with less indentation above the cursor)
+        indent = next((index.indents[n] for n in range(cursor_line, -1, -1) if index.indents[n] is not None), 0)
+        for number in range(cursor_line - 1, -1, -1):
+            if indent == 0:
+                break
+            line_indent = index.indents[number]
+            if line_indent is not None and line_indent < indent:
+                take(number, budget)
+                indent = line_indent
+
+        # 3. Imports
+        for number in index.imports:
+            if not take(number, budget):
+                break
+
+        # 4. Definitions of workspace symbols used near the cursor
+        definitions = []
+        if self.symbol_index is not None:
+            window_text = "".join(lines[above:below])
+            for symbol in self.symbol_index.definitions_for(window_text, exclude_path=context.file_path):
+                entry = f"{symbol.signature}  ({symbol.path}:{symbol.line})"
+                tokens = self.tokenizer(entry)
+                if used + tokens > budget:
+                    break
+                definitions.append(entry)
+                used += tokens
+
+        # 5. Spend what is left on a wider cursor window
+        while above > 0 or below < len(lines):
+            grew = False
+            if above > 0 and take(above - 1, budget):
+                above -= 1
+                grew = True
+            if below < len(lines) and take(below, budget):
+                below += 1
+                grew = True
+            if not grew:
+                break
+
+        ranges = self._ranges(sorted(included))
+        text = self._render(lines, ranges, context, cursor_line, selection, definitions)
+        return ContextWindow(
+            text=text,
+            tokens=used,
+            line_ranges=ranges,
+            truncated=len(included) < len(lines) or selection != (context.selected_text or "")
+        )
+
+    @staticmethod
+    def _ranges(numbers: List[int]) -> List[Tuple[int, int]]:
+        ranges: List[Tuple[int, int]] = []
+        for number in numbers:
+            if ranges and ranges[-1][1] == number - 1:
+                ranges[-1] = (ranges[-1][0], number)
+            else:
+                ranges.append((number, number))
+        return ranges
+
+    @staticmethod
+    def _render(lines: List[str], ranges: List[Tuple[int, int]], context: CodeContext,
+                cursor_line: int, selection: str, definitions: List[str]) -> str:
+        parts = [f"File: {context.file_path} (cursor at line {cursor_line + 1})", f"```{context.language}"]
+        previous_end = -1
+        for start, end in ranges:
+            if start > previous_end + 1:
+                parts.append("...")
+            parts.append("".join(lines[start:end + 1]).rstrip("\r\n"))
+            previous_end = end
+        if previous_end < len(lines) - 1:
+            parts.append("...")
+        parts.append("```")
+        if selection:
+            parts.append(f"Selected text:\n```{context.language}\n{selection}\n```")
+        if definitions:
+            parts.append("Definitions used near the cursor:\n" + "\n".join(f"- {entry}" for entry in definitions))
+        return "\n".join(parts)
@@ -0,0 +1,130 @@
+import re
+import logging
+from urllib.parse import unquote
+from typing import Any, Dict, List, Optional, Tuple
+from .base import CodeContext
+
+# Line breaks as the editor counts them; str.splitlines also splits on form feeds and Unicode separators
+_EOL_RE = re.compile(r'(\r\n|\r|\n)')
+
+def split_lines(text: str) -> List[str]:
+    """Split text into lines, keeping each line's terminator"""
+    parts = _EOL_RE.split(text)
+    lines = [parts[i] + parts[i + 1] for i in range(0, len(parts) - 1, 2)]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+def _utf16_to_index(line: str, character: int) -> int:
+    """Convert an LSP character offset (UTF-16 code units) to a str index"""
+    if character <= 0:
+        return 0
+    if line.isascii():
+        return min(character, len(line))
+    units = 0
+    for index, char in enumerate(line):
+        if units >= character:
+            return index
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line)
+
+def _strip_eol(line: str) -> str:
+    if line.endswith('\r\n'):
+        return line[:-2]
+    if line.endswith(('\n', '\r')):
+        return line[:-1]
+    return line
+
+class TextDocument:
+    """An open document kept as a list of lines and updated with range edits"""
+
+    def __init__(self, uri: str, language: str, version: int, text: str):
+        self.uri = uri
+        self.language = language
+        self.version = version
+        self.lines = split_lines(text)
+        self._text: Optional[str] = text
+
+    @property
+    def text(self) -> str:
+        """Full document text, joined lazily once per version"""
+        if self._text is None:
+            self._text = "".join(self.lines)
+        return self._text
+
+    @property
+    def file_path(self) -> str:
+        return unquote(self.uri[len('file://'):]) if self.uri.startswith('file://') else self.uri
+
+    def _line(self, line: int) -> str:
+        return self.lines[line] if line < len(self.lines) else ""
+
+    def apply_change(self, change: Dict[str, Any]):
+        """Apply one LSP TextDocumentContentChangeEvent"""
+        text = change.get('text', '')
+        rng = change.get('range')
+        if rng is None:
+            self.lines = split_lines(text)
+            self._text = text
+            return
+
+        start_line, start_char = rng['start']['line'], rng['start']['character']
+        end_line, end_char = rng['end']['line'], rng['end']['character']
+        if (start_line, start_char) > (end_line, end_char) or start_line < 0:
+            raise ValueError(f"Invalid range in change for {self.uri}: {rng}")
+        if start_line > len(self.lines):
+            raise ValueError(f"Change starts past the end of {self.uri} (line {start_line})")
+
+        first = self._line(start_line)
+        last = self._line(end_line)
+        prefix = first[:_utf16_to_index(_strip_eol(first), start_char)]
+        suffix = last[_utf16_to_index(_strip_eol(last), end_char):]
+        self.lines[start_line:end_line + 1] = split_lines(prefix + text + suffix)
+        self._text = None
+
+    def to_context(self, cursor_position: Optional[Tuple[int, int]] = None,
+                   selected_text: Optional[str] = None, file_path: Optional[str] = None) -> CodeContext:
+        """Build a CodeContext without re-validating the stored content"""
+        return CodeContext.model_construct(
+            file_path=file_path or self.file_path,
+            content=self.text,
+            language=self.language,
+            cursor_position=cursor_position,
+            selected_text=selected_text
+        )
+
+class DocumentStore:
+    """Versioned documents synced from the editor with didOpen/didChange/didClose"""
+
+    def __init__(self):
+        self.documents: Dict[str, TextDocument] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def get(self, uri: str) -> Optional[TextDocument]:
+        return self.documents.get(uri)
+
+    def did_open(self, uri: str, language: str, version: int, text: str) -> TextDocument:
+        document = TextDocument(uri, language, version, text)
+        self.documents[uri] = document
+        self.logger.debug("Opened %s v%s (%d chars)", uri, version, len(text))
+        return document
+
+    def did_change(self, uri: str, version: int, changes: List[Dict[str, Any]]) -> TextDocument:
+        """Apply content changes in order; raises ValueError if out of sync"""
+        document = self.documents.get(uri)
+        if document is None:
+            raise ValueError(f"Document not open: {uri}")
+        if version <= document.version:
+            raise ValueError(f"Stale version {version} for {uri} (have {document.version})")
+        try:
+            for change in changes:
+                document.apply_change(change)
+        except (KeyError, TypeError, ValueError) as e:
+            # A half-applied edit leaves the document unusable, make the editor reopen it
+            del self.documents[uri]
+            raise ValueError(f"Failed to apply changes to {uri}: {e}")
+        document.version = version
+        return document
+
+    def did_close(self, uri: str):
+        self.documents.pop(uri, None)
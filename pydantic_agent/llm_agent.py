@@ -1,5 +1,8 @@
 from .base import BaseAgent, AgentCapability, AgentAction, AgentResponse
 from .llm_integration import LLMConfig, LLMClient, Message, ChatResponse
+from .cache import ResponseCache
+from .context_builder import ContextBuilder
+from .scheduler import AdmissionScheduler, Priority
 from typing import Dict, Any, List, AsyncGenerator, Optional
 import asyncio
 from pydantic import Field
@@ -8,17 +11,22 @@ import logging
 class LLMAgent(BaseAgent):
     llm_client: LLMClient = None
     llm_config: LLMConfig = None
+    context_builder: ContextBuilder = None
     logger: logging.Logger = Field(default_factory=lambda: logging.getLogger(__name__))
 
     def __init__(
         self,
         name: str,
         llm_config: LLMConfig,
-        capabilities: List[AgentCapability]
+        capabilities: List[AgentCapability],
+        cache: Optional[ResponseCache] = None,
+        context_builder: Optional[ContextBuilder] = None,
+        scheduler: Optional[AdmissionScheduler] = None
     ):
         super().__init__(name=name, capabilities=capabilities)
         self.llm_config = llm_config
-        self.llm_client = LLMClient(llm_config)
+        self.llm_client = LLMClient(llm_config, cache=cache, scheduler=scheduler)
+        self.context_builder = context_builder or ContextBuilder()
         self.register_handler("generate", self.generate)
         self.register_handler("analyze", self.analyze)
         self.register_handler("stream_generate", self.stream_generate)
@@ -33,11 +41,11 @@ class LLMAgent(BaseAgent):
             Message(role="user", content=parameters.get("prompt", ""))
         ]
 
-        self.logger.debug(f"Starting stream_generate with messages: {messages}")
+        self.logger.debug("Starting stream_generate with messages: %s", messages)
+        stream = self.llm_client.stream_complete(messages)
         try:
             current_position = 0
-            async for chunk in self.llm_client.stream_complete(messages):
-                self.logger.debug(f"Received chunk: {chunk}")
+            async for chunk in stream:
                 if chunk and chunk.response:
                     response_dict = {
                         "partial_response": {
@@ -48,12 +56,14 @@ class LLMAgent(BaseAgent):
                             }]
                         }
                     }
-                    self.logger.debug(f"Yielding response: {response_dict}")
                     yield response_dict
                     current_position += len(chunk.response)
         except Exception as e:
-            self.logger.error(f"Error in stream_generate: {str(e)}", exc_info=True)
+            self.logger.error("Error in stream_generate: %s", e, exc_info=True)
             raise
+        finally:
+            # A consumer that stops early (or is cancelled) closes the upstream stream now
+            await stream.aclose()
 
     async def generate(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Generate code or text using the LLM (non-streaming)"""
@@ -81,15 +91,17 @@ class LLMAgent(BaseAgent):
         if not self.context:
             raise ValueError("No context provided")
 
+        window = self.context_builder.build(self.context, max_tokens=parameters.get("max_context_tokens"))
         messages = [
             Message(role="system", content="You are a code analysis expert."),
             Message(
                 role="user",
-                content=f"Analyze this code and provide suggestions:\n\n{self.context.content}"
+                content=f"Analyze this code and provide suggestions:\n\n{window.text}"
             )
         ]
 
-        response = await self.llm_client.complete(messages)
+        # Nobody is waiting on an analysis, so it yields to chat answers
+        response = await self.llm_client.complete(messages, priority=Priority.BACKGROUND)
 
         return {
             "changes": None,
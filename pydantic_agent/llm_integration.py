@@ -1,27 +1,82 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any, AsyncGenerator, Literal
+from typing import Optional, List, Dict, Any, AsyncGenerator, Literal, NamedTuple
 import aiohttp
 import json
 import asyncio
+import email.utils
 import logging
-from async_timeout import timeout as async_timeout
-from .config import settings
-import instructor
-from instructor import OpenAISchema
+import random
+import time
+from datetime import datetime, timezone
+from .cache import ResponseCache
+from .connection_pool import ConnectionPool, get_pool
+from .router import Endpoint, EndpointRouter
+from .scheduler import AdmissionScheduler, Priority, Ticket
+from .sse import SSEEvent, SSEParser, loads
+from .logging_setup import TokenTrace
+from . import metrics
+from .timing import current_timer, span
+
+def _settings():
+    # Imported on first use: reading the .env settings is not needed when everything is passed in
+    from .config import get_settings
+    return get_settings()
 
 class LLMConfig(BaseModel):
     base_url: str
     api_key: str
-    model: str = settings.llm_model
-    temperature: float = settings.llm_temperature
-    max_tokens: Optional[int] = None
+    model: str = Field(default_factory=lambda: _settings().llm_model)
+    temperature: float = Field(default_factory=lambda: _settings().llm_temperature, ge=0.0, le=2.0)
+    max_tokens: Optional[int] = Field(default=None, gt=0)
+    stop: Optional[List[str]] = None  # Sequences that end the generation, at most 4 for OpenAI
     stream: bool = True
+    # Backends to balance across; empty means just base_url
+    endpoints: List[Endpoint] = Field(default_factory=list)
+    # Timeouts in seconds
+    connect_timeout: float = 10.0
+    first_token_timeout: float = 60.0  # Request sent to first chunk, per attempt
+    idle_timeout: float = 30.0  # Between chunks
+    total_timeout: Optional[float] = 600.0  # Whole request including retries; None for no limit
+    max_retries: int = 3
+    retry_base_delay: float = 0.5  # First backoff step, doubled per attempt
+    retry_max_delay: float = 30.0
+
+# Statuses worth retrying; 429 and 503 may say when in Retry-After
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter over the upper half of the step"""
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
 
-class Message(OpenAISchema):
+class _RetryableError(Exception):
+    """A failure before the first byte that another attempt may not hit"""
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _RejectedError(ValueError):
+    """The service refused the request itself (a 4xx other than 408/429); any endpoint would"""
+
+class Message(BaseModel):
     role: Literal["system", "user", "assistant"]
     content: str
 
-class ChatResponse(OpenAISchema):
+class ChatResponse(BaseModel):
     """Chat response from the LLM"""
     response: str = Field(description="The response text")
     type: Literal["text", "code"] = Field(
@@ -29,170 +84,486 @@ class ChatResponse(OpenAISchema):
         description="The type of response"
     )
 
+class StreamChunk(NamedTuple):
+    """One streamed piece of an answer
+
+    Reads like a ChatResponse (`.response`, `.type`) without the cost of
+    model validation for every token.
+    """
+    response: str
+    type: str = "text"
+
+class _SharedStream:
+    """One upstream completion fanned out to every identical request"""
+    def __init__(self, ticket: Ticket):
+        self.chunks: List[StreamChunk] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.ticket = ticket  # Admission of the upstream request, raised to the most urgent subscriber's class
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: StreamChunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.error = error
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        # Wake current waiters and arm a fresh event for the next chunk
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
 class LLMClient:
-    def __init__(self, config: LLMConfig):
+    def __init__(self, config: LLMConfig, cache: Optional[ResponseCache] = None, coalesce: bool = True,
+                 pool: Optional[ConnectionPool] = None, scheduler: Optional[AdmissionScheduler] = None):
         self.config = config
+        self.cache = cache
+        self.coalesce = coalesce
+        self.pool = pool or get_pool()
+        self.scheduler = scheduler  # Admission by priority; None sends every request at once
+        self.router = EndpointRouter(
+            config.endpoints or [Endpoint(base_url=config.base_url)],
+            api_key=config.api_key,
+            pool=self.pool
+        )
+        self._in_flight: Dict[str, _SharedStream] = {}
         self.session = None
         self.logger = logging.getLogger(__name__)
         if not config.api_key:
             self.logger.error("No API key provided in configuration")
-        self.logger.debug(f"Initialized LLM client with base URL: {config.base_url}")
+        self.logger.debug("Initialized LLM client with base URL: %s", config.base_url)
 
     async def ensure_session(self):
-        """Ensure we have an active session"""
-        if self.session is not None:
-            if self.session.closed:
-                await self.cleanup()
-            else:
-                return
+        """Ensure we have an active session from the shared pool"""
+        if self.session is not None and not self.session.closed:
+            return
 
         if not self.config.api_key:
             raise ValueError("API key is required but not provided")
 
-        self.session = aiohttp.ClientSession()
-        self.logger.debug(f"Initialized session")
+        self.session = await self.pool.get_session()
+        self.logger.debug("Using shared session")
 
-    async def _process_stream(self, response) -> AsyncGenerator[ChatResponse, None]:
+    def _headers(self, config: Optional[LLMConfig] = None) -> Dict[str, str]:
+        config = config or self.config
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {config.api_key.strip()}"
+        }
+
+    def _endpoint_config(self, config: LLMConfig, endpoint: Endpoint) -> LLMConfig:
+        """config aimed at one endpoint"""
+        return config.model_copy(update={
+            'base_url': endpoint.base_url,
+            'api_key': endpoint.api_key or config.api_key,
+            'model': endpoint.model or config.model
+        })
+
+    async def warm_up(self) -> bool:
+        """Open a pooled connection to every endpoint before the first chat"""
+        results = await asyncio.gather(*(
+            self.pool.warm_up(
+                f"{state.endpoint.base_url.rstrip('/')}/models",
+                headers=self._headers(self._endpoint_config(self.config, state.endpoint))
+            )
+            for state in self.router.states
+        ))
+        return any(results)
+
+    async def list_models(self) -> List[str]:
+        """Ids of the models offered by the LLM service"""
+        await self.ensure_session()
+        url = f"{self.config.base_url.rstrip('/')}/models"
+        async with self.session.get(url, headers=self._headers(), timeout=aiohttp.ClientTimeout(total=30)) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise ValueError(f"Error from LLM service: {error_text}")
+            data = await response.json()
+        return [model.get('id', '') for model in data.get('data', [])]
+
+    async def _process_stream(self, response) -> AsyncGenerator[StreamChunk, None]:
         """Process the SSE stream from the response"""
+        parser = SSEParser()
         try:
-            async for line in response.content:
-                if not line:
-                    continue
-                    
-                try:
-                    line = line.decode('utf-8').strip()
-                    if not line.startswith('data: '):
-                        continue
-
-                    data = line[6:]  # Remove 'data: ' prefix
-                    if data == '[DONE]':
-                        self.logger.debug("Received [DONE] token")
-                        continue
-
-                    json_data = json.loads(data)
-                    if not isinstance(json_data, dict):
-                        self.logger.warning(f"Unexpected JSON format: {json_data}")
-                        continue
-
-                    # Handle both OpenAI-style and Qwen-style responses
-                    content = None
-                    if 'choices' in json_data:
-                        delta = json_data['choices'][0].get('delta', {})
-                        content = delta.get('content', '')
-                    elif 'output' in json_data:
-                        content = json_data.get('output', {}).get('text', '')
-                    
+            # Parse whatever bytes have arrived instead of awaiting line by line
+            async for data in response.content.iter_any():
+                for event in parser.feed(data):
+                    content = self._event_content(event)
                     if content:
-                        self.logger.debug(f"Extracted content: {content}")
-                        yield ChatResponse(
-                            response=content.strip(),  # Remove any whitespace
-                            type="text"
-                        )
-                except json.JSONDecodeError as e:
-                    self.logger.warning(f"Failed to parse JSON: {data} - {str(e)}")
-                    continue
-                except Exception as e:
-                    self.logger.error(f"Error processing stream chunk: {e}")
-                    continue
+                        yield StreamChunk(content)
+            for event in parser.close():
+                content = self._event_content(event)
+                if content:
+                    yield StreamChunk(content)
         except Exception as e:
-            self.logger.error(f"Error in _process_stream: {e}", exc_info=True)
+            self.logger.error("Error in _process_stream: %s", e, exc_info=True)
             raise
 
-    async def _make_request(self, messages: List[Message], max_retries: int = 3, retry_delay: float = 2.0) -> aiohttp.ClientResponse:
-        """Make the actual HTTP request with proper timeout handling and retries"""
+    def _event_content(self, event: SSEEvent) -> Optional[str]:
+        """Text carried by one completion event, whitespace included"""
+        if event.data == b"[DONE]":
+            return None
+        try:
+            json_data = loads(event.data)
+        except ValueError as e:
+            self.logger.warning("Failed to parse JSON: %s - %s", event.text, e)
+            return None
+        if not isinstance(json_data, dict):
+            self.logger.warning("Unexpected JSON format: %s", json_data)
+            return None
+        try:
+            # Handle both OpenAI-style and Qwen-style responses
+            if 'choices' in json_data:
+                choices = json_data['choices']
+                return (choices[0].get('delta') or {}).get('content') if choices else None
+            if 'output' in json_data:
+                return json_data['output'].get('text')
+        except (AttributeError, IndexError, TypeError) as e:
+            self.logger.error("Error processing stream chunk: %s", e)
+        return None
+
+    @staticmethod
+    def _time_left(timeout: Optional[float], deadline: Optional[float]) -> Optional[float]:
+        """The tighter of timeout and the time left before deadline"""
+        if deadline is None:
+            return timeout
+        left = deadline - asyncio.get_running_loop().time()
+        if left <= 0:
+            raise asyncio.TimeoutError()
+        return left if timeout is None else min(timeout, left)
+
+    async def _make_request(self, messages: List[Message], config: LLMConfig,
+                            timeout: Optional[float]) -> aiohttp.ClientResponse:
+        """Send one completion request and wait up to timeout for the response headers"""
         await self.ensure_session()
-        url = f"{self.config.base_url.rstrip('/')}/chat/completions"
+        url = f"{config.base_url.rstrip('/')}/chat/completions"
         
         payload = {
-            'model': self.config.model,
+            'model': config.model,
             'messages': [{'role': msg.role, 'content': msg.content} for msg in messages],
-            'temperature': self.config.temperature,
-            'stream': self.config.stream
+            'temperature': config.temperature,
+            'stream': config.stream
         }
-        if self.config.max_tokens:
-            payload['max_tokens'] = self.config.max_tokens
+        if config.max_tokens:
+            payload['max_tokens'] = config.max_tokens
+        if config.stop:
+            payload['stop'] = config.stop
             
-        self.logger.debug(f"Making request to {url}")
-        self.logger.debug(f"Request headers: Authorization: Bearer ***{self.config.api_key[-4:] if self.config.api_key else ''}")
-        self.logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Making request to %s", url)
+            self.logger.debug("Request headers: Authorization: Bearer ***%s",
+                              config.api_key[-4:] if config.api_key else '')
+            self.logger.debug("Request payload: %s", json.dumps(payload, indent=2))
         
+        try:
+            response = await asyncio.wait_for(
+                self.session.post(
+                    url, json=payload, headers=self._headers(config),
+                    # Reads are bounded per chunk by the caller, not by aiohttp
+                    timeout=aiohttp.ClientTimeout(total=None, sock_connect=config.connect_timeout)
+                ),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.UPSTREAM_ERRORS.inc(status="timeout")
+            raise _RetryableError(f"No response within {timeout:.1f}s")
+        except aiohttp.ClientError as e:
+            metrics.UPSTREAM_ERRORS.inc(status="connection")
+            raise _RetryableError(f"{type(e).__name__}: {e}")
+        if response.status == 200:
+            return response
+        metrics.UPSTREAM_ERRORS.inc(status=str(response.status))
+        error_text = await response.text()
+        response.release()
+        if response.status in RETRYABLE_STATUSES:
+            retry_after = _retry_after(response.headers.get('Retry-After')) if response.status in (429, 503) else None
+            raise _RetryableError(f"Error from LLM service ({response.status}): {error_text}", retry_after)
+        self.logger.error("Error from LLM service (%d): %s", response.status, error_text)
+        raise _RejectedError(f"Error from LLM service: {error_text}")
+
+    async def _open_stream(self, messages: List[Message], config: LLMConfig, max_retries: int,
+                           deadline: Optional[float]):
+        """Start a completion stream and wait for its first chunk
+
+        Returns (response, stream, first chunk or None). Failures before the
+        first chunk are retried with exponential backoff, or after the
+        server's Retry-After; nothing has reached the caller yet, so a retry
+        cannot duplicate output.
+        """
+        loop = asyncio.get_running_loop()
         last_error = None
         for attempt in range(max_retries):
+            started = loop.time()
+            response = None
+            retry_after = None
             try:
-                async with async_timeout(30):
-                    response = await self.session.post(
-                        url,
-                        json=payload,
-                        headers={
-                            "Content-Type": "application/json",
-                            "Authorization": f"Bearer {self.config.api_key.strip()}"
-                        }
+                with span("upstream.request"):
+                    response = await self._make_request(
+                        messages, config, self._time_left(config.first_token_timeout, deadline)
                     )
-                    if response.status == 502:
-                        self.logger.warning(f"Received 502 error (attempt {attempt + 1}/{max_retries}), retrying in {retry_delay} seconds...")
-                        await asyncio.sleep(retry_delay)
-                        continue
-                    elif response.status != 200:
-                        error_text = await response.text()
-                        self.logger.error(f"Error from LLM service ({response.status}): {error_text}")
-                        raise ValueError(f"Error from LLM service: {error_text}")
-                    return response
+                stream = self._process_stream(response)
+                remaining = config.first_token_timeout - (loop.time() - started)
+                try:
+                    with span("upstream.first_token"):
+                        first = await asyncio.wait_for(stream.__anext__(), self._time_left(max(remaining, 0.0), deadline))
+                except StopAsyncIteration:
+                    first = None
+                return response, stream, first
             except asyncio.TimeoutError:
-                last_error = "Request timed out"
-                self.logger.warning(f"Request timed out (attempt {attempt + 1}/{max_retries})")
-            except Exception as e:
+                metrics.UPSTREAM_ERRORS.inc(status="timeout")
+                last_error = f"No first token within {config.first_token_timeout}s"
+            except _RetryableError as e:
                 last_error = str(e)
-                self.logger.warning(f"Request failed (attempt {attempt + 1}/{max_retries}): {str(e)}")
-            
-            if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay)
+                retry_after = e.retry_after
+            if response is not None:
+                response.release()
+            if attempt == max_retries - 1:
+                break
+            delay = retry_after if retry_after is not None else _backoff(attempt, config.retry_base_delay, config.retry_max_delay)
+            if deadline is not None and loop.time() + delay >= deadline:
+                last_error += f" (no time left to retry within {config.total_timeout}s)"
+                break
+            self.logger.warning("%s (attempt %d/%d), retrying in %.1fs", last_error, attempt + 1, max_retries, delay)
+            metrics.UPSTREAM_RETRIES.inc(kind="retry")
+            with span("upstream.backoff"):
+                await asyncio.sleep(delay)
         
-        error_msg = f"Failed after {max_retries} attempts. Last error: {last_error}"
+        error_msg = f"Failed after {attempt + 1} attempts. Last error: {last_error}"
         self.logger.error(error_msg)
         raise ValueError(error_msg)
 
-    async def stream_complete(self, messages: List[Message]) -> AsyncGenerator[ChatResponse, None]:
-        """Stream completion responses from the LLM service"""
+    def _request_key(self, messages: List[Message], config: LLMConfig, cache_context: Optional[str]) -> str:
+        """Key identifying requests that must produce the same answer"""
+        return ResponseCache.make_key(
+            f"{config.base_url.rstrip('/')}|{config.model}",
+            config.temperature,
+            [{'role': msg.role, 'content': msg.content} for msg in messages],
+            cache_context,
+            max_tokens=config.max_tokens,
+            stop=config.stop
+        )
+
+    async def stream_complete(self, messages: List[Message], config: Optional[LLMConfig] = None,
+                              cache_context: Optional[str] = None, priority: Priority = Priority.INTERACTIVE,
+                              session: str = "") -> AsyncGenerator[StreamChunk, None]:
+        """Stream completion responses from the LLM service
+
+        `config` overrides the client's own configuration for this call only.
+        `cache_context` is any extra content the answer depends on (such as the
+        open file) that should be part of the response cache key. `priority`
+        and `session` place the upstream request in the scheduler's queues;
+        cache hits and joined requests do not wait for admission.
+
+        Identical requests that arrive while one is already streaming share
+        its upstream stream; late joiners first get the chunks sent so far.
+        Cancelling the caller or closing this generator early closes the
+        upstream HTTP stream once no other request shares it.
+        """
+        config = config or self.config
+        key = self._request_key(messages, config, cache_context)
+        if self.cache is not None:
+            with span("cache.lookup"):
+                cached = await self.cache.get(key)
+            if cached is not None:
+                metrics.CACHE_LOOKUPS.inc(result="hit")
+                self.logger.debug("Cache hit for %s, replaying %d chunks", key[:12], len(cached))
+                for text in cached:
+                    yield StreamChunk(text)
+                return
+
+        if not self.coalesce:
+            metrics.CACHE_LOOKUPS.inc(result="miss")
+            async for chunk in self._stream_admitted(messages, config, key, Ticket(priority, session)):
+                yield chunk
+            return
+
+        shared = self._in_flight.get(key)
+        if shared is None:
+            metrics.CACHE_LOOKUPS.inc(result="miss")
+            shared = _SharedStream(Ticket(priority, session))
+            self._in_flight[key] = shared
+            shared.task = asyncio.create_task(self._run_shared(key, messages, config, shared))
+        else:
+            metrics.CACHE_LOOKUPS.inc(result="coalesced")
+            self.logger.debug("Joining in-flight request %s at chunk %d", key[:12], len(shared.chunks))
+            if self.scheduler is not None:
+                # A more urgent request must not wait at the class of the one it joined
+                self.scheduler.promote(shared.ticket, priority)
+
+        shared.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(shared.chunks):
+                    yield shared.chunks[position]
+                    position += 1
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                await shared.wait()
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                # Nobody is listening any more, stop paying for the generation
+                self.logger.debug("All subscribers left request %s, cancelling upstream", key[:12])
+                if self._in_flight.get(key) is shared:
+                    del self._in_flight[key]
+                shared.task.cancel()
+
+    async def _run_shared(self, key: str, messages: List[Message], config: LLMConfig, shared: _SharedStream):
+        """Drive one upstream stream and publish its chunks to all subscribers"""
         try:
-            async with async_timeout(30):  # 30 second timeout
-                response = await self._make_request(messages)
-                self.logger.debug("Got response from LLM service")
-                async for chunk in self._process_stream(response):
-                    self.logger.debug(f"Raw response chunk: {chunk}")
+            async for chunk in self._stream_admitted(messages, config, key, shared.ticket):
+                shared.publish(chunk)
+            shared.finish()
+        except asyncio.CancelledError:
+            shared.finish(asyncio.CancelledError())
+        except Exception as e:
+            shared.finish(e)
+        finally:
+            if self._in_flight.get(key) is shared:
+                del self._in_flight[key]
+
+    async def _stream_admitted(self, messages: List[Message], config: LLMConfig, key: str,
+                               ticket: Ticket) -> AsyncGenerator[StreamChunk, None]:
+        """_stream_upstream once the scheduler admits it, holding the slot until the stream ends"""
+        if self.scheduler is None:
+            async for chunk in self._stream_upstream(messages, config, key):
+                yield chunk
+            return
+        async with self.scheduler.admit(ticket=ticket):
+            async for chunk in self._stream_upstream(messages, config, key):
+                yield chunk
+
+    async def _stream_upstream(self, messages: List[Message], config: LLMConfig, key: str) -> AsyncGenerator[StreamChunk, None]:
+        """Stream one completion from the best endpoint and cache it when complete
+
+        A request that fails before its first chunk fails over to the next
+        endpoint; once chunks were sent the error is raised. A request the
+        service rejects outright (400, 404, ...) is raised at once and does
+        not count against the endpoint. Chunks must keep coming within
+        idle_timeout and the whole answer within total_timeout, so slow but
+        steady generations are not cut off.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.total_timeout if config.total_timeout else None
+        attempts = len(self.router.states)
+        # With other endpoints to fall back on, fail over instead of retrying in place
+        max_retries = 1 if attempts > 1 else config.max_retries
+        tried = set()  # Endpoints this request failed on, avoided by the next attempt
+        for attempt in range(attempts):
+            async with self.router.acquire(tried, deadline) as state:
+                endpoint_config = self._endpoint_config(config, state.endpoint)
+                started = time.monotonic()
+                chunks = []
+                trace = TokenTrace(f"upstream {key[:12]}")
+                endpoint = state.endpoint.base_url
+                metrics.UPSTREAM_REQUESTS.inc(endpoint=endpoint)
+                first_token_at = None
+                try:
+                    response, stream, chunk = await self._open_stream(messages, endpoint_config, max_retries, deadline)
+                    self.logger.debug("Got response from %s", state.endpoint.base_url)
+                    finished = False
+                    streaming_since = time.perf_counter()
                     try:
-                        if chunk:
-                            self.logger.debug(f"Processed chunk: {chunk}")
+                        while chunk is not None:
+                            if not chunks:
+                                first_token_at = time.monotonic()
+                                self.router.record_success(state, first_token_at - started)
+                                metrics.UPSTREAM_TTFT.observe(first_token_at - started, endpoint=endpoint)
+                            chunks.append(chunk.response)
+                            trace.token(chunk.response)
                             yield chunk
-                    except Exception as e:
-                        self.logger.error(f"Error processing chunk: {e}", exc_info=True)
-                        yield ChatResponse(response=str(e), type="text")
-        except Exception as e:
-            self.logger.error(f"Error in stream_complete: {str(e)}", exc_info=True)
-            raise
+                            try:
+                                chunk = await asyncio.wait_for(
+                                    stream.__anext__(), self._time_left(config.idle_timeout, deadline)
+                                )
+                            except StopAsyncIteration:
+                                chunk = None
+                            except asyncio.TimeoutError:
+                                if deadline is not None and loop.time() >= deadline:
+                                    raise ValueError(f"LLM response exceeded the {config.total_timeout}s budget")
+                                raise ValueError(f"LLM stream idle for more than {config.idle_timeout}s")
+                        finished = True
+                        self._record_stream(endpoint, started, first_token_at, len(chunks))
+                    finally:
+                        metrics.TOKENS.inc(len(chunks))
+                        timer = current_timer.get()
+                        if timer is not None:
+                            timer.add("upstream.stream", streaming_since, time.perf_counter())
+                        if finished:
+                            # Hand the connection back to the session pool
+                            response.release()
+                        else:
+                            # Abandoned mid-answer: drop the connection so the server stops generating
+                            response.close()
+                except _RejectedError:
+                    raise
+                except Exception as e:
+                    self.router.record_failure(state)
+                    if chunks:
+                        metrics.UPSTREAM_ERRORS.inc(status="stream")
+                    if chunks or attempt == attempts - 1:
+                        self.logger.error("Error in stream_complete: %s", e, exc_info=True)
+                        raise
+                    self.logger.warning("Endpoint %s failed (%s), trying another", state.endpoint.base_url, e)
+                    tried.add(state)
+                    metrics.UPSTREAM_RETRIES.inc(kind="failover")
+                    continue
+                if not chunks:
+                    self.router.record_success(state, time.monotonic() - started)
+            # Only complete answers are cached
+            if self.cache is not None and chunks:
+                await self.cache.set(key, chunks)
+            return
+
+    @staticmethod
+    def _record_stream(endpoint: str, started: float, first_token_at: Optional[float], tokens: int):
+        """Observe duration and generation speed of a finished stream"""
+        now = time.monotonic()
+        metrics.UPSTREAM_DURATION.observe(now - started, endpoint=endpoint)
+        if first_token_at is not None and tokens > 1 and now > first_token_at:
+            metrics.TOKENS_PER_SECOND.observe((tokens - 1) / (now - first_token_at))
 
-    async def complete(self, messages: List[Message]) -> ChatResponse:
+    async def complete(self, messages: List[Message], config: Optional[LLMConfig] = None,
+                       cache_context: Optional[str] = None, priority: Priority = Priority.INTERACTIVE,
+                       session: str = "") -> ChatResponse:
         """Non-streaming completion"""
-        async for response in self.stream_complete(messages):
-            return response
+        parts = []
+        async for response in self.stream_complete(messages, config=config, cache_context=cache_context,
+                                                   priority=priority, session=session):
+            parts.append(response.response)
+        return ChatResponse(response="".join(parts), type="text")
 
     async def test_connection(self) -> bool:
         """Test the LLM connection with a simple Hello World prompt"""
         try:
             self.logger.info("Testing LLM connection...")
-            self.logger.debug(f"Using base URL: {self.config.base_url}")
-            self.logger.debug(f"Using model: {self.config.model}")
+            self.logger.debug("Using base URL: %s", self.config.base_url)
+            self.logger.debug("Using model: %s", self.config.model)
             
             messages = [Message(role="user", content="Say 'Hello World'")]
             async for response in self.stream_complete(messages):
-                self.logger.info(f"Received response: {response.response}")
+                self.logger.info("Received response: %s", response.response)
                 return True
                 
         except Exception as e:
-            self.logger.error(f"LLM Test Failed: {str(e)}")
+            self.logger.error("LLM Test Failed: %s", e)
             return False
 
     async def cleanup(self):
-        """Cleanup resources"""
-        if self.session:
-            await self.session.close()
-            self.session = None
+        """Cleanup resources
+
+        The session belongs to the shared pool, which is closed separately.
+        """
+        await self.router.close()
+        self.session = None
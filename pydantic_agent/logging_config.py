@@ -35,4 +35,4 @@ def setup_logging(workspace_path: str):
     root_logger.addHandler(console_handler)
     
     # Log startup message
-    root_logger.info(f"Logging initialized. Debug output will be written to: {log_file}")
+    root_logger.info("Logging initialized. Debug output will be written to: %s", log_file)
@@ -0,0 +1,121 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Dict, List, Optional
+
+TRACE_LOGGER_NAME = "pydantic_agent.trace"
+TIMING_LOGGER_NAME = "pydantic_agent.timing"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def parse_levels(value) -> Dict[str, str]:
+    """Per-logger levels from a dict, JSON object or "name=LEVEL,name=LEVEL" string"""
+    if isinstance(value, str) and value.strip().startswith("{"):
+        value = json.loads(value)
+    if isinstance(value, dict):
+        return {str(name): str(level).upper() for name, level in value.items()}
+    levels = {}
+    for item in str(value or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging(
+    log_file: Optional[str] = None,
+    level: str = "INFO",
+    levels: Optional[Dict[str, str]] = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 3,
+    formatter: Optional[logging.Formatter] = None,
+    console: bool = True,
+    trace_tokens: int = 0,
+    timing_file: Optional[str] = None
+) -> logging.handlers.QueueListener:
+    """Route all logging through a queue to a background writer thread
+
+    Callers only enqueue records; formatting and file/console I/O happen on
+    the listener thread. The file rotates at max_bytes. `levels` overrides
+    the level of individual loggers, e.g. {"pydantic_agent.router": "DEBUG"}.
+    `trace_tokens` > 0 logs every n-th streamed token (see TokenTrace).
+    With `timing_file`, request timelines (one JSON object per line) go to
+    that file instead of the main log.
+    """
+    global _listener
+    stop_logging()
+
+    handlers: List[logging.Handler] = []
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        ))
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        if formatter is not None:
+            handler.setFormatter(formatter)
+    if timing_file:
+        for handler in handlers:
+            handler.addFilter(_Exclude(TIMING_LOGGER_NAME))
+        timing_handler = logging.handlers.RotatingFileHandler(
+            timing_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        timing_handler.addFilter(logging.Filter(TIMING_LOGGER_NAME))
+        timing_handler.setFormatter(logging.Formatter('%(message)s'))
+        handlers.append(timing_handler)
+        logging.getLogger(TIMING_LOGGER_NAME).setLevel(logging.INFO)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level.upper())
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    trace_logger = logging.getLogger(TRACE_LOGGER_NAME)
+    trace_logger.setLevel(logging.DEBUG if trace_tokens > 0 else logging.WARNING)
+    TokenTrace.sample_every = max(trace_tokens, 1)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+class _Exclude(logging.Filter):
+    """Drop the records of one logger and its children"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not super().filter(record)
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
+
+class TokenTrace:
+    """Sampled per-token tracing for streaming loops
+
+    Logs every `sample_every`-th token to the pydantic_agent.trace logger.
+    When tracing is off, each token costs one attribute check.
+    """
+    sample_every = 1
+
+    def __init__(self, label: str):
+        self.label = label
+        self.logger = logging.getLogger(TRACE_LOGGER_NAME)
+        self.enabled = self.logger.isEnabledFor(logging.DEBUG)
+        self.count = 0
+
+    def token(self, text: str):
+        if not self.enabled:
+            return
+        self.count += 1
+        if self.count % self.sample_every == 0:
+            self.logger.debug("%s token #%d: %r", self.label, self.count, text)
@@ -0,0 +1,214 @@
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; covers fast local models up to slow first tokens and long answers
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+# Seconds; queue waits are mostly short, so the buckets start lower
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonic count, e.g. requests served"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Labels, float] = {} if labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. streams in progress"""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, for latency quantiles"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (not cumulative, last is +Inf), sum
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def count(self, **labels) -> int:
+        entry = self.values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total[0])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+class Registry:
+    """Metrics of the process, rendered in the Prometheus text format
+
+    Collectors are called at scrape time and return extra metrics whose
+    values live elsewhere, such as the connection pool counters.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        metrics = list(self.metrics.values())
+        for collector in self.collectors:
+            metrics.extend(collector())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+# Chat requests served by the server
+CHAT_REQUESTS = counter("pydantic_agent_chat_requests_total",
+                        "Chat requests by outcome (completed, error, cancelled, rejected)", ["outcome"])
+ACTIVE_STREAMS = gauge("pydantic_agent_active_streams", "Chat answers streaming right now")
+CHAT_TTFT = histogram("pydantic_agent_chat_ttft_seconds", "Time from a chat request to its first streamed token")
+CHAT_DURATION = histogram("pydantic_agent_chat_duration_seconds", "Time from a chat request to its last event")
+MUX_CONNECTIONS = gauge("pydantic_agent_mux_connections", "Open multiplexed (WebSocket) connections")
+MUX_CREDIT_WAITS = counter("pydantic_agent_mux_credit_waits_total",
+                           "Times a multiplexed stream paused until the client granted credit")
+
+# Requests to the LLM services
+UPSTREAM_REQUESTS = counter("pydantic_agent_upstream_requests_total", "Completion streams opened per endpoint",
+                            ["endpoint"])
+UPSTREAM_TTFT = histogram("pydantic_agent_upstream_ttft_seconds",
+                          "Time to the first token from an endpoint, including retries", ["endpoint"])
+UPSTREAM_DURATION = histogram("pydantic_agent_upstream_duration_seconds",
+                              "Time to stream a whole completion from an endpoint", ["endpoint"])
+UPSTREAM_ERRORS = counter("pydantic_agent_upstream_errors_total",
+                          "Failed upstream attempts by HTTP status or timeout/connection/stream", ["status"])
+UPSTREAM_RETRIES = counter("pydantic_agent_upstream_retries_total",
+                           "Upstream attempts repeated, in place (retry) or on another endpoint (failover)",
+                           ["kind"])
+TOKENS = counter("pydantic_agent_tokens_total", "Tokens (stream chunks) received from LLM services")
+TOKENS_PER_SECOND = histogram("pydantic_agent_tokens_per_second",
+                              "Generation speed of a completion after its first token", buckets=RATE_BUCKETS)
+CACHE_LOOKUPS = counter("pydantic_agent_cache_lookups_total",
+                        "Completion requests by how they were served (hit, miss, coalesced)", ["result"])
+
+# Admission scheduler in front of the LLM services
+SCHEDULER_ACTIVE = gauge("pydantic_agent_scheduler_active", "Upstream requests admitted and running, by priority",
+                         ["priority"])
+SCHEDULER_QUEUED = gauge("pydantic_agent_scheduler_queued", "Requests waiting for admission, by priority",
+                         ["priority"])
+SCHEDULER_WAIT = histogram("pydantic_agent_scheduler_wait_seconds", "Time from a request to its admission",
+                           ["priority"], buckets=WAIT_BUCKETS)
+SCHEDULER_REJECTED = counter("pydantic_agent_scheduler_rejected_total",
+                             "Requests rejected because their priority's queue was full", ["priority"])
+
+# Inline completions
+COMPLETION_REQUESTS = counter("pydantic_agent_completion_requests_total",
+                              "Inline completion requests by outcome "
+                              "(completed, reused, empty, superseded, cancelled, rejected, error)",
+                              ["outcome"])
+COMPLETION_DURATION = histogram("pydantic_agent_completion_duration_seconds",
+                                "Inline completion requests from arrival to answer, debounce included",
+                                buckets=WAIT_BUCKETS)
+
+def _pool_metrics() -> Iterable[_Metric]:
+    # Imported here: the pool module is optional for users of the registry alone
+    from .connection_pool import get_pool
+    stats = get_pool().stats()
+    in_use = Gauge("pydantic_agent_pool_connections_in_use", "Pooled HTTP connections currently in use")
+    in_use.set(stats["in_use"])
+    limit = Gauge("pydantic_agent_pool_connections_limit", "Maximum pooled HTTP connections")
+    limit.set(stats["limit"])
+    connections = Counter("pydantic_agent_pool_connections_total", "HTTP connections by how they were obtained",
+                          ["kind"])
+    connections.inc(stats["connections_created"], kind="created")
+    connections.inc(stats["connections_reused"], kind="reused")
+    return [in_use, limit, connections]
+
+REGISTRY.add_collector(_pool_metrics)
+
+def render(registry: Optional[Registry] = None) -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return (registry or REGISTRY).render()
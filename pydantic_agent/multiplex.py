@@ -0,0 +1,168 @@
+import asyncio
+import json
+from typing import Any, Callable, Dict, Optional
+from aiohttp import web
+from . import metrics
+
+DEFAULT_WINDOW = 64  # Events a stream may send before it needs credit
+
+class CreditWindow:
+    """Events a stream may still send; senders wait while it is exhausted"""
+
+    def __init__(self, credit: int = DEFAULT_WINDOW):
+        self.credit = credit
+        self._available = asyncio.Event()
+        if credit > 0:
+            self._available.set()
+        self.closed = False
+
+    def grant(self, events: int):
+        self.credit += events
+        if self.credit > 0:
+            self._available.set()
+
+    async def acquire(self):
+        """Take one event's credit, waiting for a grant if there is none"""
+        if self.credit <= 0 and not self.closed:
+            metrics.MUX_CREDIT_WAITS.inc()
+            self._available.clear()
+            await self._available.wait()
+        self.credit -= 1
+
+    def close(self):
+        """Release waiting senders, e.g. when the connection closed"""
+        self.closed = True
+        self._available.set()
+
+class MuxStream:
+    """One request stream, written to like an SSE response
+
+    The chat handler writes `data: {...}\\n\\n` events; each one becomes an
+    event frame, sent once the stream has credit.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, stream_id: Any, window: int = DEFAULT_WINDOW,
+                 backlog: Optional[Callable[[], int]] = None):
+        self.ws = ws
+        self.stream_id = stream_id
+        self.credit = CreditWindow(window)
+        self._backlog = backlog
+        self._prefix = '{"id": ' + json.dumps(stream_id) + ', "type": "event", "data": '
+        self.events = 0
+
+    async def write(self, data: bytes):
+        # The payload is already JSON; splice it in rather than parsing it again
+        payload = data.decode('utf-8')
+        if payload.startswith('data: '):
+            payload = payload[6:]
+        payload = payload.rstrip('\n')
+        await self.credit.acquire()
+        if self.ws.closed:
+            raise ConnectionResetError("Connection closed")
+        await self.ws.send_str(self._prefix + payload + '}')
+        self.events += 1
+
+    async def write_eof(self):
+        pass  # The connection sends the end frame once the request returns
+
+    def backlog(self) -> int:
+        """Bytes queued in the connection's transport"""
+        return self._backlog() if self._backlog else 0
+
+    async def end(self, status: int = 200, data: Optional[Any] = None):
+        if self.ws.closed:
+            return
+        frame: Dict[str, Any] = {"id": self.stream_id, "type": "end", "status": status}
+        if data is not None:
+            frame["data"] = data
+        await self.ws.send_str(json.dumps(frame))
+
+class MuxConnection:
+    """Many request streams over one bidirectional connection
+
+    The chat server speaks this protocol over a WebSocket (GET /ws), on TCP or
+    on its Unix socket. Frames are JSON text messages, each tagged with the
+    stream id the client chose for the request.
+
+    Client to server:
+        {"type": "chat", "id": ID, ...}            start a chat stream; the rest is a /chat body
+        {"type": "didOpen" | "didChange" | "didClose", "id": ID, ...}
+                                                   document sync, the rest is a /document/* body
+        {"type": "complete", "id": ID, ...}        inline completion, the rest is a /complete body
+        {"type": "cancel", "id": ID}               stop a stream
+        {"type": "credit", "id": ID, "events": N}  allow N more events on a stream
+
+    Server to client:
+        {"id": ID, "type": "event", "data": {...}}   one event, as in the /chat SSE stream
+        {"id": ID, "type": "end", "status": N, "data": {...}}
+                                                     the last frame of every request; data is
+                                                     the error, document sync or completion
+                                                     answer, if any
+
+    Flow control is per stream: the server sends at most `window` events
+    before it waits for credit frames, so a slow consumer holds back its own
+    stream and not the others on the connection.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, window: int = DEFAULT_WINDOW,
+                 backlog: Optional[Callable[[], int]] = None):
+        self.ws = ws
+        self.window = window
+        self.backlog = backlog
+        self.streams: Dict[Any, MuxStream] = {}
+        self.tasks: Dict[Any, asyncio.Task] = {}
+        self.cancel_hooks: Dict[Any, Callable[[], bool]] = {}
+
+    def open(self, stream_id: Any) -> MuxStream:
+        if stream_id in self.streams:
+            raise ValueError(f"Stream {stream_id} is already open")
+        stream = MuxStream(self.ws, stream_id, self.window, self.backlog)
+        self.streams[stream_id] = stream
+        return stream
+
+    def start(self, stream_id: Any, coroutine, cancel: Optional[Callable[[], bool]] = None) -> asyncio.Task:
+        """Run a stream's request in a task of its own
+
+        `cancel` is tried first by a cancel frame, so the request can stop
+        gracefully; it returns False when there is nothing to stop yet.
+        """
+        task = asyncio.create_task(coroutine)
+        self.tasks[stream_id] = task
+        if cancel is not None:
+            self.cancel_hooks[stream_id] = cancel
+        task.add_done_callback(lambda _: self._finished(stream_id))
+        return task
+
+    def _finished(self, stream_id: Any):
+        self.streams.pop(stream_id, None)
+        self.tasks.pop(stream_id, None)
+        self.cancel_hooks.pop(stream_id, None)
+
+    def grant(self, stream_id: Any, events: int):
+        stream = self.streams.get(stream_id)
+        if stream is not None:
+            stream.credit.grant(events)
+
+    def cancel(self, stream_id: Any) -> bool:
+        stream = self.streams.get(stream_id)
+        if stream is not None:
+            # The client stopped reading; let the last events through without credit
+            stream.credit.close()
+        hook = self.cancel_hooks.get(stream_id)
+        if hook is not None and hook():
+            return True
+        task = self.tasks.get(stream_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def close(self):
+        """Cancel every stream still running, e.g. after the client disconnected"""
+        for stream in self.streams.values():
+            stream.credit.close()
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import logging
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from .symbol_index import MAX_FILE_BYTES, scan_source_files
+
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_CAMEL_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+def _stem(word: str) -> str:
+    """Tiny suffix stripper so retry/retries/retried and handle/handling meet"""
+    if len(word) > 4:
+        if word.endswith(('ies', 'ied')):
+            word = word[:-3] + 'y'
+        elif word.endswith('ing'):
+            word = word[:-3]
+        elif word.endswith('ed'):
+            word = word[:-2]
+        elif word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+            word = word[:-1]
+    if len(word) > 3 and word.endswith('e'):
+        word = word[:-1]
+    return word
+
+# Question words carry no signal in code search (kept in stemmed form)
+_STOPWORDS = {_stem(word) for word in (
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'in', 'is', 'it', 'of', 'on', 'or', 'our', 'self', 'that', 'the', 'this', 'to', 'we', 'what',
+    'when', 'where', 'which', 'who', 'why', 'with', 'you'
+)}
+
+# Identifiers repeat heavily across a codebase, so their terms are memoized
+_TERMS_CACHE: Dict[str, Tuple[str, ...]] = {}
+_TERMS_CACHE_SIZE = 200_000
+
+def _identifier_terms(identifier: str) -> Tuple[str, ...]:
+    terms = _TERMS_CACHE.get(identifier)
+    if terms is None:
+        parts = [p.lower() for p in _CAMEL_RE.findall(identifier)]
+        terms = tuple(_stem(part) for part in parts if len(part) > 1)
+        if len(parts) > 1:
+            terms += (identifier.lower(),)
+        if len(_TERMS_CACHE) >= _TERMS_CACHE_SIZE:
+            _TERMS_CACHE.clear()
+        _TERMS_CACHE[identifier] = terms
+    return terms
+
+def tokenize(text: str) -> List[str]:
+    """Split identifiers on snake/camel case into lowercase, stemmed terms"""
+    terms: List[str] = []
+    for identifier in _IDENTIFIER_RE.findall(text):
+        terms.extend(_identifier_terms(identifier))
+    return terms
+
+class Snippet(BaseModel):
+    """A retrieved chunk of a workspace file"""
+    path: str
+    start_line: int  # 1-based, inclusive
+    end_line: int
+    score: float
+    text: str = ""
+
+class BM25Index:
+    """In-memory BM25 index over fixed-size line chunks of workspace files
+
+    Postings are stored as compact arrays of (chunk id, term frequency).
+    Removing a file only tombstones its chunks; once a quarter of the chunks
+    are dead the live ones are renumbered and the postings and chunk tables
+    rebuilt without the dead. Document frequencies are approximate in
+    between, which is fine for ranking.
+    """
+
+    def __init__(self, root: Optional[str] = None, chunk_lines: int = 40, k1: float = 1.2, b: float = 0.75):
+        self.root = os.path.abspath(root) if root else None
+        self.chunk_lines = chunk_lines
+        self.k1 = k1
+        self.b = b
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._chunks: List[Optional[Tuple[str, int, int]]] = []  # id -> (path, start, end), None when dead
+        self._lengths = array('I')
+        self._files: Dict[str, Tuple[float, int, List[int]]] = {}  # path -> (mtime, size, chunk ids)
+        self._live = 0
+        self._dead = 0  # Dead chunks still referenced by postings
+        self._total_length = 0
+        self.ready = False
+
+    @property
+    def files(self) -> int:
+        return len(self._files)
+
+    @property
+    def chunks(self) -> int:
+        return self._live
+
+    def add_text(self, path: str, text: str, mtime: float = 0.0, size: int = 0):
+        """Index (or re-index) the content of one file"""
+        lines = text.splitlines(keepends=True)
+        # Tokenize outside the lock, it is the expensive part
+        chunked = []
+        for start in range(0, max(len(lines), 1), self.chunk_lines):
+            terms = tokenize("".join(lines[start:start + self.chunk_lines]))
+            if terms:
+                chunked.append((start + 1, min(start + self.chunk_lines, len(lines)), terms))
+        with self._lock:
+            self._remove(path)
+            ids = []
+            for start, end, terms in chunked:
+                chunk_id = len(self._chunks)
+                self._chunks.append((path, start, end))
+                self._lengths.append(len(terms))
+                self._live += 1
+                self._total_length += len(terms)
+                postings_map = self._postings
+                for term, count in Counter(terms).items():
+                    postings = postings_map.get(term)
+                    if postings is None:
+                        postings = postings_map[term] = (array('I'), array('H'))
+                    postings[0].append(chunk_id)
+                    postings[1].append(count if count < 0xFFFF else 0xFFFF)
+                ids.append(chunk_id)
+            self._files[path] = (mtime, size, ids)
+            self._maybe_compact()
+
+    def remove(self, path: str):
+        with self._lock:
+            self._remove(path)
+            self._maybe_compact()
+
+    def _remove(self, path: str):
+        entry = self._files.pop(path, None)
+        if entry is None:
+            return
+        for chunk_id in entry[2]:
+            self._chunks[chunk_id] = None
+            self._live -= 1
+            self._dead += 1
+            self._total_length -= self._lengths[chunk_id]
+
+    def _maybe_compact(self):
+        dead = self._dead
+        if dead < 1000 or dead * 4 < self._live + dead:
+            return
+        # Renumber the live chunks densely so the chunk tables shrink too
+        remap = [-1] * len(self._chunks)
+        chunks: List[Optional[Tuple[str, int, int]]] = []
+        lengths = array('I')
+        for chunk_id, chunk in enumerate(self._chunks):
+            if chunk is not None:
+                remap[chunk_id] = len(chunks)
+                chunks.append(chunk)
+                lengths.append(self._lengths[chunk_id])
+        for term in list(self._postings):
+            ids, tfs = self._postings[term]
+            keep = [(remap[i], tf) for i, tf in zip(ids, tfs) if remap[i] >= 0]
+            if keep:
+                self._postings[term] = (array('I', (i for i, _ in keep)), array('H', (tf for _, tf in keep)))
+            else:
+                del self._postings[term]
+        for path, (mtime, size, ids) in self._files.items():
+            self._files[path] = (mtime, size, [remap[i] for i in ids])
+        self._chunks = chunks
+        self._lengths = lengths
+        self._dead = 0
+        self.logger.debug("Compacted BM25 index, dropped %d dead chunks", dead)
+
+    def update(self, files: Optional[Dict[str, Tuple[float, int]]] = None) -> int:
+        """Index new and changed files under root, drop deleted ones
+
+        `files` is a scan_source_files() result to reuse, so indexes of the
+        same workspace share one walk of it.
+        """
+        if not self.root:
+            return 0
+        if files is None:
+            files = scan_source_files(self.root)
+        indexed = 0
+        for path, (mtime, size) in files.items():
+            known = self._files.get(path)
+            if size > MAX_FILE_BYTES or (known and known[0] == mtime and known[1] == size):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    text = f.read()
+            except OSError:
+                continue
+            self.add_text(path, text, mtime, size)
+            indexed += 1
+        with self._lock:
+            for path in set(self._files) - files.keys():
+                self._remove(path)
+            self._maybe_compact()
+        self.ready = True
+        if indexed:
+            self.logger.info("BM25 index updated: %d files indexed, %d chunks", indexed, self._live)
+        return indexed
+
+    def search(self, query: str, top_k: int = 5, with_text: bool = True) -> List[Snippet]:
+        """Return the top_k chunks for query, best first"""
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t not in _STOPWORDS]
+        with self._lock:
+            if not terms or not self._live:
+                return []
+            n = self._live
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                ids, tfs = postings
+                df = min(len(ids), n)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                k1, b = self.k1, self.b
+                for chunk_id, tf in zip(ids, tfs):
+                    if self._chunks[chunk_id] is None:
+                        continue
+                    norm = k1 * (1 - b + b * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            results = [(self._chunks[chunk_id], score) for chunk_id, score in best]
+        snippets = [Snippet(path=c[0], start_line=c[1], end_line=c[2], score=score) for c, score in results]
+        if with_text:
+            for snippet in snippets:
+                snippet.text = self._read_lines(snippet.path, snippet.start_line, snippet.end_line)
+        return snippets
+
+    @staticmethod
+    def _read_lines(path: str, start: int, end: int) -> str:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                return "".join(itertools.islice(f, start - 1, end))
+        except OSError:
+            return ""
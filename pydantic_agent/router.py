@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Collection, Dict, List, Optional
+import aiohttp
+from pydantic import BaseModel
+from .connection_pool import ConnectionPool, get_pool
+
+class Endpoint(BaseModel):
+    """One OpenAI-compatible backend"""
+    base_url: str
+    api_key: Optional[str] = None  # Defaults to the config's key
+    model: Optional[str] = None  # Defaults to the config's model
+    weight: float = 1.0
+    max_concurrency: Optional[int] = None
+
+class EndpointState:
+    """Live health and latency figures of an endpoint"""
+
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.ttft: Optional[float] = None  # EWMA of seconds to first token
+        self.error_rate = 0.0  # EWMA of failures per request, as of error_rate_at
+        self.error_rate_at = 0.0
+        self.in_flight = 0
+        self.failures = 0  # Consecutive
+        self.ejected = False
+        self.ejected_at = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        cap = self.endpoint.max_concurrency
+        return not self.ejected and (cap is None or self.in_flight < cap)
+
+class EndpointRouter:
+    """Spreads requests across endpoints by latency, load and health
+
+    Each request goes to the available endpoint with the lowest expected
+    wait: EWMA time to first token scaled by requests already in flight and
+    divided by weight, penalized by the EWMA error rate. The error rate
+    halves every `error_half_life` seconds so one bad moment is forgiven.
+    After `eject_after` consecutive failures an endpoint is ejected and
+    probed in the background until it answers again.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        api_key: str = "",
+        alpha: float = 0.3,
+        eject_after: int = 3,
+        probe_interval: float = 10.0,
+        error_half_life: float = 30.0,
+        pool: Optional[ConnectionPool] = None
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.states = [EndpointState(endpoint) for endpoint in endpoints]
+        self.api_key = api_key
+        self.alpha = alpha
+        self.eject_after = eject_after
+        self.probe_interval = probe_interval
+        self.error_half_life = error_half_life
+        self.pool = pool or get_pool()
+        self.logger = logging.getLogger(__name__)
+        self._changed: Optional[asyncio.Condition] = None
+        self._prober: Optional[asyncio.Task] = None
+
+    def error_rate(self, state: EndpointState) -> float:
+        if not state.error_rate:
+            return 0.0
+        return state.error_rate * 0.5 ** ((time.monotonic() - state.error_rate_at) / self.error_half_life)
+
+    def _score(self, state: EndpointState, default_ttft: float) -> float:
+        ttft = state.ttft if state.ttft is not None else default_ttft
+        penalty = max(1.0 - self.error_rate(state), 0.05)
+        return ttft * (state.in_flight + 1) / max(state.endpoint.weight, 1e-6) / penalty
+
+    def pick(self, exclude: Collection[EndpointState] = ()) -> Optional[EndpointState]:
+        """The best available endpoint, or None when all are busy or ejected
+
+        Endpoints in `exclude` (those a request already failed on) are only
+        picked when no other one is available.
+        """
+        available = [state for state in self.states if state.available]
+        candidates = [state for state in available if state not in exclude] or available
+        if not candidates:
+            return None
+        known = [state.ttft for state in self.states if state.ttft is not None]
+        # Unmeasured endpoints are assumed average so they get tried early
+        default_ttft = sum(known) / len(known) if known else 1.0
+        return min(candidates, key=lambda state: self._score(state, default_ttft))
+
+    @asynccontextmanager
+    async def acquire(self, exclude: Collection[EndpointState] = (),
+                      deadline: Optional[float] = None) -> AsyncIterator[EndpointState]:
+        """Reserve an endpoint for one request, waiting while all are at capacity
+
+        `exclude` is passed to pick(). Waiting ends at `deadline` (event loop
+        time) with asyncio.TimeoutError.
+        """
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        loop = asyncio.get_running_loop()
+        async with self._changed:
+            while True:
+                state = self.pick(exclude)
+                if state is not None:
+                    break
+                if all(s.ejected for s in self.states):
+                    # Better to try the longest-ejected endpoint than to fail outright
+                    untried = [s for s in self.states if s not in exclude] or self.states
+                    state = min(untried, key=lambda s: s.ejected_at)
+                    break
+                if deadline is None:
+                    await self._changed.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self._changed.wait(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    raise asyncio.TimeoutError("No endpoint became free within the request's time budget") from None
+            state.in_flight += 1
+            state.requests += 1
+        try:
+            yield state
+        finally:
+            state.in_flight -= 1
+            async with self._changed:
+                self._changed.notify_all()
+
+    def record_success(self, state: EndpointState, ttft: float):
+        state.ttft = ttft if state.ttft is None else self.alpha * ttft + (1 - self.alpha) * state.ttft
+        state.error_rate = self.error_rate(state) * (1 - self.alpha)
+        state.error_rate_at = time.monotonic()
+        state.failures = 0
+        if state.ejected:
+            self._readmit(state)
+
+    def record_failure(self, state: EndpointState):
+        state.errors += 1
+        state.error_rate = self.alpha + (1 - self.alpha) * self.error_rate(state)
+        state.error_rate_at = time.monotonic()
+        state.failures += 1
+        if not state.ejected and state.failures >= self.eject_after and len(self.states) > 1:
+            state.ejected = True
+            state.ejected_at = time.monotonic()
+            self.logger.warning("Ejecting endpoint %s after %d failures", state.endpoint.base_url, state.failures)
+            self._start_prober()
+
+    def _readmit(self, state: EndpointState):
+        state.ejected = False
+        state.failures = 0
+        state.error_rate = self.error_rate(state) / 2
+        state.error_rate_at = time.monotonic()
+        self.logger.info("Endpoint %s is healthy again", state.endpoint.base_url)
+        if self._changed is not None:
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _start_prober(self):
+        if self._prober is None or self._prober.done():
+            self._prober = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        """Probe ejected endpoints until none are left"""
+        while any(state.ejected for state in self.states):
+            await asyncio.sleep(self.probe_interval)
+            for state in [s for s in self.states if s.ejected]:
+                if await self._probe(state):
+                    self._readmit(state)
+
+    async def _probe(self, state: EndpointState) -> bool:
+        endpoint = state.endpoint
+        session = await self.pool.get_session()
+        try:
+            async with session.get(
+                f"{endpoint.base_url.rstrip('/')}/models",
+                headers={"Authorization": f"Bearer {(endpoint.api_key or self.api_key).strip()}"},
+                timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                return response.status == 200
+        except Exception as e:
+            self.logger.debug("Probe of %s failed: %s", endpoint.base_url, e)
+            return False
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "base_url": state.endpoint.base_url,
+                "ttft": state.ttft,
+                "error_rate": round(self.error_rate(state), 4),
+                "in_flight": state.in_flight,
+                "requests": state.requests,
+                "errors": state.errors,
+                "ejected": state.ejected
+            }
+            for state in self.states
+        ]
+
+    async def close(self):
+        if self._prober is not None:
+            self._prober.cancel()
+            try:
+                await self._prober
+            except asyncio.CancelledError:
+                pass
+            self._prober = None
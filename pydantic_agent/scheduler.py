@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import logging
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Deque, Dict, Optional, Union
+from . import metrics
+from .timing import current_timer
+
+class Priority(IntEnum):
+    """Request classes, most urgent first"""
+    INTERACTIVE = 0  # Chat answers someone is waiting for
+    COMPLETION = 1  # Inline completions, dropped when stale
+    BACKGROUND = 2  # analyze and other work nobody watches
+
+class AdmissionRejected(Exception):
+    """The queue for a priority class is full; retry later"""
+
+    def __init__(self, priority: Priority, queued: int):
+        super().__init__(f"LLM service busy: {queued} {priority.name.lower()} requests already queued")
+        self.priority = priority
+        self.queued = queued
+
+class Ticket:
+    """A request's place in the scheduler; promote() can raise its class until it is admitted"""
+
+    def __init__(self, priority: Priority = Priority.INTERACTIVE, session: str = ""):
+        self.priority = priority
+        self.session = session
+        self.waiter: Optional[asyncio.Future] = None  # While queued
+        self.admitted = False
+
+class AdmissionScheduler:
+    """Admits LLM requests up to a global concurrency limit, by priority class
+
+    Waiting requests are admitted strictly by priority. Within a class,
+    sessions take turns, so one session's burst does not starve the others.
+    `class_limits` caps the slots a class may hold at once (by default
+    background work gets half), which leaves room for interactive requests
+    that arrive while long background generations run. Each class queues at
+    most `max_queued` requests; beyond that admit() raises AdmissionRejected
+    at once instead of adding to a wait nobody wants.
+    """
+
+    def __init__(self, max_concurrency: int = 20, max_queued: Union[int, Dict[Priority, int]] = 64,
+                 class_limits: Optional[Dict[Priority, int]] = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        if isinstance(max_queued, int):
+            max_queued = {priority: max_queued for priority in Priority}
+        self.max_queued = max_queued
+        self.class_limits = {priority: max_concurrency for priority in Priority}
+        self.class_limits[Priority.BACKGROUND] = max(1, max_concurrency // 2)
+        self.class_limits.update(class_limits or {})
+        self.active = 0
+        self.active_by_class = {priority: 0 for priority in Priority}
+        # Per class: session -> its waiters in arrival order; sessions in turn order
+        self._queues: Dict[Priority, "collections.OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: collections.OrderedDict() for priority in Priority
+        }
+        self.queued = {priority: 0 for priority in Priority}
+        self.logger = logging.getLogger(__name__)
+
+    def saturated(self, priority: Priority = Priority.INTERACTIVE) -> bool:
+        """Whether a request of this class would be rejected right now"""
+        return self.queued[priority] >= self.max_queued.get(priority, 0) and not self._can_run(priority)
+
+    def _can_run(self, priority: Priority) -> bool:
+        return self.active < self.max_concurrency and self.active_by_class[priority] < self.class_limits[priority]
+
+    def _take(self, priority: Priority):
+        self.active += 1
+        self.active_by_class[priority] += 1
+        metrics.SCHEDULER_ACTIVE.set(self.active_by_class[priority], priority=priority.name.lower())
+
+    def _release(self, priority: Priority):
+        self.active -= 1
+        self.active_by_class[priority] -= 1
+        metrics.SCHEDULER_ACTIVE.set(self.active_by_class[priority], priority=priority.name.lower())
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to waiters: highest class first, sessions in turn"""
+        for priority in Priority:
+            queue = self._queues[priority]
+            while queue and self._can_run(priority):
+                session, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(session)
+                else:
+                    del queue[session]
+                self._set_queued(priority, self.queued[priority] - 1)
+                if waiter.cancelled():
+                    continue
+                self._take(priority)
+                waiter.set_result(None)
+
+    def _set_queued(self, priority: Priority, queued: int):
+        self.queued[priority] = queued
+        metrics.SCHEDULER_QUEUED.set(queued, priority=priority.name.lower())
+
+    @asynccontextmanager
+    async def admit(self, priority: Priority = Priority.INTERACTIVE, session: str = "",
+                    ticket: Optional[Ticket] = None) -> AsyncIterator[None]:
+        """Hold one slot for the duration of an upstream request
+
+        With a ticket, its priority and session are used instead, and the
+        request can be promoted while it waits.
+        """
+        if ticket is None:
+            ticket = Ticket(priority, session)
+        priority, session = ticket.priority, ticket.session
+        started = time.perf_counter()
+        if self._can_run(priority) and not any(self._queues[p] for p in Priority if p <= priority):
+            self._take(priority)
+        else:
+            if self.queued[priority] >= self.max_queued.get(priority, 0):
+                metrics.SCHEDULER_REJECTED.inc(priority=priority.name.lower())
+                raise AdmissionRejected(priority, self.queued[priority])
+            waiter = ticket.waiter = asyncio.get_running_loop().create_future()
+            self._queues[priority].setdefault(session, collections.deque()).append(waiter)
+            self._set_queued(priority, self.queued[priority] + 1)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # promote() may have moved the waiter to another class
+                if waiter.done() and not waiter.cancelled():
+                    # Admitted just as the caller gave up; pass the slot on
+                    self._release(ticket.priority)
+                else:
+                    self._forget(ticket.priority, session, waiter)
+                raise
+            finally:
+                ticket.waiter = None
+            priority = ticket.priority
+        ticket.admitted = True
+        waited = time.perf_counter() - started
+        metrics.SCHEDULER_WAIT.observe(waited, priority=priority.name.lower())
+        timer = current_timer.get()
+        if timer is not None and waited > 0.0005:
+            timer.add("scheduler.wait", started, started + waited)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def promote(self, ticket: Ticket, priority: Priority):
+        """Raise a request's class, e.g. when a more urgent request joins it
+
+        A queued request moves to the back of its session's queue in the new
+        class; one not queued yet is admitted in that class. An admitted
+        request keeps the slot it holds.
+        """
+        if ticket.admitted or priority >= ticket.priority:
+            return
+        waiter = ticket.waiter
+        if waiter is None:
+            ticket.priority = priority
+            return
+        if waiter.done():
+            return  # Already given a slot in its old class
+        self._forget(ticket.priority, ticket.session, waiter)
+        ticket.priority = priority
+        self._queues[priority].setdefault(ticket.session, collections.deque()).append(waiter)
+        self._set_queued(priority, self.queued[priority] + 1)
+        self.logger.debug("Promoted a queued request of session %r to %s", ticket.session, priority.name.lower())
+        self._dispatch()
+
+    def _forget(self, priority: Priority, session: str, waiter: asyncio.Future):
+        waiters = self._queues[priority].get(session)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self._queues[priority][session]
+        self._set_queued(priority, self.queued[priority] - 1)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            priority.name.lower(): {
+                "active": self.active_by_class[priority],
+                "queued": self.queued[priority],
+                "limit": self.class_limits[priority]
+            }
+            for priority in Priority
+        }
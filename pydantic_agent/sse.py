@@ -0,0 +1,191 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # Optional speedup, the stdlib decoder works the same
+    loads = json.loads
+
+class SSEEvent(NamedTuple):
+    """One dispatched server-sent event; data stays bytes until decoded"""
+    data: bytes
+    event: str = "message"
+    id: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return self.data.decode('utf-8', errors='replace')
+
+class SSEParser:
+    """Incremental parser for the text/event-stream format
+
+    Feed it raw bytes as they arrive, in chunks of any size; it returns the
+    events completed so far. Handles CR, LF and CRLF line endings (also split
+    across chunks), multi-line data fields, comments, event/id/retry fields
+    and a leading BOM, following the WHATWG event stream grammar.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[bytes] = []
+        self._event = ""
+        self._started = False
+        self.last_event_id: Optional[str] = None
+        self.retry: Optional[int] = None  # Reconnection time requested by the server, in ms
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Parse chunk and return the events it completed"""
+        if self._buffer:
+            chunk = self._buffer + chunk
+            self._buffer = b""
+        if not self._started and chunk:
+            if len(chunk) < 3 and b"\xef\xbb\xbf".startswith(chunk):
+                self._buffer = chunk  # Could still be a BOM
+                return []
+            if chunk.startswith(b"\xef\xbb\xbf"):
+                chunk = chunk[3:]
+            self._started = True
+        events: List[SSEEvent] = []
+        lines = chunk.splitlines(keepends=True)
+        if lines:
+            last = lines[-1]
+            # An unterminated line, or a CR that may be the first half of CRLF,
+            # waits for the next chunk
+            if last[-1:] == b"\r" or last[-1:] != b"\n":
+                self._buffer = lines.pop()
+        for line in lines:
+            self._line(line.rstrip(b"\r\n"), events)
+        return events
+
+    def close(self) -> List[SSEEvent]:
+        """Flush at end of stream; a final event without its blank line is dropped, per spec"""
+        events: List[SSEEvent] = []
+        if self._buffer:
+            self._line(self._buffer.rstrip(b"\r\n"), events)
+            self._buffer = b""
+        self._data = []
+        self._event = ""
+        return events
+
+    def _line(self, line: bytes, events: List[SSEEvent]):
+        if not line:
+            if self._data:
+                data = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+                events.append(SSEEvent(data, self._event or "message", self.last_event_id))
+                self._data = []
+            self._event = ""
+            return
+        if line[0] == 0x3A:  # ':' starts a comment
+            return
+        field, colon, value = line.partition(b":")
+        if colon and value[:1] == b" ":
+            value = value[1:]
+        if field == b"data":
+            self._data.append(value)
+        elif field == b"event":
+            self._event = value.decode('utf-8', errors='replace')
+        elif field == b"id":
+            if b"\0" not in value:
+                self.last_event_id = value.decode('utf-8', errors='replace')
+        elif field == b"retry":
+            if value.isdigit():
+                self.retry = int(value)
+
+class SSECoalescer:
+    """Batches streamed text into fewer outbound SSE chunk events
+
+    The first piece is sent at once so time to first token is unaffected.
+    Later pieces are held until `window` seconds after the oldest unsent one
+    or until `max_bytes` are buffered. The window adapts to the client: it
+    doubles (up to `max_window`) while writes are slow or the transport has
+    a backlog, and shrinks back towards the configured window when they are
+    fast. A window of 0 sends every piece as its own event.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[bytes], Awaitable[None]],
+        window: float = 0.02,
+        max_bytes: int = 4096,
+        max_window: float = 0.25,
+        backlog: Optional[Callable[[], int]] = None
+    ):
+        self._write = write
+        self.base_window = window
+        self.window = window
+        self.max_window = max(max_window, window)
+        self.max_bytes = max_bytes
+        self._backlog = backlog  # Bytes queued in the transport, if known
+        self._parts: List[str] = []
+        self._size = 0
+        self._sent_first = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timed_flush: Optional[asyncio.Future] = None
+        self._lock = asyncio.Lock()
+        self.pieces = 0
+        self.events = 0
+
+    async def add(self, text: str):
+        """Queue text, sending it now if the window or size limit says so"""
+        if self._timed_flush is not None and self._timed_flush.done():
+            # Surface a failed background flush (e.g. the client went away)
+            timed_flush, self._timed_flush = self._timed_flush, None
+            timed_flush.result()
+        self.pieces += 1
+        self._parts.append(text)
+        self._size += len(text)
+        if not self._sent_first or self.window <= 0 or self._size >= self.max_bytes:
+            self._sent_first = True
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._timed_flush = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Send everything queued as one event"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._parts:
+                return
+            text = self._parts[0] if len(self._parts) == 1 else "".join(self._parts)
+            self._parts = []
+            self._size = 0
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await self._write(f"data: {json.dumps({'type': 'chunk', 'content': text})}\n\n".encode('utf-8'))
+            self.events += 1
+            self._adapt(loop.time() - started)
+
+    def _adapt(self, write_time: float):
+        if self.base_window <= 0:
+            return
+        backlog = self._backlog() if self._backlog else 0
+        if write_time > self.window / 2 or backlog > self.max_bytes:
+            self.window = min(self.window * 2, self.max_window)
+        else:
+            self.window = max(self.window * 0.8, self.base_window)
+
+    def discard(self):
+        """Drop unsent text and stop pending flushes, e.g. when the stream is cancelled"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._timed_flush is not None:
+            self._timed_flush.cancel()
+            self._timed_flush = None
+        self._parts = []
+        self._size = 0
+
+    async def close(self):
+        """Flush what is left and wait for any background flush"""
+        await self.flush()
+        if self._timed_flush is not None:
+            timed_flush, self._timed_flush = self._timed_flush, None
+            await timed_flush
@@ -0,0 +1,256 @@
+import ast
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from pydantic import BaseModel
+
+SOURCE_EXTENSIONS = {
+    '.py', '.pyi', '.js', '.jsx', '.ts', '.tsx', '.java', '.kt', '.go', '.rs', '.c', '.h',
+    '.cc', '.cpp', '.hpp', '.cs', '.rb', '.php', '.swift', '.scala', '.lua'
+}
+SKIP_DIRS = {'node_modules', '__pycache__', 'venv', 'env', 'out', 'dist', 'build', 'target'}
+MAX_FILE_BYTES = 1024 * 1024
+
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_DEFINITION_RE = re.compile(
+    r'^\s*(?:export\s+)?(?:default\s+)?(?:pub(?:\([^)]*\))?\s+)?(?:public\s+|private\s+|protected\s+|static\s+|async\s+|abstract\s+)*'
+    r'(function|class|interface|type|struct|enum|trait|impl|fn|func|def|const|let|var)\s+\*?\s*([A-Za-z_][A-Za-z0-9_]*)'
+)
+_KEYWORDS = {
+    'if', 'else', 'for', 'while', 'return', 'import', 'from', 'def', 'class', 'self', 'None', 'True',
+    'False', 'and', 'or', 'not', 'in', 'is', 'with', 'as', 'try', 'except', 'finally', 'raise', 'pass',
+    'async', 'await', 'lambda', 'yield', 'const', 'let', 'var', 'function', 'new', 'this', 'null',
+    'undefined', 'true', 'false', 'export', 'public', 'private', 'static', 'void', 'int', 'str'
+}
+
+def iter_source_files(root: str) -> Iterable[str]:
+    """Walk root for source files, skipping hidden and build/dependency dirs"""
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d not in SKIP_DIRS]
+        for filename in filenames:
+            if os.path.splitext(filename)[1] in SOURCE_EXTENSIONS:
+                yield os.path.join(directory, filename)
+
+def scan_source_files(root: str) -> Dict[str, Tuple[float, int]]:
+    """(mtime, size) of every source file under root, from one walk"""
+    files = {}
+    for path in iter_source_files(root):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files[path] = (stat.st_mtime, stat.st_size)
+    return files
+
+class Symbol(BaseModel):
+    """A definition found in the workspace"""
+    name: str
+    kind: str
+    path: str
+    line: int  # 1-based
+    signature: str
+
+def _python_symbols(source: str) -> Tuple[List[Tuple[str, str, int, str]], Set[str]]:
+    """Definitions and referenced names of a Python module"""
+    tree = ast.parse(source)
+    lines = source.splitlines()
+    definitions = []
+    references = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            kind = 'class' if isinstance(node, ast.ClassDef) else 'function'
+            # The header may span several lines, stop at the first body statement
+            end = node.body[0].lineno - 1 if node.body else node.lineno
+            header = " ".join(line.strip() for line in lines[node.lineno - 1:max(end, node.lineno)])
+            definitions.append((node.name, kind, node.lineno, header.rstrip(':').strip()))
+        elif isinstance(node, ast.Assign) and node.col_offset == 0:
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    definitions.append((target.id, 'variable', node.lineno, lines[node.lineno - 1].strip()))
+        elif isinstance(node, ast.Name):
+            references.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            references.add(node.attr)
+    return definitions, references
+
+def _generic_symbols(source: str) -> Tuple[List[Tuple[str, str, int, str]], Set[str]]:
+    """Definitions and referenced names found by a lightweight tokenizer"""
+    definitions = []
+    for number, line in enumerate(source.splitlines(), 1):
+        match = _DEFINITION_RE.match(line)
+        # Variables only count as definitions at the top level, not as function locals
+        if match and not (match.group(1) in ('const', 'let', 'var') and line[:1].isspace()):
+            definitions.append((match.group(2), match.group(1), number, line.strip().rstrip('{').strip()))
+    references = set(_IDENTIFIER_RE.findall(source)) - _KEYWORDS
+    return definitions, references
+
+def parse_symbols(path: str, source: str) -> Tuple[List[Tuple[str, str, int, str]], Set[str]]:
+    """Extract (name, kind, line, signature) definitions and referenced names"""
+    if path.endswith(('.py', '.pyi')):
+        try:
+            return _python_symbols(source)
+        except SyntaxError:
+            pass  # Mid-edit files still get the tokenizer treatment
+    return _generic_symbols(source)
+
+class SymbolIndex:
+    """Incremental index of workspace definitions and references
+
+    The index lives in an SQLite file that is memory-mapped for reads, so a
+    restart reuses it and only files whose size, mtime or content hash
+    changed are parsed again.
+    """
+
+    def __init__(self, root: str, db_path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        if db_path is None:
+            digest = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:12]
+            cache_dir = Path(tempfile.gettempdir()) / 'pydantic_agent'
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            db_path = str(cache_dir / f'symbols-{digest}.db')
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # Updates run in a worker thread while lookups come from the event loop
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA mmap_size = 268435456;
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, hash TEXT);
+            CREATE TABLE IF NOT EXISTS symbols (name TEXT, kind TEXT, path TEXT, line INTEGER, signature TEXT);
+            CREATE TABLE IF NOT EXISTS refs (name TEXT, path TEXT);
+            CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+            CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path);
+            CREATE INDEX IF NOT EXISTS refs_name ON refs (name);
+            CREATE INDEX IF NOT EXISTS refs_path ON refs (path);
+        """)
+
+    def update(self, files: Optional[Dict[str, Tuple[float, int]]] = None) -> int:
+        """Bring the index up to date with the workspace; returns files parsed
+
+        `files` is a scan_source_files() result to reuse instead of walking root again.
+        """
+        if files is None:
+            files = scan_source_files(self.root)
+        with self._lock:
+            known: Dict[str, Tuple[float, int, str]] = {
+                path: (mtime, size, digest)
+                for path, mtime, size, digest in self._db.execute("SELECT path, mtime, size, hash FROM files")
+            }
+        parsed = 0
+        for path, (mtime, size) in files.items():
+            entry = known.get(path)
+            if size > MAX_FILE_BYTES or (entry and entry[0] == mtime and entry[1] == size):
+                continue
+            # Lock per file so lookups are never stuck behind a full scan
+            with self._lock:
+                if self._update_file(path, entry):
+                    parsed += 1
+                    if parsed % 200 == 0:
+                        self._db.commit()
+        with self._lock:
+            for path in known.keys() - files.keys():
+                self._remove(path)
+            self._db.commit()
+        if parsed:
+            self.logger.info("Symbol index updated: %d files parsed, %d files tracked", parsed, len(files))
+        return parsed
+
+    def update_file(self, path: str, source: Optional[str] = None) -> bool:
+        """Re-index one file, optionally from unsaved editor content"""
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self._db.execute("SELECT mtime, size, hash FROM files WHERE path = ?", (path,)).fetchone()
+            if source is not None:
+                changed = self._store(path, 0.0, len(source), source, row)
+            elif os.path.exists(path):
+                changed = self._update_file(path, row)
+            else:
+                self._remove(path)
+                changed = True
+            self._db.commit()
+        return changed
+
+    def _update_file(self, path: str, known: Optional[Tuple[float, int, str]]) -> bool:
+        try:
+            stat = os.stat(path)
+            if stat.st_size > MAX_FILE_BYTES:
+                return False
+            if known and known[0] == stat.st_mtime and known[1] == stat.st_size:
+                return False
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                source = f.read()
+        except OSError as e:
+            self.logger.debug("Skipping %s: %s", path, e)
+            return False
+        return self._store(path, stat.st_mtime, stat.st_size, source, known)
+
+    def _store(self, path: str, mtime: float, size: int, source: str,
+               known: Optional[Tuple[float, int, str]]) -> bool:
+        digest = hashlib.sha1(source.encode('utf-8', errors='replace')).hexdigest()
+        if known and known[2] == digest:
+            # Touched but unchanged, only refresh the stat data
+            self._db.execute("UPDATE files SET mtime = ?, size = ? WHERE path = ?", (mtime, size, path))
+            return False
+        definitions, references = parse_symbols(path, source)
+        self._remove(path)
+        self._db.execute("INSERT INTO files VALUES (?, ?, ?, ?)", (path, mtime, size, digest))
+        self._db.executemany(
+            "INSERT INTO symbols VALUES (?, ?, ?, ?, ?)",
+            [(name, kind, path, line, signature) for name, kind, line, signature in definitions]
+        )
+        self._db.executemany("INSERT INTO refs VALUES (?, ?)", [(name, path) for name in references])
+        return True
+
+    def _remove(self, path: str):
+        self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+        self._db.execute("DELETE FROM symbols WHERE path = ?", (path,))
+        self._db.execute("DELETE FROM refs WHERE path = ?", (path,))
+
+    def find_definitions(self, name: str, limit: int = 10) -> List[Symbol]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, kind, path, line, signature FROM symbols WHERE name = ? LIMIT ?", (name, limit)
+            ).fetchall()
+        return [Symbol(name=r[0], kind=r[1], path=r[2], line=r[3], signature=r[4]) for r in rows]
+
+    def find_references(self, name: str, limit: int = 50) -> List[str]:
+        """Paths of files that use name"""
+        with self._lock:
+            rows = self._db.execute("SELECT path FROM refs WHERE name = ? LIMIT ?", (name, limit)).fetchall()
+        return [r[0] for r in rows]
+
+    def definitions_for(self, text: str, exclude_path: Optional[str] = None, limit: int = 20) -> List[Symbol]:
+        """Definitions of the identifiers used in text, in order of first use"""
+        names = list(dict.fromkeys(n for n in _IDENTIFIER_RE.findall(text) if n not in _KEYWORDS))
+        if not names:
+            return []
+        exclude_path = os.path.abspath(exclude_path) if exclude_path else ""
+        found: Dict[str, List[Symbol]] = {}
+        with self._lock:
+            # SQLite caps the number of bound parameters, look names up in batches
+            for start in range(0, len(names), 500):
+                batch = names[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT name, kind, path, line, signature FROM symbols WHERE name IN ({','.join('?' * len(batch))}) AND path != ?",
+                    (*batch, exclude_path)
+                ).fetchall()
+                for r in rows:
+                    found.setdefault(r[0], []).append(Symbol(name=r[0], kind=r[1], path=r[2], line=r[3], signature=r[4]))
+        symbols = []
+        for name in names:
+            symbols.extend(found.get(name, [])[:2])
+            if len(symbols) >= limit:
+                break
+        return symbols[:limit]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
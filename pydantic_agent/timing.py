@@ -0,0 +1,126 @@
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import io
+import pstats
+import time
+from typing import Any, Dict, List, Optional
+
+class RequestTimer:
+    """Timeline of the phases of one request
+
+    Spans are recorded with their start offset and duration in seconds
+    relative to the creation of the timer. The timer of the current request
+    is found through `current_timer`, so library code can add spans without
+    having it passed down.
+    """
+
+    def __init__(self, request_id: str = ""):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def add(self, name: str, start: float, end: float):
+        """Record a span from perf_counter values"""
+        self.spans.append({"name": name, "start": start - self.started, "duration": end - start})
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The timeline in milliseconds, as sent to the client and the trace log"""
+        return {
+            "requestId": self.request_id,
+            "totalMs": round(self.elapsed() * 1000, 3),
+            "spans": [
+                {"name": span["name"], "startMs": round(span["start"] * 1000, 3),
+                 "durationMs": round(span["duration"] * 1000, 3)}
+                for span in self.spans
+            ]
+        }
+
+current_timer: contextvars.ContextVar[Optional[RequestTimer]] = contextvars.ContextVar("current_timer", default=None)
+
+@contextlib.contextmanager
+def span(name: str):
+    """Record a span on the current request's timer, if there is one"""
+    timer = current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.span(name):
+        yield
+
+class RequestProfiler:
+    """cProfile over the next N requests, armed on demand
+
+    The profiler runs from the start of the first armed request until the
+    last one finishes. The event loop is single-threaded, so anything else
+    it runs meanwhile is part of the profile too.
+    """
+
+    def __init__(self, limit: int = 60):
+        self.limit = limit  # Functions in the report
+        self.remaining = 0
+        self.active = 0
+        self.profiled = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._done = asyncio.Event()
+        self.report: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self.remaining > 0 or self.active > 0
+
+    def arm(self, requests: int):
+        """Profile the next `requests` requests, replacing any earlier report"""
+        if requests < 1:
+            raise ValueError("requests must be at least 1")
+        if self.running:
+            raise ValueError("A profile is already being recorded")
+        self.remaining = requests
+        self.profiled = 0
+        self.report = None
+        self._done = asyncio.Event()
+
+    def start_request(self) -> bool:
+        """Called when a request starts; returns whether it is profiled"""
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        self.active += 1
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return True
+
+    def end_request(self):
+        """Called when a profiled request finishes"""
+        self.active -= 1
+        self.profiled += 1
+        if self.active == 0 and self.remaining == 0 and self._profile is not None:
+            self._profile.disable()
+            output = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=output)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.limit)
+            self.report = output.getvalue()
+            self._profile = None
+            self._done.set()
+
+    async def wait(self, timeout: float) -> Optional[str]:
+        """The report, waiting up to timeout seconds for the profiled requests"""
+        if self.report is None and self.running:
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.report
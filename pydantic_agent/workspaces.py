@@ -0,0 +1,195 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from typing import Dict, Iterator, Optional, Set
+from .context_builder import ContextBuilder
+from .documents import DocumentStore
+from .retrieval import BM25Index
+from .symbol_index import SymbolIndex, scan_source_files
+
+DEFAULT_REFRESH_INTERVAL = 30  # Seconds between index refreshes
+DEFAULT_CLIENT_LEASE = 90  # Seconds a client stays attached without a heartbeat
+
+logger = logging.getLogger(__name__)
+
+class Workspace:
+    """Indexes and context builder of one workspace folder, shared by the windows that have it open"""
+
+    def __init__(self, folder: Optional[str], max_tokens: int = 4000):
+        self.folder = folder
+        self.symbol_index: Optional[SymbolIndex] = None
+        self.retrieval_index: Optional[BM25Index] = None
+        if folder and os.path.isdir(folder):
+            self.symbol_index = SymbolIndex(folder)
+            self.retrieval_index = BM25Index(folder)
+            logger.info("Symbol index for %s stored in %s", folder, self.symbol_index.db_path)
+        self.context_builder = ContextBuilder(max_tokens=max_tokens, symbol_index=self.symbol_index)
+        self.clients: Set[str] = set()
+        self._refresher: Optional[asyncio.Task] = None
+        self._updating: Optional[asyncio.Future] = None  # The index update running in the executor
+        self._users = 0  # Requests using the indexes, see in_use()
+        self._released: Optional[asyncio.Event] = None  # Set when the last of them is done
+
+    @contextlib.contextmanager
+    def in_use(self) -> Iterator["Workspace"]:
+        """Keep the indexes open while a request reads them; close() waits for it"""
+        self._users += 1
+        try:
+            yield self
+        finally:
+            self._users -= 1
+            if not self._users and self._released is not None:
+                self._released.set()
+
+    def _update_indexes(self):
+        """Walk the folder once and bring both indexes up to date from that scan"""
+        files = scan_source_files(self.folder)
+        for index in (self.symbol_index, self.retrieval_index):
+            try:
+                index.update(files)
+            except Exception as e:
+                logger.error("%s update of %s failed: %s", type(index).__name__, self.folder, e, exc_info=True)
+
+    async def _refresh(self, interval: float):
+        """Keep the indexes current, parsing off the event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._updating = loop.run_in_executor(None, self._update_indexes)
+            try:
+                # Shielded: cancelling the refresher cannot stop the thread, close() waits for it
+                await asyncio.shield(self._updating)
+            except Exception as e:
+                logger.error("Index update of %s failed: %s", self.folder, e, exc_info=True)
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = DEFAULT_REFRESH_INTERVAL):
+        """Start refreshing the indexes in the background"""
+        if self.symbol_index is not None and self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh(interval))
+
+    async def close(self):
+        """Stop refreshing and close the indexes once the running update and requests are done"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+        if self._updating is not None:
+            try:
+                await self._updating
+            except Exception:
+                pass  # Logged by _refresh, or of no interest once closing
+            self._updating = None
+        while self._users:
+            if self._released is None:
+                self._released = asyncio.Event()
+            self._released.clear()
+            await self._released.wait()
+        if self.symbol_index is not None:
+            self.symbol_index.close()
+
+class Client:
+    """One attached editor window: its workspace and the documents it synced"""
+
+    def __init__(self, client_id: str, workspace: Workspace):
+        self.client_id = client_id
+        self.workspace = workspace
+        self.documents = DocumentStore()
+        self.last_seen = time.monotonic()
+
+class WorkspaceRegistry:
+    """Workspaces by folder, reference counted by the clients attached to them
+
+    A workspace is created when the first client attaches to its folder and
+    closed when the last one detaches, or stops sending heartbeats for
+    `lease` seconds. Requests without a client id use the default workspace.
+    """
+
+    def __init__(self, default: Workspace, max_tokens: int = 4000, lease: float = DEFAULT_CLIENT_LEASE,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.default = default
+        self.default_documents = DocumentStore()
+        self.max_tokens = max_tokens
+        self.lease = lease
+        self.refresh_interval = refresh_interval
+        self.workspaces: Dict[str, Workspace] = {}
+        self.clients: Dict[str, Client] = {}
+        self.idle_since: Optional[float] = time.monotonic()  # When the last client left
+        self._closing: Set[asyncio.Task] = set()  # Workspaces closing after their last client left
+
+    @staticmethod
+    def _key(folder: Optional[str]) -> str:
+        return os.path.normcase(os.path.abspath(folder)) if folder else ""
+
+    def attach(self, client_id: str, folder: Optional[str]) -> Workspace:
+        """Attach client_id to folder's workspace, or refresh its lease if already attached"""
+        key = self._key(folder)
+        client = self.clients.get(client_id)
+        if client is not None and self._key(client.workspace.folder) == key:
+            client.last_seen = time.monotonic()
+            return client.workspace
+        if client is not None:
+            self.detach(client_id)
+        workspace = self.workspaces.get(key)
+        if workspace is None:
+            workspace = Workspace(folder, self.max_tokens)
+            workspace.start(self.refresh_interval)
+            self.workspaces[key] = workspace
+        workspace.clients.add(client_id)
+        self.clients[client_id] = Client(client_id, workspace)
+        self.idle_since = None
+        logger.info("Client %s attached to %s (%d clients, %d workspaces)",
+                    client_id, folder or 'no workspace', len(workspace.clients), len(self.workspaces))
+        return workspace
+
+    def detach(self, client_id: str) -> bool:
+        """Drop client_id; the workspace closes with its last client"""
+        client = self.clients.pop(client_id, None)
+        if client is None:
+            return False
+        workspace = client.workspace
+        workspace.clients.discard(client_id)
+        if not workspace.clients:
+            self.workspaces.pop(self._key(workspace.folder), None)
+            task = asyncio.ensure_future(workspace.close())
+            self._closing.add(task)
+            task.add_done_callback(self._closed)
+        if not self.clients:
+            self.idle_since = time.monotonic()
+        logger.info("Client %s detached (%d clients left)", client_id, len(self.clients))
+        return True
+
+    def _closed(self, task: asyncio.Task):
+        self._closing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Closing a workspace failed: %s", task.exception(), exc_info=task.exception())
+
+    def expire(self) -> int:
+        """Detach clients whose lease ran out, e.g. windows that crashed"""
+        cutoff = time.monotonic() - self.lease
+        expired = [client_id for client_id, client in self.clients.items() if client.last_seen < cutoff]
+        for client_id in expired:
+            self.detach(client_id)
+        return len(expired)
+
+    def resolve(self, client_id: Optional[str]) -> Client:
+        """The client for a request; unknown or missing ids get the default workspace"""
+        client = self.clients.get(client_id) if client_id else None
+        if client is None:
+            client = Client(client_id or "", self.default)
+            client.documents = self.default_documents
+        else:
+            client.last_seen = time.monotonic()
+        return client
+
+    async def close(self):
+        for workspace in list(self.workspaces.values()) + [self.default]:
+            await workspace.close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        self.workspaces.clear()
+        self.clients.clear()
@@ -1,8 +1,8 @@
 import * as vscode from 'vscode';
-import * as os from 'os';
-import * as path from 'path';
-import * as fs from 'fs';
+import * as crypto from 'crypto';
 import { getVersionString } from './version';
+import { DocumentSync } from './documentSync';
+import { ServerConnection } from './serverClient';
 
 interface ChatResponse {
     text: string;
@@ -13,56 +13,44 @@ export class ChatViewProvider implements vscode.WebviewViewProvider {
     public static readonly viewType = 'pydanticAgent.chatView';
     private _view?: vscode.WebviewView;
     private readonly _extensionUri: vscode.Uri;
-    private readonly _serverPort: number;
+    private readonly _connection: ServerConnection;
     private messages: any[] = [];
     private currentMessage: string = '';
     private version = '1.0.0';
     private isAborting: boolean = false;
+    // Identifies this view's conversation to the server
+    private readonly sessionId: string = crypto.randomUUID();
+    // The answer currently streaming, so it can be cancelled
+    private activeRequest?: { id: string; controller: AbortController };
+
+    private readonly _documentSync?: DocumentSync;
 
     constructor(
         extensionUri: vscode.Uri,
-        serverPort: number
+        connection: ServerConnection,
+        documentSync?: DocumentSync
     ) {
         this._extensionUri = extensionUri;
-        this._serverPort = serverPort;
+        this._connection = connection;
+        this._documentSync = documentSync;
         console.log(`[${getVersionString()}] ChatViewProvider initialized`);
     }
 
-    private async getServerPort(): Promise<number> {
-        const portFile = path.join(os.tmpdir(), 'pydantic_agent_port.txt');
-        try {
-            const port = parseInt(fs.readFileSync(portFile, 'utf8'), 10);
-            console.log(`[${getVersionString()}] Read port from file: ${port}`);
-            return port;
-        } catch (error) {
-            console.error(`[${getVersionString()}] Error reading port file: ${error}`);
-            return this._serverPort;
-        }
-    }
-
     private async sendWelcomeMessage() {
         console.log(`[${getVersionString()}] Starting welcome message flow`);
         try {
-            const port = await this.getServerPort();
-            console.log(`[${getVersionString()}] Using server port: ${port}`);
-
-            const response = await fetch(`http://localhost:${port}/chat`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    isSystemMessage: true,
-                    message: 'WELCOME_MESSAGE'
-                })
-            });
-
-            console.log(`[${getVersionString()}] Welcome message response status:`, response.status);
-            if (!response.ok) {
-                throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
+            // The welcome text arrives as the stream's one event
+            const events: ChatResponse[] = [];
+            const result = await this._connection.request('chat', {
+                isSystemMessage: true,
+                message: 'WELCOME_MESSAGE'
+            }, event => events.push(event));
+
+            console.log(`[${getVersionString()}] Welcome message response status:`, result.status);
+            const data = events[0];
+            if (result.status !== 200 || !data) {
+                throw new Error(`Server responded with ${result.status}: ${result.data?.error}`);
             }
-
-            const data = await response.json() as ChatResponse;
             console.log(`[${getVersionString()}] Welcome message response data:`, data);
 
             if (this._view) {
@@ -122,6 +110,9 @@ export class ChatViewProvider implements vscode.WebviewViewProvider {
             }
         });
 
+        // Stop a streaming answer when the chat view goes away
+        webviewView.onDidDispose(() => this.cancelActiveRequest());
+
         // Send initial message to verify webview communication
         webviewView.webview.postMessage({ type: 'init' });
         console.log(`[${getVersionString()}] Sent init message to webview`);
@@ -136,6 +127,17 @@ export class ChatViewProvider implements vscode.WebviewViewProvider {
         });
     }
 
+    private cancelActiveRequest() {
+        const request = this.activeRequest;
+        if (!request) {
+            return;
+        }
+        this.activeRequest = undefined;
+        console.log(`[${getVersionString()}] Cancelling request ${request.id}`);
+        // Sends a cancel frame, which stops the generation on the server
+        request.controller.abort();
+    }
+
     private async handleMessage(webviewView: vscode.WebviewView, message: any) {
         console.log(`[${getVersionString()}] Handling message:`, message);
         switch (message.type) {
@@ -162,83 +164,67 @@ export class ChatViewProvider implements vscode.WebviewViewProvider {
                         content: { isGenerating: true }
                     });
 
-                    // Send to server
-                    const port = await this.getServerPort();
-                    console.log(`[${getVersionString()}] Sending request to server on port ${port}`);
-                    const response = await fetch(`http://localhost:${port}/chat`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({ message: userMessage })
-                    });
+                    // A new message replaces the answer still streaming
+                    this.cancelActiveRequest();
 
-                    if (!response.ok) {
-                        throw new Error(`HTTP error! status: ${response.status}`);
-                    }
-
-                    const reader = response.body?.getReader();
-                    if (!reader) {
-                        throw new Error('No response body reader available');
-                    }
+                    // Send to server
+                    const request = { id: crypto.randomUUID(), controller: new AbortController() };
+                    this.activeRequest = request;
+                    console.log(`[${getVersionString()}] Sending request ${request.id} to server`);
 
-                    // Initialize response
                     let isFirstChunk = true;
-                    let isStreaming = true;
-
-                    while (isStreaming) {
-                        const { done, value } = await reader.read();
-                        if (done) {
-                            console.log(`[${getVersionString()}] Stream complete`);
-                            isStreaming = false;
-                            break;
+                    const onEvent = (data: any) => {
+                        console.log(`[${getVersionString()}] Parsed data:`, data);
+                        if (isFirstChunk) {
+                            data.replaceGenerating = true;
+                            isFirstChunk = false;
                         }
-
-                        // Convert the chunk to text
-                        const chunk = new TextDecoder().decode(value);
-                        console.log(`[${getVersionString()}] Received chunk:`, chunk);
-                        const lines = chunk.split('\n');
-
-                        for (const line of lines) {
-                            if (line.startsWith('data: ')) {
-                                try {
-                                    const data = JSON.parse(line.slice(6));
-                                    console.log(`[${getVersionString()}] Parsed data:`, data);
-                                    if (isFirstChunk) {
-                                        data.replaceGenerating = true;
-                                        isFirstChunk = false;
-                                    }
-                                    if (data.choices && data.choices.length > 0) {
-                                        const content = data.choices[0].delta.content;
-                                        if (content) {
-                                            console.log(`[${getVersionString()}] Sending response data to webview:`, data);
-                                            webviewView.webview.postMessage({
-                                                type: 'response',
-                                                content: {
-                                                    text: content,
-                                                    isUser: false
-                                                }
-                                            });
-                                        } else {
-                                            console.log(`[${getVersionString()}] Empty content, skipping`);
-                                        }
-                                    } else if (data.choices && data.choices[0].finish_reason === 'stop') {
-                                        console.log(`[${getVersionString()}] Received stop chunk, skipping`);
-                                    }
-                                    else {
-                                        console.log(`[${getVersionString()}] Empty or invalid choices array, skipping`);
+                        if (data.choices && data.choices.length > 0) {
+                            const content = data.choices[0].delta.content;
+                            if (content) {
+                                console.log(`[${getVersionString()}] Sending response data to webview:`, data);
+                                webviewView.webview.postMessage({
+                                    type: 'response',
+                                    content: {
+                                        text: content,
+                                        isUser: false
                                     }
-                                } catch (e) {
-                                    console.error(`[${getVersionString()}] Error parsing SSE data:`, e);
-                                    webviewView.webview.postMessage({
-                                        type: 'response',
-                                        content: { error: 'Error parsing response' }
-                                    });
-                                }
+                                });
+                            } else {
+                                console.log(`[${getVersionString()}] Empty content, skipping`);
                             }
+                        } else if (data.choices && data.choices[0].finish_reason === 'stop') {
+                            console.log(`[${getVersionString()}] Received stop chunk, skipping`);
                         }
+                        else {
+                            console.log(`[${getVersionString()}] Empty or invalid choices array, skipping`);
+                        }
+                    };
+                    const sendChat = async () => this._connection.request('chat', {
+                        message: userMessage,
+                        sessionId: this.sessionId,
+                        requestId: request.id,
+                        context: await this._getCurrentFileContext()
+                    }, onEvent, request.controller.signal);
+                    let result = await sendChat();
+                    if (result.status === 409 && this._documentSync && vscode.window.activeTextEditor) {
+                        // Server copy of the document is stale, resend it in full and retry once
+                        this._documentSync.invalidate(vscode.window.activeTextEditor.document);
+                        result = await sendChat();
+                    }
+
+                    console.log(`[${getVersionString()}] Stream complete`);
+                    if (this.activeRequest === request) {
+                        this.activeRequest = undefined;
+                    }
+                    if (result.status !== 200) {
+                        throw new Error(`Server responded with ${result.status}: ${result.data?.error}`);
                     }
                 } catch (error) {
+                    if (error instanceof Error && error.name === 'AbortError') {
+                        console.log(`[${getVersionString()}] Request cancelled`);
+                        break;
+                    }
                     console.error(`[${getVersionString()}] Error:`, error);
                     webviewView.webview.postMessage({
                         type: 'response',
@@ -375,7 +361,7 @@ export class ChatViewProvider implements vscode.WebviewViewProvider {
             </html>`;
     }
 
-    private _getCurrentFileContext() {
+    private async _getCurrentFileContext() {
         const editor = vscode.window.activeTextEditor;
         if (editor) {
             const position = editor.selection.active;
@@ -383,12 +369,27 @@ export class ChatViewProvider implements vscode.WebviewViewProvider {
                 line: position.line,
                 character: position.character
             };
+            const selectedText = editor.selection.isEmpty ? undefined : editor.document.getText(editor.selection);
+            
+            if (this._documentSync) {
+                // Reference the synced document instead of sending its content
+                await this._documentSync.ensureOpen(editor.document);
+                return {
+                    uri: editor.document.uri.toString(),
+                    version: editor.document.version,
+                    fileName: editor.document.fileName,
+                    language: editor.document.languageId,
+                    cursorPosition: [cursorPosition.line, cursorPosition.character],
+                    selectedText
+                };
+            }
             
             return {
                 fileName: editor.document.fileName,
                 content: editor.document.getText(),
                 language: editor.document.languageId,
-                cursorPosition: [cursorPosition.line, cursorPosition.character]
+                cursorPosition: [cursorPosition.line, cursorPosition.character],
+                selectedText
             };
         }
         return {
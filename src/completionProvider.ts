@@ -0,0 +1,65 @@
+import * as vscode from 'vscode';
+import { getVersionString } from './version';
+import { DocumentSync } from './documentSync';
+import { ServerConnection } from './serverClient';
+
+/**
+ * Inline completions from "complete" requests to the server. The server
+ * debounces per document and answers a request superseded by a newer
+ * keystroke with no completion; requests VS Code cancels are aborted here.
+ */
+export class CompletionProvider implements vscode.InlineCompletionItemProvider {
+    constructor(
+        private readonly connection: ServerConnection,
+        private readonly documentSync: DocumentSync
+    ) {}
+
+    public async provideInlineCompletionItems(
+        document: vscode.TextDocument,
+        position: vscode.Position,
+        _context: vscode.InlineCompletionContext,
+        token: vscode.CancellationToken
+    ): Promise<vscode.InlineCompletionItem[] | undefined> {
+        if (!vscode.workspace.getConfiguration('pydanticAgent').get<boolean>('completion.enabled', true)) {
+            return undefined;
+        }
+        const controller = new AbortController();
+        const cancellation = token.onCancellationRequested(() => controller.abort());
+        try {
+            // Reference the synced document instead of sending its content on every keystroke
+            await this.documentSync.ensureOpen(document);
+            if (token.isCancellationRequested) {
+                return undefined;
+            }
+            const result = await this.connection.request('complete', {
+                context: {
+                    uri: document.uri.toString(),
+                    version: document.version,
+                    fileName: document.fileName,
+                    language: document.languageId,
+                    cursorPosition: [position.line, position.character]
+                }
+            }, undefined, controller.signal);
+            if (result.status === 409) {
+                // Resend the full text with the next request
+                this.documentSync.invalidate(document);
+                return undefined;
+            }
+            if (result.status !== 200 || !result.data) {
+                return undefined;
+            }
+            const answer = result.data as { completion?: string | null };
+            if (!answer.completion || token.isCancellationRequested) {
+                return undefined;
+            }
+            return [new vscode.InlineCompletionItem(answer.completion, new vscode.Range(position, position))];
+        } catch (error) {
+            if (!controller.signal.aborted) {
+                console.error(`[${getVersionString()}] Completion request failed:`, error);
+            }
+            return undefined;
+        } finally {
+            cancellation.dispose();
+        }
+    }
+}
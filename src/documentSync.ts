@@ -0,0 +1,105 @@
+import * as vscode from 'vscode';
+import { getVersionString } from './version';
+import { ServerConnection } from './serverClient';
+
+/**
+ * Mirrors editor documents into the Python server's document store so chat
+ * requests can reference a document by uri and version instead of sending
+ * its full content. Only documents used as chat context are synced. The
+ * server handles a connection's document frames in order, before any chat
+ * frame sent after them.
+ */
+export class DocumentSync implements vscode.Disposable {
+    private readonly disposables: vscode.Disposable[] = [];
+    private readonly opened = new Map<string, number>();
+    // Requests are chained so the server sees changes in editor order
+    private queue: Promise<void> = Promise.resolve();
+
+    constructor(private readonly connection: ServerConnection) {
+        this.disposables.push(
+            vscode.workspace.onDidChangeTextDocument(event => this.didChange(event)),
+            vscode.workspace.onDidCloseTextDocument(document => this.didClose(document))
+        );
+    }
+
+    /** Make sure the server has the document at its current version */
+    public async ensureOpen(document: vscode.TextDocument): Promise<void> {
+        const uri = document.uri.toString();
+        if (this.opened.get(uri) === document.version) {
+            return this.queue;
+        }
+        return this.enqueue(async () => {
+            const ok = await this.send('didOpen', {
+                textDocument: {
+                    uri,
+                    languageId: document.languageId,
+                    version: document.version,
+                    text: document.getText()
+                }
+            });
+            if (ok) {
+                this.opened.set(uri, document.version);
+            }
+        });
+    }
+
+    /** Forget the server copy so the next ensureOpen sends the full text */
+    public invalidate(document: vscode.TextDocument) {
+        this.opened.delete(document.uri.toString());
+    }
+
+    private didChange(event: vscode.TextDocumentChangeEvent) {
+        const uri = event.document.uri.toString();
+        if (!this.opened.has(uri) || event.contentChanges.length === 0) {
+            return;
+        }
+        const version = event.document.version;
+        const contentChanges = event.contentChanges.map(change => ({
+            range: {
+                start: { line: change.range.start.line, character: change.range.start.character },
+                end: { line: change.range.end.line, character: change.range.end.character }
+            },
+            text: change.text
+        }));
+        this.opened.set(uri, version);
+        this.enqueue(async () => {
+            const ok = await this.send('didChange', { textDocument: { uri, version }, contentChanges });
+            if (!ok) {
+                this.opened.delete(uri);
+            }
+        });
+    }
+
+    private didClose(document: vscode.TextDocument) {
+        const uri = document.uri.toString();
+        if (!this.opened.delete(uri)) {
+            return;
+        }
+        this.enqueue(async () => {
+            await this.send('didClose', { textDocument: { uri } });
+        });
+    }
+
+    private enqueue(task: () => Promise<void>): Promise<void> {
+        this.queue = this.queue.then(task, task);
+        return this.queue;
+    }
+
+    private async send(type: string, body: any): Promise<boolean> {
+        try {
+            const result = await this.connection.request(type, body);
+            if (result.status >= 300) {
+                console.error(`[${getVersionString()}] ${type} failed with status ${result.status}`);
+            }
+            return result.status < 300;
+        } catch (error) {
+            console.error(`[${getVersionString()}] ${type} failed:`, error);
+            return false;
+        }
+    }
+
+    public dispose() {
+        this.disposables.forEach(disposable => disposable.dispose());
+        this.opened.clear();
+    }
+}
@@ -1,15 +1,35 @@
 import * as vscode from 'vscode';
 import { ChatViewProvider } from './chatView';
+import { DocumentSync } from './documentSync';
+import { CompletionProvider } from './completionProvider';
 import * as child_process from 'child_process';
+import * as crypto from 'crypto';
 import * as path from 'path';
 import * as fs from 'fs';
 import * as os from 'os';
 import { VERSION, BUILD_NUMBER, getVersionString } from './version';
+import { clientId, ServerConnection } from './serverClient';
 
 let pythonProcess: child_process.ChildProcess | undefined;
 let currentProvider: ChatViewProvider | undefined;
+let serverPort: number | undefined;
+let serverSocket: string | undefined;  // The shared server's Unix socket, if it has one
+let heartbeat: NodeJS.Timeout | undefined;
 const outputChannel = vscode.window.createOutputChannel('Pydantic Agent');
 
+// Shared server: one daemon per distinct settings serves every window that has them,
+// each attached with its workspace folder. Its lock file is created exclusively by
+// whoever starts the daemon, and removed by the daemon once it listens
+const daemonFile = (key: string) => path.join(os.tmpdir(), `pydantic_agent_daemon_${key}.json`);
+const daemonLockFile = (key: string) => path.join(os.tmpdir(), `pydantic_agent_daemon_${key}.lock`);
+const daemonSocketFile = (key: string) => path.join(os.tmpdir(), `pydantic_agent_daemon_${key}.sock`);
+const DAEMON_START_TIMEOUT = 30000;  // As in the server: an older lock was left behind by a crash
+const HEARTBEAT_INTERVAL = 30000;  // Well within the server's 90s client lease
+
+function useSharedServer(): boolean {
+    return vscode.workspace.getConfiguration('pydanticAgent').get<boolean>('server.shared', true);
+}
+
 async function getAvailablePort(): Promise<number> {
     const port = 8080;
     return port;
@@ -115,6 +135,214 @@ async function killExistingPythonProcesses() {
     });
 }
 
+/** Port of this window's own server, re-read in case it was restarted */
+async function readPortFile(): Promise<number> {
+    const portFile = path.join(os.tmpdir(), 'pydantic_agent_port.txt');
+    try {
+        return parseInt(fs.readFileSync(portFile, 'utf8'), 10);
+    } catch (error) {
+        outputChannel.appendLine(`Error reading port file: ${error}`);
+        return getServerPort();
+    }
+}
+
+/** This window's pydanticAgent.* settings, as the server reads them from VSCODE_SETTINGS */
+function serverSettings(context: vscode.ExtensionContext): string {
+    const properties = context.extension.packageJSON.contributes?.configuration?.properties || {};
+    const configuration = vscode.workspace.getConfiguration();
+    const settings: { [name: string]: unknown } = {};
+    for (const name of Object.keys(properties).sort()) {
+        const value = configuration.get(name);
+        if (value !== undefined) {
+            settings[name] = value;
+        }
+    }
+    return JSON.stringify(settings);
+}
+
+/** Identifies the settings a daemon runs with; windows share a daemon only when theirs match */
+function daemonKey(settings: string): string {
+    const llmEnvironment = Object.keys(process.env)
+        .filter(name => name.startsWith('LLM_'))
+        .sort()
+        .map(name => [name, process.env[name]]);
+    return crypto.createHash('sha256').update(JSON.stringify([settings, llmEnvironment])).digest('hex').slice(0, 16);
+}
+
+interface DaemonInfo {
+    port: number;
+    socket?: string;
+}
+
+/** Address of the running daemon of this version and settings, if it answers */
+async function findDaemon(key: string): Promise<DaemonInfo | undefined> {
+    try {
+        const info = JSON.parse(fs.readFileSync(daemonFile(key), 'utf8'));
+        if (info.version !== VERSION || info.build !== BUILD_NUMBER) {
+            return undefined;
+        }
+        const response = await fetch(`http://localhost:${info.port}/health`);
+        return response.ok ? { port: info.port, socket: info.socket || undefined } : undefined;
+    } catch (error) {
+        return undefined;
+    }
+}
+
+/** Claim the start of the daemon; false while another window holds the claim */
+function acquireDaemonLock(key: string): boolean {
+    for (let attempt = 0; attempt < 2; attempt++) {
+        try {
+            // 'wx' is O_CREAT | O_EXCL: of two windows starting at once, one wins
+            fs.writeFileSync(daemonLockFile(key), String(process.pid), { flag: 'wx' });
+            return true;
+        } catch (error) {
+            try {
+                if (Date.now() - fs.statSync(daemonLockFile(key)).mtimeMs < DAEMON_START_TIMEOUT) {
+                    return false;
+                }
+                fs.unlinkSync(daemonLockFile(key));
+            } catch (statError) {
+                // Released meanwhile; try again
+            }
+        }
+    }
+    return false;
+}
+
+/** Drop the claim if it is still this window's, e.g. when the daemon failed to start */
+function releaseDaemonLock(key: string) {
+    try {
+        if (fs.readFileSync(daemonLockFile(key), 'utf8').trim() === String(process.pid)) {
+            fs.unlinkSync(daemonLockFile(key));
+        }
+    } catch (error) {
+        // Already released
+    }
+}
+
+/** Reuse the shared daemon of this window's settings, or start one that outlives this window */
+async function connectToDaemon(context: vscode.ExtensionContext): Promise<DaemonInfo> {
+    const settings = serverSettings(context);
+    const key = daemonKey(settings);
+    let running = await findDaemon(key);
+    const starting = !running && acquireDaemonLock(key);
+    if (starting) {
+        // Another window may have finished starting one between the check and the lock
+        running = await findDaemon(key);
+        if (running) {
+            releaseDaemonLock(key);
+        }
+    }
+    if (running) {
+        outputChannel.appendLine(`[${getVersionString()}] Using shared server on port ${running.port}`);
+        return running;
+    }
+
+    if (starting) {
+        const serverPath = path.join(context.extensionPath, 'src', 'python_server.py');
+        const pythonPath = await getPythonPath();
+        outputChannel.appendLine(`[${getVersionString()}] Starting shared server: ${pythonPath} ${serverPath} --daemon`);
+        const daemon = child_process.spawn(pythonPath, [serverPath, '--daemon'], {
+            // Windows attach their own folders; the daemon has no default workspace.
+            // The daemon takes over this window's start-up lock, and serves
+            // /ws on a Unix socket too except on Windows
+            env: {
+                ...process.env,
+                WORKSPACE_FOLDER: '',
+                VSCODE_SETTINGS: settings,
+                PYDANTIC_AGENT_DAEMON_KEY: key,
+                PYDANTIC_AGENT_DAEMON_LOCK_OWNER: String(process.pid),
+                PYDANTIC_AGENT_UNIX_SOCKET: process.platform === 'win32' ? '' : daemonSocketFile(key)
+            },
+            detached: true,
+            stdio: 'ignore'
+        });
+        daemon.unref();
+    } else {
+        outputChannel.appendLine(`[${getVersionString()}] Another window is starting the shared server, waiting for it`);
+    }
+
+    for (let waited = 0; waited < DAEMON_START_TIMEOUT; waited += 500) {
+        await new Promise(resolve => setTimeout(resolve, 500));
+        const info = await findDaemon(key);
+        if (info) {
+            outputChannel.appendLine(`Shared server is responsive on port ${info.port}`);
+            return info;
+        }
+    }
+    if (starting) {
+        releaseDaemonLock(key);
+    }
+    throw new Error('Shared server did not start');
+}
+
+async function attachWorkspace(port: number): Promise<void> {
+    const response = await fetch(`http://localhost:${port}/workspace/attach`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            clientId,
+            workspaceFolder: vscode.workspace.workspaceFolders?.[0]?.uri.fsPath || ''
+        })
+    });
+    if (!response.ok) {
+        throw new Error(`Attach failed with status ${response.status}`);
+    }
+}
+
+async function useDaemon(context: vscode.ExtensionContext): Promise<void> {
+    const info = await connectToDaemon(context);
+    serverPort = info.port;
+    serverSocket = info.socket;
+    await attachWorkspace(serverPort);
+}
+
+/** The shared server's /ws; over its Unix socket when it has one, which skips TCP */
+async function sharedServerAddress(): Promise<string> {
+    return serverSocket ? `ws+unix:${serverSocket}:/ws` : `ws://localhost:${serverPort}/ws`;
+}
+
+/** This window's own server's /ws */
+async function ownServerAddress(): Promise<string> {
+    return `ws://localhost:${await readPortFile()}/ws`;
+}
+
+/** Renew this window's lease; reconnect if the daemon went away */
+function startHeartbeat(context: vscode.ExtensionContext) {
+    heartbeat = setInterval(async () => {
+        try {
+            await attachWorkspace(serverPort!);
+        } catch (error) {
+            outputChannel.appendLine(`Shared server unreachable (${error}), reconnecting`);
+            try {
+                await useDaemon(context);
+            } catch (reconnectError) {
+                outputChannel.appendLine(`Reconnect failed: ${reconnectError}`);
+            }
+        }
+    }, HEARTBEAT_INTERVAL);
+}
+
+async function detachWorkspace() {
+    if (heartbeat) {
+        clearInterval(heartbeat);
+        heartbeat = undefined;
+    }
+    if (!serverPort) {
+        return;
+    }
+    try {
+        await fetch(`http://localhost:${serverPort}/workspace/detach`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ clientId }),
+            signal: AbortSignal.timeout(2000)
+        });
+    } catch (error) {
+        outputChannel.appendLine(`Error detaching from shared server: ${error}`);
+    }
+}
+
 async function startPythonServer(context: vscode.ExtensionContext): Promise<number> {
     outputChannel.show();
     outputChannel.appendLine(`[${getVersionString()}] Starting Python server...`);
@@ -150,7 +378,8 @@ async function startPythonServer(context: vscode.ExtensionContext): Promise<numb
                     LLM_API_KEY: process.env.LLM_API_KEY || '',
                     LLM_BASE_URL: process.env.LLM_BASE_URL || 'https://glhf.chat/api/openai/v1',
                     LLM_MODEL: process.env.LLM_MODEL || 'gpt-4',
-                    LLM_TEMPERATURE: process.env.LLM_TEMPERATURE || '0.7'
+                    LLM_TEMPERATURE: process.env.LLM_TEMPERATURE || '0.7',
+                    WORKSPACE_FOLDER: vscode.workspace.workspaceFolders?.[0]?.uri.fsPath || ''
                 }
             });
 
@@ -207,13 +436,17 @@ async function startPythonServer(context: vscode.ExtensionContext): Promise<numb
 export async function activate(context: vscode.ExtensionContext) {
     outputChannel.appendLine(`Activating Pydantic Agent ${getVersionString()}...`);
 
-    // Kill any existing Python processes on activation
-    await killExistingPythonProcesses();
+    // Kill any existing Python processes on activation; a shared server belongs to other windows too
+    const shared = useSharedServer();
+    if (!shared) {
+        await killExistingPythonProcesses();
+    }
 
     // Register cleanup on deactivation
     context.subscriptions.push({
         dispose: async () => {
             outputChannel.appendLine(`[${getVersionString()}] Disposing extension...`);
+            await detachWorkspace();
             if (pythonProcess) {
                 outputChannel.appendLine('Cleaning up Python process');
                 await killProcess(pythonProcess);
@@ -227,8 +460,16 @@ export async function activate(context: vscode.ExtensionContext) {
     });
 
     try {
-        const port = await startPythonServer(context);
-        currentProvider = new ChatViewProvider(context.extensionUri, port);
+        if (shared) {
+            await useDaemon(context);
+            startHeartbeat(context);
+        } else {
+            await startPythonServer(context);
+        }
+        const connection = new ServerConnection(shared ? sharedServerAddress : ownServerAddress);
+        const documentSync = new DocumentSync(connection);
+        context.subscriptions.push(connection, documentSync);
+        currentProvider = new ChatViewProvider(context.extensionUri, connection, documentSync);
 
         // Register the webview provider
         context.subscriptions.push(
@@ -238,6 +479,13 @@ export async function activate(context: vscode.ExtensionContext) {
             )
         );
 
+        context.subscriptions.push(
+            vscode.languages.registerInlineCompletionItemProvider(
+                { pattern: '**' },
+                new CompletionProvider(connection, documentSync)
+            )
+        );
+
         outputChannel.appendLine(`[${getVersionString()}] Extension activated successfully`);
     } catch (error) {
         outputChannel.appendLine(`[${getVersionString()}] Failed to activate extension: ${error}`);
@@ -248,6 +496,9 @@ export async function activate(context: vscode.ExtensionContext) {
 export async function deactivate() {
     outputChannel.appendLine('Deactivating extension...');
     
+    // Leave the shared server running for other windows; it exits once none is attached
+    await detachWorkspace();
+    
     // Clean up Python process
     if (pythonProcess) {
         outputChannel.appendLine('Killing Python process');
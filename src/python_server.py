@@ -1,30 +1,103 @@
 # Python server for the Pydantic Agent VS Code extension
+import argparse
 import asyncio
+import hashlib
 import json
 import logging
 import os
 import sys
 import tempfile
-from typing import Dict, Any
-import openai
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+import aiohttp
 from aiohttp import web
 from dotenv import load_dotenv
 from pathlib import Path
 
 from pydantic_agent.base import CodeContext, AgentCapability
-from pydantic_agent.llm_integration import LLMConfig
+from pydantic_agent.llm_integration import LLMConfig, Message
+from pydantic_agent.router import Endpoint
 from pydantic_agent.llm_agent import LLMAgent
-from pydantic_agent.config import settings
+from pydantic_agent.completion_agent import CompletionAgent, CompletionRequest
+from pydantic_agent.cache import ResponseCache
+from pydantic_agent.documents import DocumentStore
+from pydantic_agent.context_builder import estimate_tokens
+from pydantic_agent.retrieval import BM25Index
+from pydantic_agent.workspaces import Workspace, WorkspaceRegistry
+from pydantic_agent.scheduler import AdmissionRejected, AdmissionScheduler, Priority
+from pydantic_agent.multiplex import DEFAULT_WINDOW, MuxConnection, MuxStream
+from pydantic_agent.connection_pool import configure_pool, get_pool
+from pydantic_agent.sse import SSECoalescer
+from pydantic_agent import metrics
+from pydantic_agent.logging_setup import TIMING_LOGGER_NAME, TokenTrace, configure_logging, parse_levels
+from pydantic_agent.timing import RequestProfiler, RequestTimer, current_timer, span
 
 # Initialize global variables
 agent = None
-client = None
+completion_agent = None  # Inline completions for /complete, created with the agent
+completion_max_tokens = 48  # Default max_tokens of a completion
+sessions = None  # SessionRegistry, created with the agent
+workspaces = WorkspaceRegistry(Workspace(None))  # Indexes per workspace, synced documents per client
+active_requests: Dict[str, asyncio.Task] = {}  # Streaming /chat answers by request id, for /cancel
+stream_coalesce_window = 0.02  # Seconds tokens are batched into one /chat event; 0 sends each alone
+stream_coalesce_max_bytes = 4096  # Send a batch early once it reaches this size
+profiler = RequestProfiler()  # Armed through /admin/profile
+_agent_initialized = None  # asyncio.Event, see agent_initialized()
+readiness = {"status": "starting", "error": None}  # Background start-up progress, reported by /ready
+daemon = False  # Shared by several VS Code windows; exits once none is attached for daemon_idle_timeout
+daemon_idle_timeout = 300  # Seconds
+_shutdown_requested = None  # asyncio.Event, see shutdown_requested()
+unix_socket = None  # Path of the Unix domain socket also served, if any
+daemon_key = ""  # Hash of the settings the daemon runs with, see settings_key()
 logger = None  # Will initialize after configuring logging
 
+def agent_initialized() -> asyncio.Event:
+    """Set once initialize_llm_agent has created the agent
+
+    Created on first use rather than at import: before Python 3.10 an Event
+    binds to the loop current when it is made, not the one asyncio.run starts.
+    """
+    global _agent_initialized
+    if _agent_initialized is None:
+        _agent_initialized = asyncio.Event()
+    return _agent_initialized
+
+def shutdown_requested() -> asyncio.Event:
+    """Set to stop main(); created on first use like agent_initialized()"""
+    global _shutdown_requested
+    if _shutdown_requested is None:
+        _shutdown_requested = asyncio.Event()
+    return _shutdown_requested
+
 # Configure version
 VERSION = "1.0.0"
 BUILD_NUMBER = "001"  # Keep in sync with version.ts
 
+# Session settings
+DEFAULT_SESSION_ID = "default"
+SESSION_IDLE_TIMEOUT = 30 * 60  # Seconds before an unused session is evicted
+SESSION_SWEEP_INTERVAL = 60  # Seconds between eviction sweeps
+MAX_HISTORY_MESSAGES = 20  # Previous messages sent along with each prompt
+SYMBOL_INDEX_REFRESH_INTERVAL = 30  # Seconds between workspace index refreshes
+RETRIEVAL_TOP_K = 3  # Workspace snippets attached to each chat prompt
+RETRIEVAL_MAX_TOKENS = 1500  # Token budget for those snippets
+AGENT_INIT_TIMEOUT = 30  # Seconds a /chat waits for the agent while the server starts
+
+# Daemon settings
+CLIENT_HEADER = 'X-Pydantic-Agent-Client'  # Identifies the attached window a request comes from
+WORKSPACE_SWEEP_INTERVAL = 15  # Seconds between expired client and idle checks
+# In the temp dir, per daemon key: port, pid and version of the running daemon...
+DAEMON_FILE = 'pydantic_agent_daemon_{key}.json'
+DAEMON_LOCK_FILE = 'pydantic_agent_daemon_{key}.lock'  # ...and, while one starts, its exclusive lock
+DAEMON_START_TIMEOUT = 30  # Seconds after which a start-up lock is taken to be left behind by a crash
+
+SSE_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+}
+
 # Load environment variables from .env file
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 env_path = os.path.join(project_root, '.env')
@@ -41,11 +114,6 @@ class VersionFormatter(logging.Formatter):
         record.version = f'v{self.version} (build {self.build})'
         return super().format(record)
 
-# Create handlers
-file_handler = logging.FileHandler(os.path.join(project_root, "pydantic_agent_debug.log"), mode='w', encoding='utf-8')
-console_handler = logging.StreamHandler()
-
-# Create formatter
 formatter = VersionFormatter(
     fmt='%(asctime)s - %(name)s - %(levelname)s - [%(version)s] %(message)s',
     datefmt=None,
@@ -53,26 +121,36 @@ formatter = VersionFormatter(
     build=BUILD_NUMBER
 )
 
-# Configure handlers
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
+def setup_logging(settings_json: str):
+    """Start the queued logging pipeline from the VS Code settings, with .env fallbacks
 
-# Configure root logger
-root_logger = logging.getLogger()
-root_logger.setLevel(logging.DEBUG)  # Always use DEBUG level for now
-root_logger.addHandler(file_handler)
-root_logger.addHandler(console_handler)
+    Records are handed to a background thread that formats them and writes
+    the rotating log file, so logging never blocks the event loop.
+    """
+    try:
+        settings_dict = json.loads(settings_json) if settings_json else {}
+    except json.JSONDecodeError:
+        settings_dict = {}
+    configure_logging(
+        log_file=os.path.join(project_root, "pydantic_agent_debug.log"),
+        level=settings_dict.get("pydanticAgent.logging.level") or os.getenv('LLM_LOG_LEVEL', 'INFO'),
+        levels=parse_levels(settings_dict.get("pydanticAgent.logging.levels") or os.getenv('LLM_LOG_LEVELS', '')),
+        max_bytes=int(settings_dict.get("pydanticAgent.logging.maxBytes") or os.getenv('LLM_LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        backup_count=int(settings_dict.get("pydanticAgent.logging.backupCount") or os.getenv('LLM_LOG_BACKUP_COUNT', '3')),
+        formatter=formatter,
+        trace_tokens=int(settings_dict.get("pydanticAgent.logging.traceTokens") or os.getenv('LLM_LOG_TRACE_TOKENS', '0')),
+        timing_file=os.path.join(project_root, "pydantic_agent_timing.log")
+    )
 
-# Get our module logger
+setup_logging(os.environ.get("VSCODE_SETTINGS", "{}"))
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # Ensure module logger is also at DEBUG level
 
 logger.info("Starting Pydantic Agent")
 
 # Add the project root directory to Python path
 sys.path.insert(0, project_root)
-logger.debug(f"Added {project_root} to Python path")
-logger.debug(f"Python path is now: {sys.path}")
+logger.debug("Added %s to Python path", project_root)
+logger.debug("Python path is now: %s", sys.path)
 
 def write_port_file(port: int):
     """Write the port number to a temp file that the extension can read"""
@@ -81,7 +159,7 @@ def write_port_file(port: int):
         # First ensure any old port file is removed
         if os.path.exists(port_file):
             os.remove(port_file)
-            logger.info(f"Removed old port file: {port_file}")
+            logger.info("Removed old port file: %s", port_file)
         
         # Write new port file
         with open(port_file, 'w') as f:
@@ -95,25 +173,224 @@ def write_port_file(port: int):
             if content != str(port):
                 raise ValueError(f"Port file verification failed. Expected {port}, got {content}")
         
-        logger.info(f"Successfully wrote and verified port {port} to {port_file}")
+        logger.info("Successfully wrote and verified port %d to %s", port, port_file)
     except Exception as e:
-        logger.error(f"Error writing port file: {e}")
+        logger.error("Error writing port file: %s", e)
         raise
 
+def settings_key(settings_json: str) -> str:
+    """Identifies the settings a daemon runs with, the VS Code ones and the LLM_* environment
+
+    Windows share a daemon only when their keys match, so a window with other
+    LLM settings starts a daemon of its own rather than use another window's
+    backend. The extension passes its key in PYDANTIC_AGENT_DAEMON_KEY.
+    """
+    key = os.getenv('PYDANTIC_AGENT_DAEMON_KEY')
+    if key:
+        return key
+    llm_environment = sorted((name, value) for name, value in os.environ.items() if name.startswith('LLM_'))
+    return hashlib.sha256(json.dumps([settings_json, llm_environment]).encode('utf-8')).hexdigest()[:16]
+
+def daemon_file_path() -> str:
+    return os.path.join(tempfile.gettempdir(), DAEMON_FILE.format(key=daemon_key))
+
+def daemon_lock_path() -> str:
+    return os.path.join(tempfile.gettempdir(), DAEMON_LOCK_FILE.format(key=daemon_key))
+
+def read_daemon_file() -> Optional[Dict[str, Any]]:
+    """The running daemon's {port, socket, pid, version, build}, or None"""
+    try:
+        with open(daemon_file_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_daemon_file(port: int):
+    """Advertise this daemon to other windows; written atomically so readers never see half a file"""
+    path = daemon_file_path()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({"port": port, "socket": unix_socket, "pid": os.getpid(), "version": VERSION, "build": BUILD_NUMBER}, f)
+    os.replace(temp_path, path)
+    logger.info("Daemon listening on port %d, advertised in %s", port, path)
+
+async def find_running_daemon() -> Optional[Dict[str, Any]]:
+    """The advertised daemon if it answers /health and runs this version"""
+    info = read_daemon_file()
+    if not info or info.get("version") != VERSION or info.get("build") != BUILD_NUMBER:
+        return None
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+            async with session.get(f"http://localhost:{info['port']}/health") as response:
+                return info if response.status == 200 else None
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError):
+        return None
+
+def acquire_daemon_lock() -> bool:
+    """Claim the start-up of the daemon; False while another process holds the claim
+
+    The lock file is created with O_CREAT | O_EXCL, so of two windows starting
+    at once only one starts a daemon and the other connects to it. The
+    extension claims it before it spawns the daemon and names itself in
+    PYDANTIC_AGENT_DAEMON_LOCK_OWNER; the daemon takes that claim over.
+    """
+    path = daemon_lock_path()
+    handed_over = os.getenv('PYDANTIC_AGENT_DAEMON_LOCK_OWNER')
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(path) as f:
+                    owner = f.read().strip()
+                if handed_over and owner == handed_over:
+                    with open(path, 'w') as f:
+                        f.write(str(os.getpid()))
+                    return True
+                if time.time() - os.path.getmtime(path) < DAEMON_START_TIMEOUT:
+                    return False
+                logger.warning("Removing stale daemon lock %s", path)
+                os.remove(path)
+            except OSError:
+                pass  # Released meanwhile; try again
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+def release_daemon_lock():
+    """Release the start-up claim if this process holds it"""
+    path = daemon_lock_path()
+    try:
+        with open(path) as f:
+            owner = f.read().strip()
+        if owner == str(os.getpid()):
+            os.remove(path)
+    except OSError:
+        pass
+
+def remove_daemon_file():
+    """Remove the daemon file if it still names this process"""
+    info = read_daemon_file()
+    if info and info.get("pid") == os.getpid():
+        try:
+            os.remove(daemon_file_path())
+        except OSError as e:
+            logger.warning("Could not remove daemon file: %s", e)
+
+class ChatSession:
+    """State for one conversation: code context, history and LLM settings"""
+    def __init__(self, session_id: str, llm_config: LLMConfig):
+        self.session_id = session_id
+        self.llm_config = llm_config
+        self.context: Optional[CodeContext] = None
+        self.history: List[Message] = []
+        self.lock = asyncio.Lock()  # Keeps turns of one conversation in order
+        self.request_id: Optional[str] = None  # Answer currently streaming
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def add_message(self, role: str, content: str):
+        """Append a message, keeping at most MAX_HISTORY_MESSAGES"""
+        self.history.append(Message(role=role, content=content))
+        del self.history[:-MAX_HISTORY_MESSAGES]
+
+class SessionRegistry:
+    """Per-conversation state keyed by session id, with idle eviction"""
+    def __init__(self, base_config: LLMConfig, idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.base_config = base_config
+        self.idle_timeout = idle_timeout
+        self.sessions: Dict[str, ChatSession] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def config_for(self, llm_settings: Any) -> Optional[LLMConfig]:
+        """The base config with a request's llm settings applied; None without any
+
+        Raises ValueError (a ValidationError for bad values) so the request can be refused.
+        """
+        if not llm_settings:
+            return None
+        if not isinstance(llm_settings, dict):
+            raise ValueError("llm must be an object")
+        # Only the per-conversation knobs can be overridden; credentials stay server-side
+        overrides = {k: v for k, v in llm_settings.items() if k in ('model', 'temperature', 'max_tokens')}
+        return LLMConfig.model_validate({**self.base_config.model_dump(), **overrides})
+
+    def get(self, session_id: str, llm_config: Optional[LLMConfig] = None) -> ChatSession:
+        """Return the session for session_id, creating it on first use; llm_config comes from config_for"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = ChatSession(session_id, self.base_config)
+            self.sessions[session_id] = session
+            logger.info("Created session %s (%d active)", session_id, len(self.sessions))
+        if llm_config is not None:
+            session.llm_config = llm_config
+        session.touch()
+        return session
+
+    def evict_idle(self) -> int:
+        """Drop sessions that have not been used within idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = [sid for sid, session in self.sessions.items()
+                   if session.last_used < cutoff and not session.lock.locked()]
+        for sid in expired:
+            del self.sessions[sid]
+        if expired:
+            logger.info("Evicted %d idle sessions (%d active)", len(expired), len(self.sessions))
+        return len(expired)
+
+    async def _sweep(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+
+    def start(self, interval: float = SESSION_SWEEP_INTERVAL):
+        """Start the background eviction task"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(interval))
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+def parse_endpoints(value: Any) -> List[Endpoint]:
+    """Endpoints from the pydanticAgent.llm.endpoints setting (a list or its JSON)"""
+    if isinstance(value, str):
+        value = json.loads(value) if value.strip() else []
+    endpoints = []
+    for entry in value or []:
+        endpoints.append(Endpoint(
+            base_url=entry.get('baseUrl') or entry.get('base_url'),
+            api_key=entry.get('apiKey') or entry.get('api_key'),
+            model=entry.get('model'),
+            weight=float(entry.get('weight', 1.0)),
+            max_concurrency=entry.get('maxConcurrency') or entry.get('max_concurrency')
+        ))
+    return endpoints
+
 async def initialize_llm_agent(settings_json: str) -> LLMAgent:
     """Initialize the LLM agent with the given settings"""
-    global agent, client
+    global agent, sessions, stream_coalesce_window, stream_coalesce_max_bytes, daemon_idle_timeout
+    global completion_agent, completion_max_tokens
     try:
         # Setup logging first
         workspace_path = os.path.dirname(os.path.dirname(__file__))
         logger = logging.getLogger(__name__)
         
-        logger.debug(f"VS Code settings: {settings_json}")
+        logger.debug("VS Code settings: %s", settings_json)
         
         # Parse settings from VS Code
         try:
             settings_dict = json.loads(settings_json) if settings_json else {}
-            logger.debug(f"Parsed VS Code settings: {settings_dict}")
+            logger.debug("Parsed VS Code settings: %s", settings_dict)
             
             # Get settings with fallbacks
             api_key = settings_dict.get("pydanticAgent.llm.apiKey") or os.getenv('LLM_API_KEY', '')
@@ -130,39 +407,70 @@ async def initialize_llm_agent(settings_json: str) -> LLMAgent:
             
             # Log settings (masking API key)
             masked_api_key = '***' + api_key[-4:] if api_key else 'not set'
-            logger.debug(f"Using settings: base_url={base_url}, model={model}, temperature={temperature}, api_key_present={bool(api_key)}")
-            logger.debug(f"API Key: {masked_api_key}")
+            logger.debug("Using settings: base_url=%s, model=%s, temperature=%s, api_key_present=%s",
+                         base_url, model, temperature, bool(api_key))
+            logger.debug("API Key: %s", masked_api_key)
             
-            # Initialize OpenAI client with headers
-            client = openai.OpenAI(
-                api_key=api_key,
-                base_url=base_url,
-                default_headers={
-                    "Authorization": f"Bearer {api_key}"
-                }
+            daemon_idle_timeout = float(settings_dict.get("pydanticAgent.daemon.idleTimeout") or os.getenv('LLM_DAEMON_IDLE_TIMEOUT', '300'))
+            
+            # Outbound /chat stream batching
+            stream_coalesce_window = float(settings_dict.get("pydanticAgent.stream.coalesceMs", os.getenv('LLM_STREAM_COALESCE_MS', '20'))) / 1000
+            stream_coalesce_max_bytes = int(settings_dict.get("pydanticAgent.stream.coalesceBytes") or os.getenv('LLM_STREAM_COALESCE_BYTES', '4096'))
+            
+            # Admission in front of the LLM service: chat answers first, background work last
+            # (background gets half the slots unless backgroundConcurrency says otherwise)
+            background_concurrency = int(settings_dict.get("pydanticAgent.scheduler.backgroundConcurrency") or os.getenv('LLM_SCHEDULER_BACKGROUND_CONCURRENCY', '0'))
+            scheduler = AdmissionScheduler(
+                max_concurrency=int(settings_dict.get("pydanticAgent.scheduler.maxConcurrency") or os.getenv('LLM_SCHEDULER_MAX_CONCURRENCY', '20')),
+                max_queued=int(settings_dict.get("pydanticAgent.scheduler.maxQueued") or os.getenv('LLM_SCHEDULER_MAX_QUEUED', '64')),
+                class_limits={Priority.BACKGROUND: background_concurrency} if background_concurrency else None
             )
             
-            # Test connection
-            try:
-                models = client.models.list()
-                logger.debug(f"Successfully connected to API. Available models: {models}")
-            except Exception as e:
-                logger.error(f"Failed to list models: {str(e)}")
-                raise
+            # One connection pool for every request to the LLM service
+            configure_pool(
+                limit=int(settings_dict.get("pydanticAgent.pool.maxConnections") or os.getenv('LLM_POOL_MAX_CONNECTIONS', '100')),
+                limit_per_host=int(settings_dict.get("pydanticAgent.pool.maxConnectionsPerHost") or os.getenv('LLM_POOL_MAX_CONNECTIONS_PER_HOST', '20'))
+            )
             
             # Initialize LLM client with VS Code settings
             config = LLMConfig(
                 base_url=base_url,
                 api_key=api_key,
                 model=model,
-                temperature=temperature
+                temperature=temperature,
+                endpoints=parse_endpoints(settings_dict.get("pydanticAgent.llm.endpoints") or os.getenv('LLM_ENDPOINTS', '')),
+                connect_timeout=float(settings_dict.get("pydanticAgent.llm.connectTimeout") or os.getenv('LLM_CONNECT_TIMEOUT', '10')),
+                first_token_timeout=float(settings_dict.get("pydanticAgent.llm.firstTokenTimeout") or os.getenv('LLM_FIRST_TOKEN_TIMEOUT', '60')),
+                idle_timeout=float(settings_dict.get("pydanticAgent.llm.idleTimeout") or os.getenv('LLM_IDLE_TIMEOUT', '30')),
+                # 0 disables the total budget
+                total_timeout=float(settings_dict.get("pydanticAgent.llm.totalTimeout") or os.getenv('LLM_TOTAL_TIMEOUT', '600')) or None
             )
-            logger.debug(f"Created LLM config with api_key present: {bool(config.api_key)}, base_url: {config.base_url}")
+            logger.debug("Created LLM config with api_key present: %s, base_url: %s",
+                         bool(config.api_key), config.base_url)
+            
+            # Response cache settings
+            cache = None
+            cache_enabled = str(settings_dict.get("pydanticAgent.cache.enabled", os.getenv('LLM_CACHE_ENABLED', 'true'))).lower() != 'false'
+            if cache_enabled:
+                cache = ResponseCache(
+                    max_entries=int(settings_dict.get("pydanticAgent.cache.maxEntries") or os.getenv('LLM_CACHE_MAX_ENTRIES', '256')),
+                    ttl=float(settings_dict.get("pydanticAgent.cache.ttlSeconds") or os.getenv('LLM_CACHE_TTL', '86400')),
+                    directory=settings_dict.get("pydanticAgent.cache.directory") or os.getenv('LLM_CACHE_DIR') or None
+                )
+                logger.debug("Response cache enabled: max_entries=%s, ttl=%s, directory=%s",
+                             cache.max_entries, cache.ttl, cache.directory)
             
         except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse VS Code settings: {str(e)}")
+            logger.error("Failed to parse VS Code settings: %s", e)
             raise
         
+        # Index the workspace so prompts can include definitions used near the cursor;
+        # windows attached through /workspace/attach get a workspace of their own
+        workspace_folder = settings_dict.get("workspaceFolder") or os.getenv('WORKSPACE_FOLDER')
+        workspaces.max_tokens = int(settings_dict.get("pydanticAgent.context.maxTokens") or os.getenv('LLM_CONTEXT_MAX_TOKENS', '4000'))
+        workspaces.default = Workspace(workspace_folder, workspaces.max_tokens)
+        context_builder = workspaces.default.context_builder
+        
         agent = LLMAgent(
             name="PydanticAgent",
             llm_config=config,
@@ -172,26 +480,148 @@ async def initialize_llm_agent(settings_json: str) -> LLMAgent:
                 AgentCapability.REFACTORING,
                 AgentCapability.DOCUMENTATION,
                 AgentCapability.TESTING
-            ]
+            ],
+            cache=cache,
+            context_builder=context_builder,
+            scheduler=scheduler
         )
+        # Inline completions share the agent's client: its pool, cache and scheduler
+        completion_max_tokens = int(settings_dict.get("pydanticAgent.completion.maxTokens") or os.getenv('LLM_COMPLETION_MAX_TOKENS', '48'))
+        completion_agent = CompletionAgent(
+            llm_client=agent.llm_client,
+            model=settings_dict.get("pydanticAgent.completion.model") or os.getenv('LLM_COMPLETION_MODEL') or None,
+            debounce=float(settings_dict.get("pydanticAgent.completion.debounceMs", os.getenv('LLM_COMPLETION_DEBOUNCE_MS', '50'))) / 1000,
+            timeout=float(settings_dict.get("pydanticAgent.completion.timeout") or os.getenv('LLM_COMPLETION_TIMEOUT', '10'))
+        )
+        sessions = SessionRegistry(config)
+        agent_initialized().set()
         
         return agent
     except Exception as e:
-        logger.error(f"Failed to initialize LLM agent: {str(e)}")
+        logger.error("Failed to initialize LLM agent: %s", e)
         raise
 
+def build_code_context(context: Dict[str, Any], documents: DocumentStore) -> Optional[CodeContext]:
+    """Build a CodeContext from the /chat context payload
+
+    The payload either carries the full `content` or references a document
+    synced into `documents` by `uri` and `version`. Returns None when the referenced
+    document is unknown or at a different version.
+    """
+    cursor_pos = context.get('cursorPosition', [0, 0])
+    if not isinstance(cursor_pos, list):
+        cursor_pos = [0, 0]
+
+    uri = context.get('uri')
+    if uri and 'content' not in context:
+        document = documents.get(uri)
+        if document is None or document.version != context.get('version'):
+            logger.warning("Document %s out of sync (requested v%s, have %s)",
+                           uri, context.get('version'), document.version if document else 'none')
+            return None
+        return document.to_context(
+            cursor_position=tuple(cursor_pos),
+            selected_text=context.get('selectedText'),
+            file_path=context.get('fileName')
+        )
+
+    return CodeContext(
+        content=context.get('content', ''),
+        language=context.get('language', ''),
+        cursor_position=tuple(cursor_pos),
+        selected_text=context.get('selectedText'),
+        file_path=context.get('fileName', '')
+    )
+
+async def read_json(request: web.Request) -> Dict[str, Any]:
+    """The JSON object in a request's body; a 400 with an error payload when there is none"""
+    try:
+        data = await request.json()
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=json.dumps({"error": f"Invalid JSON body: {e}"}), content_type='application/json')
+    if not isinstance(data, dict):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "The JSON body must be an object"}),
+                                 content_type='application/json')
+    return data
+
+def document_did_open(data: Dict[str, Any], documents: DocumentStore) -> Tuple[int, Dict[str, Any]]:
+    """Start tracking a document: {"textDocument": {uri, languageId, version, text}}"""
+    doc = data.get('textDocument', {})
+    try:
+        documents.did_open(doc['uri'], doc.get('languageId', ''), int(doc['version']), doc.get('text', ''))
+    except (KeyError, TypeError, ValueError) as e:
+        return 400, {"error": f"Invalid didOpen: {e}"}
+    return 200, {"version": doc['version']}
+
+def document_did_change(data: Dict[str, Any], documents: DocumentStore) -> Tuple[int, Dict[str, Any]]:
+    """Apply range edits: {"textDocument": {uri, version}, "contentChanges": [...]}"""
+    doc = data.get('textDocument', {})
+    try:
+        document = documents.did_change(doc['uri'], int(doc['version']), data.get('contentChanges', []))
+    except (KeyError, TypeError) as e:
+        return 400, {"error": f"Invalid didChange: {e}"}
+    except ValueError as e:
+        logger.warning(str(e))
+        return 409, {"error": str(e), "code": "document_out_of_sync"}
+    return 200, {"version": document.version}
+
+def document_did_close(data: Dict[str, Any], documents: DocumentStore) -> Tuple[int, Dict[str, Any]]:
+    """Stop tracking a document: {"textDocument": {uri}}"""
+    documents.did_close(data.get('textDocument', {}).get('uri', ''))
+    return 200, {}
+
+# Document sync operations by name, for /document/* and multiplexed frames
+DOCUMENT_OPERATIONS = {
+    "didOpen": document_did_open,
+    "didChange": document_did_change,
+    "didClose": document_did_close,
+}
+
+async def handle_document(request: web.Request) -> web.Response:
+    """POST /document/{operation}: document sync for the requesting client"""
+    operation = DOCUMENT_OPERATIONS[request.match_info['operation']]
+    documents = workspaces.resolve(request.headers.get(CLIENT_HEADER)).documents
+    status, payload = operation(await read_json(request), documents)
+    return web.json_response(payload, status=status)
+
 async def handle_message(request: web.Request) -> web.StreamResponse:
     """Handle incoming chat messages"""
-    global agent, client
+    async def open_stream() -> web.StreamResponse:
+        response = web.StreamResponse(status=200, reason='OK', headers=SSE_HEADERS)
+        await response.prepare(request)
+        return response
+
+    def backlog() -> int:
+        return request.transport.get_write_buffer_size() if request.transport else 0
+
+    return await run_chat(lambda: read_json(request), request.headers.get(CLIENT_HEADER), open_stream, backlog)
+
+async def run_chat(read_body: Callable[[], Awaitable[Dict[str, Any]]], client_id: Optional[str],
+                   open_stream: Callable[[], Awaitable[Any]], backlog: Callable[[], int]):
+    """Answer one chat request, over SSE or a multiplexed stream
+
+    `read_body` returns the request body and `open_stream` the response the
+    events are written to, once the request was accepted; `backlog` reports
+    the bytes queued for the client. Requests rejected before that get a
+    JSON web.Response instead.
+    """
+    global agent
     logger = logging.getLogger(__name__)
+    # Phase timeline of this request; library code adds its spans through current_timer
+    timer = RequestTimer()
+    timer_token = current_timer.set(timer)
     
     try:
         # Parse the incoming message
-        data = await request.json()
+        with timer.span("parse"):
+            data = await read_body()
         message = data.get('message', '')
         context = data.get('context', {})
         is_system = data.get('isSystemMessage', False)
-        logger.info(f"Chat endpoint called with message: {message}")
+        session_id = data.get('sessionId') or DEFAULT_SESSION_ID
+        request_id = data.get('requestId') or str(uuid.uuid4())
+        timer.request_id = request_id
+        logger.info("Chat endpoint called with message: %s", message)
         
         if not message.strip():
             raise ValueError("Empty message received")
@@ -199,28 +629,25 @@ async def handle_message(request: web.Request) -> web.StreamResponse:
         # Handle welcome message specially
         if is_system and message == 'WELCOME_MESSAGE':
             logger.info("Processing system message")
-            response = web.StreamResponse(
-                status=200,
-                reason='OK',
-                headers={
-                    'Content-Type': 'text/event-stream',
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive',
-                }
-            )
             logger.info("Preparing welcome message response")
-            await response.prepare(request)
+            response = await open_stream()
             
             welcome_msg = f"Welcome to Pydantic Agent v{VERSION}! I'm ready to help you with your coding tasks."
             data = json.dumps({"text": welcome_msg})
-            logger.info(f"Sending welcome message data: {data}")
+            logger.info("Sending welcome message data: %s", data)
             await response.write(f"data: {data}\n\n".encode('utf-8'))
             await response.write(b"data: {\"done\": true}\n\n")
             logger.info("Welcome message sent successfully")
             return response
 
-        # Check if agent and client are initialized
-        if not agent or not client:
+        # Requests that arrive while the server is still starting wait for the agent
+        if not agent:
+            try:
+                await asyncio.wait_for(agent_initialized().wait(), AGENT_INIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        if not agent:
+            metrics.CHAT_REQUESTS.inc(outcome="rejected")
             error_data = json.dumps({"error": "LLM agent not initialized"})
             return web.Response(
                 status=500,
@@ -228,168 +655,630 @@ async def handle_message(request: web.Request) -> web.StreamResponse:
                 content_type='application/json'
             )
 
+        # Fail fast while the LLM service is saturated rather than queue without bound
+        scheduler = agent.llm_client.scheduler
+        if scheduler is not None and scheduler.saturated(Priority.INTERACTIVE):
+            metrics.CHAT_REQUESTS.inc(outcome="rejected")
+            metrics.SCHEDULER_REJECTED.inc(priority="interactive")
+            return web.Response(
+                status=503,
+                text=json.dumps({"error": "LLM service busy, retry shortly", "code": "busy"}),
+                content_type='application/json',
+                headers={'Retry-After': '1'}
+            )
+
+        # Resolve the code context before streaming so sync errors get a proper status
+        client = workspaces.resolve(client_id)
+        with timer.span("context"):
+            code_context = build_code_context(context, client.documents)
+        if code_context is None:
+            metrics.CHAT_REQUESTS.inc(outcome="rejected")
+            return web.Response(
+                status=409,
+                text=json.dumps({
+                    "error": "Document out of sync, reopen it and retry",
+                    "code": "document_out_of_sync"
+                }),
+                content_type='application/json'
+            )
+
+        # Validate the conversation's model settings before streaming so bad ones get a 400
+        try:
+            llm_config = sessions.config_for(data.get('llm'))
+        except ValueError as e:
+            metrics.CHAT_REQUESTS.inc(outcome="rejected")
+            return web.Response(
+                status=400,
+                text=json.dumps({"error": f"Invalid llm settings: {e}"}),
+                content_type='application/json'
+            )
+
         # Prepare the response
-        response = web.StreamResponse(
-            status=200,
-            reason='OK',
-            headers={
-                'Content-Type': 'text/event-stream',
-                'Cache-Control': 'no-cache',
-                'Connection': 'keep-alive',
-            }
-        )
-        await response.prepare(request)
+        response = await open_stream()
 
         # Stream the response
+        outcome = "error"
         try:
-            # Initialize agent context
-            cursor_pos = context.get('cursorPosition', [0, 0])
-            if not isinstance(cursor_pos, list):
-                cursor_pos = [0, 0]
-            
-            agent.context = CodeContext(
-                content=context.get('content', ''),
-                language=context.get('language', ''),
-                cursor_position=tuple(cursor_pos),
-                file_path=context.get('fileName', '')
-            )
-            logger.debug(f"Updated agent context with cursor position: {cursor_pos}")
-            
-            # Create chat completion with streaming
-            completion = client.chat.completions.create(
-                stream=True,
-                model=agent.llm_config.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful coding assistant in VS Code."},
-                    {"role": "user", "content": message}
-                ],
-                temperature=agent.llm_config.temperature
-            )
-            
-            await response.write(f"data: {json.dumps({'startNewMessage': True})}\n\n".encode('utf-8'))
+            session = sessions.get(session_id, llm_config)
+            # A new message supersedes the answer still streaming in this conversation
+            previous = active_requests.get(session.request_id) if session.request_id else None
+            if previous is not None:
+                logger.info("Request %s superseded by %s", session.request_id, request_id)
+                previous.cancel()
+            async with session.lock:
+                session.request_id = request_id
+                # Update the session context
+                session.context = code_context
+                logger.debug("Updated session %s context with cursor position: %s",
+                             session_id, code_context.cursor_position)
+                
+                # Fit the code around the cursor into the prompt's token budget
+                system_prompt = "You are a helpful coding assistant in VS Code."
+                # The workspace may be closing meanwhile; its indexes stay open until this is done
+                with client.workspace.in_use():
+                    if code_context.content:
+                        with timer.span("context_window"):
+                            window = client.workspace.context_builder.build(code_context)
+                        logger.debug("Context window: %d tokens, lines %s", window.tokens, window.line_ranges)
+                        system_prompt += f"\n\nThe user is working on this code:\n{window.text}"
+                    
+                    with timer.span("retrieval"):
+                        snippets = await retrieve_snippets(message, client.workspace.retrieval_index)
+                if snippets:
+                    system_prompt += f"\n\nPossibly relevant code from the workspace:\n{snippets}"
+                
+                messages = [
+                    Message(role="system", content=system_prompt),
+                    *session.history,
+                    Message(role="user", content=message)
+                ]
+                
+                await response.write(f"data: {json.dumps({'startNewMessage': True, 'requestId': request_id})}\n\n".encode('utf-8'))
 
+                # Stream in a task of its own so /cancel can stop it without dropping the connection
+                stream_task = asyncio.create_task(stream_reply(response, session, messages, message, timer.started, backlog))
+                active_requests[request_id] = stream_task
+                metrics.ACTIVE_STREAMS.inc()
+                try:
+                    await asyncio.wait([stream_task])
+                except asyncio.CancelledError:
+                    # The client disconnected, stop the generation with it
+                    logger.info("Client disconnected, cancelling request %s", request_id)
+                    outcome = "cancelled"
+                    stream_task.cancel()
+                    raise
+                finally:
+                    metrics.ACTIVE_STREAMS.dec()
+                    active_requests.pop(request_id, None)
+                    if session.request_id == request_id:
+                        session.request_id = None
+                if stream_task.cancelled():
+                    outcome = "cancelled"
+                    logger.info("Request %s cancelled", request_id)
+                    await response.write(f"data: {json.dumps({'cancelled': True, 'done': True})}\n\n".encode('utf-8'))
+                elif stream_task.result():
+                    outcome = "completed"
+        except Exception as e:
+            # Failed before the answer started (session, context window, retrieval); the
+            # stream is already open, so report the error on it
+            logger.error("Error preparing request %s: %s", request_id, e, exc_info=True)
             try:
-                logger.debug("Starting to stream response chunks")
-                for chunk in completion:
-                    logger.debug(f"Raw chunk: {chunk}")
-                    if (hasattr(chunk, 'choices') and 
-                        chunk.choices and 
-                        chunk.choices[0].delta and 
-                        hasattr(chunk.choices[0].delta, 'content') and 
-                        chunk.choices[0].delta.content is not None and  # Explicit None check
-                        chunk.choices[0].delta.content.strip() != ''):  # Check for non-empty content
-                        
-                        text = chunk.choices[0].delta.content
-                        logger.debug(f"Received chunk: {text}")
-                        # Send the chunk in SSE format
-                        response_data = json.dumps({
-                            "type": "chunk",
-                            "content": text
-                        })
-                        logger.debug(f"Sending response data: {response_data}")
-                        await response.write(f"data: {response_data}\n\n".encode('utf-8'))
-                        logger.debug("Response written")
-
-                await response.write(f"data: {json.dumps({'done': True})}\n\n".encode('utf-8'))
-            except Exception as e:
-                logger.error(f"Error processing stream: {str(e)}", exc_info=True)
-                error_data = json.dumps({"error": str(e)})
-                logger.debug(f"Sending error data: {error_data}")
-                await response.write(f"data: {error_data}\n\n".encode('utf-8'))
+                await response.write(f"data: {json.dumps({'error': str(e)})}\n\n".encode('utf-8'))
+            except ConnectionResetError:
+                pass
         finally:
-            await response.write_eof()
-            return response
+            metrics.CHAT_REQUESTS.inc(outcome=outcome)
+            metrics.CHAT_DURATION.observe(timer.elapsed())
+            timing = timer.as_dict()
+            timing_logger = logging.getLogger(TIMING_LOGGER_NAME)
+            if timing_logger.isEnabledFor(logging.INFO):
+                timing_logger.info(json.dumps({**timing, "outcome": outcome}))
+            try:
+                await response.write(f"data: {json.dumps({'type': 'timing', **timing})}\n\n".encode('utf-8'))
+                await response.write_eof()
+            except ConnectionResetError:
+                pass  # The client is already gone
+        return response
         
+    except web.HTTPException:
+        metrics.CHAT_REQUESTS.inc(outcome="rejected")
+        raise
     except Exception as e:
-        logger.error(f"Error handling message: {e}", exc_info=True)
+        logger.error("Error handling message: %s", e, exc_info=True)
+        metrics.CHAT_REQUESTS.inc(outcome="error")
         return web.Response(
             status=500,
             text=json.dumps({"error": str(e)}),
             content_type='application/json'
         )
+    finally:
+        current_timer.reset(timer_token)
+
+async def stream_reply(response: web.StreamResponse, session: ChatSession, messages: List[Message], message: str,
+                       started: float, backlog: Callable[[], int]) -> bool:
+    """Stream the answer to messages as chunk events and record the turn
+
+    `started` is the perf_counter time the request arrived, for the time to
+    first token metric; `backlog` the bytes queued for the client. Returns
+    whether the whole answer was sent.
+    """
+    logger = logging.getLogger(__name__)
+    reply = []
+    # Batch tokens into fewer events so fast models do not flood the webview
+    trace = TokenTrace(f"request {session.request_id}")
+    coalescer = SSECoalescer(
+        response.write,
+        window=stream_coalesce_window,
+        max_bytes=stream_coalesce_max_bytes,
+        backlog=backlog
+    )
+    # Stream through the async LLM client so other requests keep being served
+    stream = agent.llm_client.stream_complete(messages, config=session.llm_config, session=session.session_id)
+    try:
+        logger.debug("Starting to stream response chunks")
+        with span("stream"):
+            async for chunk in stream:
+                text = chunk.response
+                if text:
+                    if not reply:
+                        metrics.CHAT_TTFT.observe(time.perf_counter() - started)
+                    reply.append(text)
+                    trace.token(text)
+                    await coalescer.add(text)
+            await coalescer.close()
+        logger.debug("Streamed %d chunks in %d events", coalescer.pieces, coalescer.events)
+
+        session.add_message("user", message)
+        session.add_message("assistant", "".join(reply))
+        await response.write(f"data: {json.dumps({'done': True})}\n\n".encode('utf-8'))
+        return True
+    except asyncio.CancelledError:
+        coalescer.discard()
+        raise
+    except Exception as e:
+        logger.error("Error processing stream: %s", e, exc_info=True)
+        try:
+            # Let the client keep the part of the answer it already has
+            await coalescer.close()
+        except Exception:
+            pass
+        error_data = json.dumps({"error": str(e)})
+        logger.debug("Sending error data: %s", error_data)
+        await response.write(f"data: {error_data}\n\n".encode('utf-8'))
+        return False
+    finally:
+        # Close the upstream stream now rather than whenever the generator is collected
+        await stream.aclose()
+
+async def handle_complete(request: web.Request) -> web.Response:
+    """POST /complete: an inline completion at the cursor, see complete_at_cursor"""
+    status, payload = await complete_at_cursor(await read_json(request), request.headers.get(CLIENT_HEADER))
+    return web.json_response(payload, status=status)
+
+async def complete_at_cursor(data: Dict[str, Any], client_id: Optional[str]) -> Tuple[int, Dict[str, Any]]:
+    """Answer one completion request, over HTTP or a multiplexed stream
+
+    The body is {"context": {...}} as for /chat, optionally with maxTokens
+    and requestId. The answer is {"completion": text}, or {"completion":
+    null, "superseded": true} when a newer request for the same document
+    arrived before this one was answered.
+    """
+    logger = logging.getLogger(__name__)
+    request_id = data.get('requestId')
+    if completion_agent is None:
+        # No waiting for start-up here: the next keystroke asks again
+        return 503, {"error": "LLM agent not initialized", "code": "starting", "requestId": request_id}
+    scheduler = completion_agent.llm_client.scheduler
+    if scheduler is not None and scheduler.saturated(Priority.COMPLETION):
+        metrics.COMPLETION_REQUESTS.inc(outcome="rejected")
+        metrics.SCHEDULER_REJECTED.inc(priority="completion")
+        return 503, {"error": "LLM service busy, retry shortly", "code": "busy", "requestId": request_id}
+
+    context = data.get('context', {})
+    code_context = build_code_context(context, workspaces.resolve(client_id).documents)
+    if code_context is None:
+        return 409, {"error": "Document out of sync, reopen it and retry", "code": "document_out_of_sync",
+                     "requestId": request_id}
+    # The content was validated when it was synced or built; do not copy it through validation again
+    request = CompletionRequest.model_construct(
+        **dict(code_context),
+        max_tokens=int(data.get('maxTokens') or completion_max_tokens)
+    )
+    # One completion in flight per document and window
+    key = f"{client_id or ''}|{context.get('uri') or code_context.file_path}"
+    try:
+        completion = await completion_agent.complete(request, key)
+    except AdmissionRejected as e:
+        return 503, {"error": str(e), "code": "busy", "requestId": request_id}
+    except Exception as e:
+        logger.error("Completion failed: %s", e, exc_info=True)
+        return 500, {"error": str(e), "requestId": request_id}
+    if completion is None:
+        return 200, {"completion": None, "superseded": True, "requestId": request_id}
+    return 200, {"completion": completion, "requestId": request_id}
+
+async def handle_cancel(request: web.Request) -> web.Response:
+    """Stop a streaming /chat answer by its request id"""
+    data = await read_json(request)
+    if not cancel_request(data.get('requestId', '')):
+        return web.json_response({"cancelled": False}, status=404)
+    return web.json_response({"cancelled": True})
+
+def cancel_request(request_id: str) -> bool:
+    """Stop the answer streaming for request_id, if there is one"""
+    task = active_requests.get(request_id)
+    if task is None:
+        return False
+    task.cancel()
+    logger.info("Cancel requested for %s", request_id)
+    return True
+
+async def handle_websocket(request: web.Request) -> web.WebSocketResponse:
+    """Chat and document sync streams multiplexed over one WebSocket, see MuxConnection
+
+    The client id comes from the X-Pydantic-Agent-Client header or the
+    clientId query parameter; ?window= sets the per-stream credit.
+    """
+    ws = web.WebSocketResponse(compress=False, heartbeat=30)
+    await ws.prepare(request)
+    client_id = request.headers.get(CLIENT_HEADER) or request.query.get('clientId')
+    connection = MuxConnection(
+        ws,
+        window=int(request.query.get('window', DEFAULT_WINDOW)),
+        backlog=lambda: request.transport.get_write_buffer_size() if request.transport else 0
+    )
+    metrics.MUX_CONNECTIONS.inc()
+    try:
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                frame = json.loads(msg.data)
+                stream_id, kind = frame['id'], frame['type']
+            except (ValueError, KeyError, TypeError) as e:
+                await ws.send_str(json.dumps({"id": None, "type": "end", "status": 400, "data": {"error": f"Invalid frame: {e}"}}))
+                continue
+            if kind == 'credit':
+                connection.grant(stream_id, int(frame.get('events', 0)))
+            elif kind == 'cancel':
+                connection.cancel(stream_id)
+            elif kind in DOCUMENT_OPERATIONS:
+                # Handled in order, so a chat frame sent after a change sees it
+                status, payload = DOCUMENT_OPERATIONS[kind](frame, workspaces.resolve(client_id).documents)
+                await ws.send_str(json.dumps({"id": stream_id, "type": "end", "status": status, "data": payload}))
+            elif kind == 'chat':
+                try:
+                    stream = connection.open(stream_id)
+                except ValueError as e:
+                    await ws.send_str(json.dumps({"id": stream_id, "type": "end", "status": 409, "data": {"error": str(e)}}))
+                    continue
+                request_id = frame.setdefault('requestId', str(uuid.uuid4()))
+                connection.start(stream_id, mux_chat(frame, client_id, stream),
+                                 cancel=lambda request_id=request_id: cancel_request(request_id))
+            elif kind == 'complete':
+                try:
+                    stream = connection.open(stream_id)
+                except ValueError as e:
+                    await ws.send_str(json.dumps({"id": stream_id, "type": "end", "status": 409, "data": {"error": str(e)}}))
+                    continue
+                connection.start(stream_id, mux_complete(frame, client_id, stream))
+            else:
+                await ws.send_str(json.dumps({"id": stream_id, "type": "end", "status": 400,
+                                              "data": {"error": f"Unknown frame type: {kind}"}}))
+    finally:
+        await connection.close()
+        metrics.MUX_CONNECTIONS.dec()
+    return ws
+
+async def mux_chat(body: Dict[str, Any], client_id: Optional[str], stream: MuxStream):
+    """Run a chat frame's request and end its stream with the outcome"""
+    async def read_body() -> Dict[str, Any]:
+        return body
+
+    async def open_stream() -> MuxStream:
+        return stream
+
+    profiled = profiler.start_request()
+    try:
+        try:
+            result = await run_chat(read_body, client_id, open_stream, stream.backlog)
+        except asyncio.CancelledError:
+            # Cancelled before the answer started; the client still waits for the end frame
+            await stream.end(200, {"cancelled": True})
+            raise
+        if result is stream:
+            await stream.end()
+        else:
+            await stream.end(result.status, json.loads(result.text))
+    finally:
+        if profiled:
+            profiler.end_request()
+
+async def mux_complete(body: Dict[str, Any], client_id: Optional[str], stream: MuxStream):
+    """Run a complete frame's request; the answer is the data of its end frame"""
+    try:
+        status, payload = await complete_at_cursor(body, client_id)
+    except asyncio.CancelledError:
+        await stream.end(200, {"completion": None, "cancelled": True})
+        raise
+    await stream.end(status, payload)
 
 async def test_llm_connection():
     """Test the LLM connection on startup"""
-    global agent, client
+    global agent
     logger = logging.getLogger(__name__)
     try:
-        if not agent or not client:
-            logger.error("LLM agent or client not initialized!")
+        if not agent:
+            logger.error("LLM agent not initialized!")
             return False
             
-        success = True
-        try:
-            models = client.models.list()
-            logger.debug(f"Successfully connected to API. Available models: {models}")
-        except Exception as e:
-            logger.error(f"Failed to list models: {str(e)}")
-            success = False
+        success = await agent.llm_client.warm_up()
+        logger.debug("Connection pool: %s", get_pool().stats())
         
         return success
     except Exception as e:
-        logger.error(f"Error during LLM connection test: {str(e)}")
+        logger.error("Error during LLM connection test: %s", e)
         return False
 
+async def warm_up_llm():
+    """Check the LLM service and open pooled connections, off the start-up path"""
+    readiness["status"] = "warming"
+    try:
+        models = await agent.llm_client.list_models()
+        logger.debug("Successfully connected to API. Available models: %s", models)
+        readiness.update(status="ready", error=None)
+        logger.info("LLM connection test successful!")
+        # Open connections to the other endpoints too
+        await test_llm_connection()
+    except Exception as e:
+        logger.error("LLM connection test failed: %s", e)
+        readiness.update(status="degraded", error=str(e))
+
 async def cleanup():
     """Cleanup resources on server shutdown"""
-    if 'agent' in globals():
+    if sessions:
+        await sessions.stop()
+    await workspaces.close()
+    if agent:
         await agent.cleanup()
+    await get_pool().close()
 
 async def health_check(request):
     """Health check endpoint"""
     return web.Response(text='OK')
 
-async def start_server():
-    app = web.Application()
+async def handle_ready(request: web.Request) -> web.Response:
+    """200 once the agent is up and the LLM service answered, else 503 with the start-up status"""
+    status = 200 if readiness["status"] == "ready" else 503
+    return web.json_response({**readiness, "agent": agent is not None}, status=status)
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Prometheus metrics in the text exposition format"""
+    return web.Response(text=metrics.render(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+@web.middleware
+async def profiling_middleware(request: web.Request, handler):
+    """Run the profiler over /chat requests while it is armed"""
+    if request.path != '/chat' or not profiler.start_request():
+        return await handler(request)
+    try:
+        return await handler(request)
+    finally:
+        profiler.end_request()
+
+async def handle_profile_start(request: web.Request) -> web.Response:
+    """Profile the next N /chat requests: POST {requests: N}"""
+    data = await read_json(request) if request.can_read_body else {}
+    try:
+        profiler.arm(int(data.get('requests', 1)))
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=409)
+    logger.info("Profiling the next %d chat requests", profiler.remaining)
+    return web.json_response({"armed": profiler.remaining})
+
+async def handle_profile_report(request: web.Request) -> web.Response:
+    """The cProfile report of the last profiled requests, waiting up to ?wait= seconds"""
+    report = await profiler.wait(float(request.query.get('wait', '0')))
+    if report is None:
+        if profiler.running:
+            return web.json_response({"remaining": profiler.remaining, "active": profiler.active}, status=202)
+        return web.json_response({"error": "No profile recorded, POST /admin/profile first"}, status=404)
+    return web.Response(text=report)
+
+async def handle_workspace_attach(request: web.Request) -> web.Response:
+    """Attach a window to a workspace, or renew its lease: {clientId, workspaceFolder}"""
+    data = await read_json(request)
+    client_id = data.get('clientId')
+    if not client_id:
+        return web.json_response({"error": "clientId is required"}, status=400)
+    workspace = workspaces.attach(client_id, data.get('workspaceFolder') or None)
+    return web.json_response({
+        "workspaceFolder": workspace.folder,
+        "clients": len(workspace.clients),
+        "lease": workspaces.lease
+    })
+
+async def handle_workspace_detach(request: web.Request) -> web.Response:
+    """Detach a window: {clientId}; its workspace is closed with the last window"""
+    data = await read_json(request)
+    detached = workspaces.detach(data.get('clientId', ''))
+    return web.json_response({"detached": detached, "clients": len(workspaces.clients)})
+
+async def watch_workspaces(interval: float = WORKSPACE_SWEEP_INTERVAL):
+    """Detach windows that stopped sending heartbeats; in daemon mode, exit once idle"""
+    while True:
+        await asyncio.sleep(interval)
+        expired = workspaces.expire()
+        if expired:
+            logger.info("Detached %d clients whose lease ran out", expired)
+        if daemon and workspaces.idle_since is not None and not active_requests:
+            idle = time.monotonic() - workspaces.idle_since
+            if idle >= daemon_idle_timeout:
+                logger.info("No clients for %.0fs, shutting down", idle)
+                shutdown_requested().set()
+                return
+
+async def retrieve_snippets(query: str, retrieval_index: Optional[BM25Index]) -> str:
+    """Top snippets for query from a workspace's retrieval index, formatted for the prompt"""
+    if not retrieval_index or not retrieval_index.ready:
+        return ""
+    loop = asyncio.get_running_loop()
+    snippets = await loop.run_in_executor(None, retrieval_index.search, query, RETRIEVAL_TOP_K)
+    parts = []
+    used = 0
+    for snippet in snippets:
+        block = f"{snippet.path} (lines {snippet.start_line}-{snippet.end_line}):\n```\n{snippet.text.rstrip()}\n```"
+        tokens = estimate_tokens(block)
+        if used + tokens > RETRIEVAL_MAX_TOKENS:
+            break
+        parts.append(block)
+        used += tokens
+    return "\n\n".join(parts)
+
+async def start_background_tasks(app: web.Application):
+    """Start periodic maintenance once the event loop is running"""
+    app['workspace_task'] = asyncio.create_task(watch_workspaces())
+
+async def stop_background_tasks(app: web.Application):
+    """Cancel the tasks started by start_background_tasks"""
+    task = app.get('workspace_task')
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def create_app() -> web.Application:
+    """Create the aiohttp application with all routes registered"""
+    app = web.Application(middlewares=[profiling_middleware])
     app.router.add_post('/chat', handle_message)
+    app.router.add_post('/cancel', handle_cancel)
+    app.router.add_post('/complete', handle_complete)
     app.router.add_get('/health', health_check)
+    app.router.add_get('/ready', handle_ready)
+    app.router.add_get('/metrics', handle_metrics)
+    app.router.add_post('/admin/profile', handle_profile_start)
+    app.router.add_get('/admin/profile', handle_profile_report)
+    app.router.add_post('/document/{operation:didOpen|didChange|didClose}', handle_document)
+    app.router.add_get('/ws', handle_websocket)
+    app.router.add_post('/workspace/attach', handle_workspace_attach)
+    app.router.add_post('/workspace/detach', handle_workspace_detach)
+    app.on_startup.append(start_background_tasks)
+    app.on_shutdown.append(stop_background_tasks)
     app.on_shutdown.append(lambda _: cleanup())
+    return app
+
+async def start_server():
+    app = create_app()
     
-    # Let the OS choose an available port
-    runner = web.AppRunner(app)
+    # Let the OS choose an available port; handlers are cancelled when their client disconnects
+    runner = web.AppRunner(app, handler_cancellation=True)
     await runner.setup()
     site = web.TCPSite(runner, 'localhost', 0)
     await site.start()
+    if unix_socket:
+        await start_unix_site(runner)
     
     # Get the port that was assigned and write it IMMEDIATELY
     port = site._server.sockets[0].getsockname()[1]
-    write_port_file(port)
-    logger.info(f"Server started on http://localhost:{port}")
-    
-    # Now do the LLM connection tests
-    logger.info("Testing LLM connection...")
-    await test_llm_connection()
-    logger.info("LLM connection test successful!")
+    if daemon:
+        write_daemon_file(port)
+    else:
+        write_port_file(port)
+    logger.info("Server started on http://localhost:%d", port)
     
     return runner, port
 
-async def main():
+async def start_unix_site(runner: web.AppRunner):
+    """Serve the app on the Unix domain socket too, for local clients; not available on Windows"""
+    global unix_socket
+    try:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)  # Left behind by a server that did not exit cleanly
+        await web.UnixSite(runner, unix_socket).start()
+        logger.info("Server also listening on %s", unix_socket)
+    except (NotImplementedError, OSError) as e:
+        logger.warning("Cannot listen on Unix socket %s: %s", unix_socket, e)
+        unix_socket = None
+
+async def main(settings_json: str):
+    runner = None
+    warm_up = None
     try:
+        if daemon:
+            running = await find_running_daemon()
+            if not running and not acquire_daemon_lock():
+                # Another window is starting one; the extension connects to it through the daemon file
+                logger.info("Another daemon is starting, exiting")
+                return
+            # The lock holder may have finished starting between the check and the lock
+            running = running or await find_running_daemon()
+            if running:
+                # Another window started one first; the extension reads its port from the daemon file
+                logger.info("Daemon already running on port %s (pid %s)", running['port'], running['pid'])
+                return
+        
+        # Listen first so the extension can connect while the agent is still being set up
         runner, port = await start_server()
+        if daemon:
+            # Advertised in the daemon file now; later starters find it there
+            release_daemon_lock()
         
-        # Keep the server running
-        while True:
-            await asyncio.sleep(1)
+        try:
+            await initialize_llm_agent(settings_json)
+        except Exception as e:
+            # Keep serving so /ready and /chat can report the problem
+            readiness.update(status="failed", error=str(e))
+        finally:
+            agent_initialized().set()
+        
+        # The connection check and pool warm-up happen in the background; /ready reports them
+        if agent:
+            sessions.start()
+            workspaces.default.start(SYMBOL_INDEX_REFRESH_INTERVAL)
+            logger.info("Testing LLM connection...")
+            warm_up = asyncio.create_task(warm_up_llm())
+        
+        # Keep the server running until the daemon goes idle
+        await shutdown_requested().wait()
     except Exception as e:
-        logger.error(f"Server error: {e}")
+        logger.error("Server error: %s", e)
         raise
     finally:
-        await runner.cleanup()
+        if warm_up:
+            warm_up.cancel()
+        if daemon:
+            release_daemon_lock()
+            remove_daemon_file()
+        if runner:
+            await runner.cleanup()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
 
 async def startup():
     """Startup function"""
+    global daemon, unix_socket, daemon_key
+    parser = argparse.ArgumentParser(description="Pydantic Agent chat server")
+    parser.add_argument('--daemon', action='store_true', default=os.getenv('PYDANTIC_AGENT_DAEMON') == '1',
+                        help="Serve every VS Code window that attaches, exit when idle")
+    parser.add_argument('--unix-socket', default=os.getenv('PYDANTIC_AGENT_UNIX_SOCKET') or None,
+                        help="Also serve on this Unix domain socket path")
+    args = parser.parse_args()
+    daemon = args.daemon
+    unix_socket = args.unix_socket
     try:
         settings_json = os.environ.get("VSCODE_SETTINGS", "{}")
-        logger.debug(f"VS Code settings received: {settings_json}")
+        logger.debug("VS Code settings received: %s", settings_json)
+        daemon_key = settings_key(settings_json)
         
-        await initialize_llm_agent(settings_json)
-        await main()
+        await main(settings_json)
     except Exception as e:
-        logger.error(f"Startup error: {e}")
+        logger.error("Startup error: %s", e)
         raise
 
 if __name__ == "__main__":
     try:
         asyncio.run(startup())
     except Exception as e:
-        logger.error(f"Failed to start server: {str(e)}", exc_info=True)
+        logger.error("Failed to start server: %s", e, exc_info=True)
@@ -0,0 +1,167 @@
+import * as crypto from 'crypto';
+import { WebSocket } from 'ws';
+import { getVersionString } from './version';
+
+/** Identifies this window to the server, which may be shared with other windows */
+export const CLIENT_HEADER = 'X-Pydantic-Agent-Client';
+export const clientId: string = crypto.randomUUID();
+
+/** Events the server may send on a stream before it waits for credit, as in the server's DEFAULT_WINDOW */
+const STREAM_WINDOW = 64;
+
+/** Request headers with this window's client id added */
+export function serverHeaders(headers: Record<string, string> = {}): Record<string, string> {
+    return { ...headers, [CLIENT_HEADER]: clientId };
+}
+
+/** The end frame of a request: its status and the error, document sync or completion answer, if any */
+export interface ServerResult {
+    status: number;
+    data?: any;
+}
+
+interface PendingRequest {
+    onEvent?: (data: any) => void;
+    resolve: (result: ServerResult) => void;
+    reject: (error: Error) => void;
+    // Events received since credit was last granted
+    unacknowledged: number;
+}
+
+/**
+ * Chat, completion and document sync requests multiplexed over one
+ * WebSocket to the server's /ws (protocol in pydantic_agent/multiplex.py).
+ * The address is a ws:// URL, or ws+unix:PATH:/ws for the server's Unix
+ * socket; it is read again for every connection, so a restarted server is
+ * found. Requests still open when the connection drops fail.
+ */
+export class ServerConnection {
+    private socket?: WebSocket;
+    private connecting?: Promise<WebSocket>;
+    private nextId = 1;
+    private readonly requests = new Map<number, PendingRequest>();
+
+    constructor(private readonly getAddress: () => Promise<string>) {}
+
+    /**
+     * Send a request frame and resolve with its end frame. Chat events are
+     * passed to onEvent as they arrive; aborting the signal sends a cancel
+     * frame and rejects with an AbortError, like fetch.
+     */
+    public async request(
+        type: string,
+        body: object,
+        onEvent?: (data: any) => void,
+        signal?: AbortSignal
+    ): Promise<ServerResult> {
+        if (signal?.aborted) {
+            throw abortError();
+        }
+        const socket = await this.connect();
+        const id = this.nextId++;
+        return new Promise<ServerResult>((resolve, reject) => {
+            const finish = () => signal?.removeEventListener('abort', abort);
+            const abort = () => {
+                if (this.requests.delete(id)) {
+                    this.send(socket, { type: 'cancel', id });
+                }
+                finish();
+                reject(abortError());
+            };
+            this.requests.set(id, {
+                onEvent,
+                resolve: result => { finish(); resolve(result); },
+                reject: error => { finish(); reject(error); },
+                unacknowledged: 0
+            });
+            signal?.addEventListener('abort', abort);
+            if (!this.send(socket, { ...body, type, id })) {
+                this.requests.get(id)?.reject(new Error('Connection to the server closed'));
+                this.requests.delete(id);
+            }
+        });
+    }
+
+    private connect(): Promise<WebSocket> {
+        if (!this.connecting) {
+            this.connecting = this.open().catch(error => {
+                this.connecting = undefined;
+                throw error;
+            });
+        }
+        return this.connecting;
+    }
+
+    private async open(): Promise<WebSocket> {
+        const address = await this.getAddress();
+        const socket = new WebSocket(`${address}?window=${STREAM_WINDOW}`, {
+            headers: serverHeaders(),
+            perMessageDeflate: false
+        });
+        await new Promise<void>((resolve, reject) => {
+            socket.once('open', () => resolve());
+            socket.once('error', reject);
+        });
+        this.socket = socket;
+        socket.on('message', data => this.receive(socket, data.toString()));
+        socket.on('error', error => console.error(`[${getVersionString()}] Server connection error:`, error));
+        socket.on('close', () => this.closed(socket));
+        return socket;
+    }
+
+    private receive(socket: WebSocket, message: string) {
+        let frame: any;
+        try {
+            frame = JSON.parse(message);
+        } catch (error) {
+            console.error(`[${getVersionString()}] Invalid frame from server:`, error);
+            return;
+        }
+        const request = this.requests.get(frame.id);
+        if (!request) {
+            return;  // Cancelled here already
+        }
+        if (frame.type === 'event') {
+            request.onEvent?.(frame.data);
+            // Grant more credit once half the window is used, so the stream does not stall
+            if (++request.unacknowledged >= STREAM_WINDOW / 2) {
+                this.send(socket, { type: 'credit', id: frame.id, events: request.unacknowledged });
+                request.unacknowledged = 0;
+            }
+        } else if (frame.type === 'end') {
+            this.requests.delete(frame.id);
+            request.resolve({ status: frame.status, data: frame.data });
+        }
+    }
+
+    private send(socket: WebSocket, frame: object): boolean {
+        if (socket.readyState !== WebSocket.OPEN) {
+            return false;
+        }
+        socket.send(JSON.stringify(frame));
+        return true;
+    }
+
+    private closed(socket: WebSocket) {
+        if (this.socket !== socket) {
+            return;
+        }
+        this.socket = undefined;
+        this.connecting = undefined;
+        const requests = [...this.requests.values()];
+        this.requests.clear();
+        for (const request of requests) {
+            request.reject(new Error('Connection to the server closed'));
+        }
+    }
+
+    public dispose() {
+        this.socket?.close();
+    }
+}
+
+function abortError(): Error {
+    const error = new Error('Request cancelled');
+    error.name = 'AbortError';
+    return error;
+}